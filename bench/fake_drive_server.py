@@ -0,0 +1,588 @@
+# Local stand-in for the part of Drive API v2 used by uploader:
+# files insert (metadata, multipart and resumable upload), get,
+# list with queries built by jobs ('<id>' in parents, title,
+# mimeType, trashed joined by and/or) and batch requests of these
+# calls. Files are kept in memory, only their size and md5 are stored.
+#
+# Every request is delayed by --latency-ms, upload bodies share
+# --bandwidth-mbps, --quota-per-sec calls per second are allowed
+# (above it 403 userRateLimitExceeded) and --error-rate of calls
+# fail with one of --error-status codes. Calls in batch request
+# count against quota and fail one by one, as in Drive API.
+#
+#   python fake_drive_server.py --port 8089 --latency-ms 50
+#
+# connect_drive(url) returns pydrive GoogleDrive using the server.
+import argparse
+import hashlib
+import itertools
+import json
+import random
+import re
+import threading
+import time
+from datetime import datetime
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+
+
+FOLDER_MIME_TYPE = 'application/vnd.google-apps.folder'
+ROOT_ID = 'root'
+
+
+class FakeDriveConfig:
+
+    def __init__(self, latency: float = 0.0, bandwidth: float = 0.0,
+                 quota_per_sec: float = 0.0, error_rate: float = 0.0,
+                 error_status=(500, 503, 429), page_size: int = 100,
+                 seed=None):
+        self.latency        = latency       # seconds per request
+        self.bandwidth      = bandwidth     # upload bytes/s, 0 unlimited
+        self.quota_per_sec  = quota_per_sec # requests/s, 0 unlimited
+        self.error_rate     = error_rate    # part of failed requests
+        self.error_status   = tuple(error_status)
+        self.page_size      = page_size     # default list page size
+        self.random         = random.Random(seed)
+
+
+# Upload bodies of all connections share one link.
+class _Link:
+
+    def __init__(self, bandwidth):
+        self._bandwidth = bandwidth
+        self._lock      = threading.Lock()
+        self._free_at   = 0.0
+
+    def transfer(self, size):
+        if self._bandwidth <= 0 or size <= 0:
+            return
+        with self._lock:
+            start = max(time.monotonic(), self._free_at)
+            self._free_at = start + size / self._bandwidth
+            done_at = self._free_at
+        time.sleep(max(0.0, done_at - time.monotonic()))
+
+
+# Requests allowed in current second, like Drive per user quota.
+class _Quota:
+
+    def __init__(self, per_sec):
+        self._per_sec   = per_sec
+        self._lock      = threading.Lock()
+        self._second    = 0
+        self._used      = 0
+
+    def take(self) -> bool:
+        if self._per_sec <= 0:
+            return True
+        with self._lock:
+            second = int(time.monotonic())
+            if second != self._second:
+                self._second = second
+                self._used = 0
+            self._used += 1
+            return self._used <= self._per_sec
+
+
+class FakeDrive:
+
+    def __init__(self, config: FakeDriveConfig):
+        self.config     = config
+        self._lock      = threading.Lock()
+        self._ids       = itertools.count(1)
+        self._files     = {}    # {id: resource}
+        self._sessions  = {}    # {upload_id: [metadata, md5, received]}
+        self._stats     = {}    # {request kind: count}
+        self._bytes     = 0
+        self._link      = _Link(config.bandwidth)
+        self._quota     = _Quota(config.quota_per_sec)
+
+    # -> {'requests': {kind: count}, 'bytes': uploaded, 'files': n}
+    def stats(self) -> dict:
+        with self._lock:
+            return {'requests': dict(self._stats),
+                    'bytes': self._bytes,
+                    'files': len(self._files)}
+
+    def reset_stats(self):
+        with self._lock:
+            self._stats = {}
+            self._bytes = 0
+
+    def count(self, kind):
+        with self._lock:
+            self._stats[kind] = self._stats.get(kind, 0) + 1
+
+    def received(self, size):
+        self._link.transfer(size)
+        with self._lock:
+            self._bytes += size
+
+    def take_quota(self):
+        return self._quota.take()
+
+    def insert(self, metadata, size=0, md5=None):
+        now = datetime.utcnow().isoformat() + 'Z'
+        with self._lock:
+            file_id = 'f{}'.format(next(self._ids))
+            parents = metadata.get('parents') or [{'id': ROOT_ID}]
+            resource = {
+                'kind'          : 'drive#file',
+                'id'            : file_id,
+                'title'         : metadata.get('title', 'Untitled'),
+                'mimeType'      : metadata.get('mimeType',
+                                               'application/octet-stream'),
+                'parents'       : [{'kind': 'drive#parentReference',
+                                    'id': p['id'],
+                                    'isRoot': p['id'] == ROOT_ID}
+                                   for p in parents],
+                'labels'        : {'trashed': False},
+                'createdDate'   : now,
+                'modifiedDate'  : now}
+            if resource['mimeType'] != FOLDER_MIME_TYPE:
+                resource['fileSize'] = str(size)
+                resource['md5Checksum'] = md5 or hashlib.md5().hexdigest()
+            self._files[file_id] = resource
+            return dict(resource)
+
+    def get(self, file_id):
+        with self._lock:
+            resource = self._files.get(file_id)
+            return None if resource is None else dict(resource)
+
+    def list(self, query):
+        match = parse_query(query or 'trashed=false')
+        with self._lock:
+            return [dict(f) for f in self._files.values() if match(f)]
+
+    def start_session(self, metadata):
+        upload_id = 'u{}'.format(next(self._ids))
+        with self._lock:
+            self._sessions[upload_id] = [metadata, hashlib.md5(), 0]
+        return upload_id
+
+    # -> (committed bytes, resource when upload finished)
+    def put_chunk(self, upload_id, start, data, total):
+        with self._lock:
+            session = self._sessions.get(upload_id)
+            if session is None:
+                raise KeyError(upload_id)
+            metadata, md5, received = session
+            if data is not None and start == received:
+                md5.update(data)
+                session[2] = received = received + len(data)
+            if total is None or received < total:
+                return received, None
+            del self._sessions[upload_id]
+        return received, self.insert(metadata, received, md5.hexdigest())
+
+
+# Query of Drive API v2 as predicate over file resource, supports
+# 'X' in parents, title, mimeType (= and !=), trashed, and, or, not
+# and parentheses.
+_TOKEN = re.compile(r"\s*(?:(\()|(\))|('(?:[^'\\]|\\.)*')|(!=|=)|(\w+))")
+
+
+def parse_query(query):
+    tokens = _tokenize(query)
+    predicate, position = _parse_or(tokens, 0)
+    if position != len(tokens):
+        raise ValueError('Unexpected {} in query'.format(tokens[position]))
+    return predicate
+
+
+def _tokenize(query):
+    tokens = []
+    position = 0
+    query = query.strip()
+    while position < len(query):
+        match = _TOKEN.match(query, position)
+        if match is None:
+            raise ValueError('Invalid query {}'.format(query))
+        position = match.end()
+        opened, closed, string, operator, word = match.groups()
+        if string is not None:
+            tokens.append(('str', re.sub(r'\\(.)', r'\1', string[1:-1])))
+        else:
+            tokens.append(('op', opened or closed or operator or word))
+    return tokens
+
+
+def _parse_or(tokens, position):
+    left, position = _parse_and(tokens, position)
+    while _is_op(tokens, position, 'or'):
+        right, position = _parse_and(tokens, position + 1)
+        left = (lambda a, b: lambda f: a(f) or b(f))(left, right)
+    return left, position
+
+
+def _parse_and(tokens, position):
+    left, position = _parse_term(tokens, position)
+    while _is_op(tokens, position, 'and'):
+        right, position = _parse_term(tokens, position + 1)
+        left = (lambda a, b: lambda f: a(f) and b(f))(left, right)
+    return left, position
+
+
+def _parse_term(tokens, position):
+    if _is_op(tokens, position, 'not'):
+        term, position = _parse_term(tokens, position + 1)
+        return (lambda f: not term(f)), position
+    if _is_op(tokens, position, '('):
+        term, position = _parse_or(tokens, position + 1)
+        if not _is_op(tokens, position, ')'):
+            raise ValueError('Missing ) in query')
+        return term, position + 1
+    if tokens[position][0] == 'str':
+        value = tokens[position][1]
+        if not (_is_op(tokens, position + 1, 'in') and
+                _is_op(tokens, position + 2, 'parents')):
+            raise ValueError('Unsupported query term')
+        return (lambda f: any(p['id'] == value for p in f['parents']),
+                position + 3)
+    field = tokens[position][1]
+    operator = tokens[position + 1][1]
+    kind, value = tokens[position + 2]
+    if field == 'trashed':
+        value = value == 'true'
+        get = lambda f: f['labels']['trashed']
+    elif field in ['title', 'mimeType'] and kind == 'str':
+        get = lambda f: f[field]
+    else:
+        raise ValueError('Unsupported query field {}'.format(field))
+    if operator == '=':
+        return (lambda f: get(f) == value), position + 3
+    if operator == '!=':
+        return (lambda f: get(f) != value), position + 3
+    raise ValueError('Unsupported operator {}'.format(operator))
+
+
+def _is_op(tokens, position, value):
+    return (position < len(tokens) and tokens[position][0] == 'op' and
+            tokens[position][1] == value)
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    @property
+    def drive(self) -> FakeDrive:
+        return self.server.drive
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def do_PUT(self):
+        self._handle('PUT')
+
+    def _handle(self, method):
+        self._captured = None
+        url = urlsplit(self.path)
+        body = self._read_body()
+        if url.path == '/_stats':
+            return self._send_json(200, self.drive.stats())
+        if self.drive.config.latency > 0:
+            time.sleep(self.drive.config.latency)
+        if url.path == '/batch/drive/v2' and method == 'POST':
+            return self._batch(body)
+        self._call(method, url, body)
+
+    def _call(self, method, url, body):
+        path = url.path
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+        config = self.drive.config
+        if not self.drive.take_quota():
+            self.drive.count('rate_limited')
+            return self._send_error(403, 'userRateLimitExceeded')
+        if config.error_rate > 0 and \
+           config.random.random() < config.error_rate:
+            status = config.random.choice(config.error_status)
+            self.drive.count('injected_error')
+            reason = 'rateLimitExceeded' if status == 429 else 'backendError'
+            return self._send_error(status, reason)
+        try:
+            self._route(method, path, params, body)
+        except ValueError as e:
+            self._send_error(400, 'invalid', str(e))
+
+    def _route(self, method, path, params, body):
+        upload = path in ['/upload/drive/v2/files',
+                          '/resumable/upload/drive/v2/files']
+        if upload and method == 'POST':
+            upload_type = params.get('uploadType')
+            if upload_type == 'resumable':
+                return self._start_resumable(body)
+            if upload_type == 'multipart':
+                return self._multipart(body)
+            return self._simple(params, body)
+        if upload and method == 'PUT' and 'upload_id' in params:
+            return self._put_chunk(params['upload_id'], body)
+        if path == '/drive/v2/files' and method == 'POST':
+            self.drive.count('insert')
+            return self._send_json(200, self.drive.insert(_json(body)))
+        if path == '/drive/v2/files' and method == 'GET':
+            return self._list(params)
+        if path.startswith('/drive/v2/files/') and method == 'GET':
+            self.drive.count('get')
+            resource = self.drive.get(path[len('/drive/v2/files/'):])
+            if resource is None:
+                return self._send_error(404, 'notFound')
+            return self._send_json(200, resource)
+        self._send_error(404, 'notFound', path)
+
+    # multipart/mixed of application/http parts, every part is routed
+    # as separate call, its response is captured instead of sent
+    def _batch(self, body):
+        self.drive.count('batch')
+        content_type = self.headers['Content-Type']
+        message = BytesParser(policy=HTTP).parsebytes(
+            b'Content-Type: ' + content_type.encode() + b'\r\n\r\n' + body)
+        outer_headers = self.headers
+        boundary = 'batch_{}'.format(next(_boundaries))
+        content = b''
+        try:
+            for part in message.iter_parts():
+                request = part.get_payload(decode=True)
+                request_line, _, request = request.partition(b'\n')
+                method, target, _ = request_line.decode().split(' ', 2)
+                inner = BytesParser(policy=HTTP).parsebytes(request)
+                self.headers = inner
+                self._captured = []
+                self._call(method, urlsplit(target),
+                           inner.get_payload(decode=True) or b'')
+                status, headers, data = self._captured[0]
+                content += ('--{}\r\nContent-Type: application/http\r\n'
+                            'Content-ID: <response-{}>\r\n\r\n'
+                            'HTTP/1.1 {} {}\r\n'.format(
+                            boundary, part['Content-ID'].strip('<>'),
+                            status, _reason(status))).encode()
+                for key, value in headers.items():
+                    content += '{}: {}\r\n'.format(key, value).encode()
+                content += 'Content-Length: {}\r\n\r\n'.format(
+                           len(data)).encode() + data + b'\r\n'
+        finally:
+            self.headers = outer_headers
+            self._captured = None
+        content += '--{}--\r\n'.format(boundary).encode()
+        self._send(200, content, {'Content-Type':
+                   'multipart/mixed; boundary={}'.format(boundary)})
+
+    def _list(self, params):
+        self.drive.count('list')
+        items = self.drive.list(params.get('q'))
+        items.sort(key=lambda f: f['id'])
+        start = int(params.get('pageToken', 0))
+        size = int(params.get('maxResults', self.drive.config.page_size))
+        result = {'kind': 'drive#fileList', 'items': items[start:start + size]}
+        if start + size < len(items):
+            result['nextPageToken'] = str(start + size)
+        self._send_json(200, result)
+
+    def _simple(self, params, body):
+        self.drive.count('upload_simple')
+        self.drive.received(len(body))
+        metadata = {'title': params.get('title', 'Untitled')}
+        self._send_json(200, self.drive.insert(
+                                metadata, len(body),
+                                hashlib.md5(body).hexdigest()))
+
+    def _multipart(self, body):
+        self.drive.count('upload_multipart')
+        message = BytesParser(policy=HTTP).parsebytes(
+            b'Content-Type: ' + self.headers['Content-Type'].encode() +
+            b'\r\n\r\n' + body)
+        parts = list(message.iter_parts())
+        if len(parts) != 2:
+            raise ValueError('multipart upload needs metadata and media')
+        metadata = json.loads(parts[0].get_payload(decode=True) or b'{}')
+        content = parts[1].get_payload(decode=True) or b''
+        self.drive.received(len(content))
+        self._send_json(200, self.drive.insert(
+                                metadata, len(content),
+                                hashlib.md5(content).hexdigest()))
+
+    def _start_resumable(self, body):
+        self.drive.count('upload_start')
+        upload_id = self.drive.start_session(_json(body))
+        host = self.headers.get('Host')
+        location = 'http://{}/upload/drive/v2/files?uploadType=resumable' \
+                   '&upload_id={}'.format(host, upload_id)
+        self._send(200, b'', {'Location': location})
+
+    # Content-Range: bytes first-last/total, bytes */total (query)
+    # or bytes first-last/* (size not known yet)
+    def _put_chunk(self, upload_id, body):
+        self.drive.count('upload_chunk')
+        start, total = 0, None
+        content_range = self.headers.get('Content-Range')
+        data = body
+        if content_range is not None:
+            match = re.match(r'bytes (\*|(\d+)-(\d+))/(\*|\d+)',
+                             content_range)
+            if match is None:
+                raise ValueError('Invalid Content-Range')
+            if match.group(1) == '*':
+                data = None
+            else:
+                start = int(match.group(2))
+            if match.group(4) != '*':
+                total = int(match.group(4))
+        else:
+            total = len(body)
+        if data is not None:
+            self.drive.received(len(data))
+        try:
+            received, resource = self.drive.put_chunk(upload_id, start,
+                                                      data, total)
+        except KeyError:
+            return self._send_error(404, 'notFound', 'upload session')
+        if resource is not None:
+            return self._send_json(200, resource)
+        headers = {}
+        if received > 0:
+            headers['Range'] = 'bytes=0-{}'.format(received - 1)
+        self._send(308, b'', headers)
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if length == 0:
+            return b''
+        return self.rfile.read(length)
+
+    def _send_error(self, status, reason, message=None):
+        self._send_json(status, {'error': {
+            'errors': [{'domain': 'usageLimits' if 'Limit' in reason
+                                  else 'global',
+                        'reason': reason,
+                        'message': message or reason}],
+            'code': status,
+            'message': message or reason}})
+
+    def _send_json(self, status, data):
+        self._send(status, json.dumps(data).encode('utf-8'),
+                   {'Content-Type': 'application/json; charset=UTF-8'})
+
+    def _send(self, status, content, headers):
+        if self._captured is not None:
+            self._captured.append((status, headers, content))
+            return
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+
+_boundaries = itertools.count(1)
+
+
+def _reason(status):
+    return BaseHTTPRequestHandler.responses.get(status, ('',))[0]
+
+
+def _json(body):
+    if len(body) == 0:
+        return {}
+    return json.loads(body.decode('utf-8'))
+
+
+class FakeDriveServer(ThreadingHTTPServer):
+
+    daemon_threads = True
+
+    def __init__(self, config: FakeDriveConfig = None,
+                 host: str = '127.0.0.1', port: int = 0):
+        super().__init__((host, port), _Handler)
+        self.drive      = FakeDrive(config or FakeDriveConfig())
+        self._thread    = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return 'http://{}:{}/'.format(host, port)
+
+    def start(self):
+        self._thread = threading.Thread(name='FakeDriveServer',
+                                        target=self.serve_forever,
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        if self._thread is not None:
+            self._thread.join(timeout=5.0)
+
+
+# Authorization of real GoogleAuth is replaced by plain Http,
+# Drive service is built from bundled discovery document
+# with root url of fake server.
+class _FakeAuth:
+
+    def __init__(self, url):
+        import httplib2
+        from googleapiclient.discovery import build_from_document
+        from googleapiclient.discovery_cache import get_static_doc
+        self._httplib2          = httplib2
+        self.access_token_expired = False
+        self.credentials        = None
+        self.http               = self.Get_Http_Object()
+        document = json.loads(get_static_doc('drive', 'v2'))
+        document['rootUrl'] = url
+        document['baseUrl'] = url + document['servicePath']
+        self.service = build_from_document(document, http=self.http)
+
+    def Get_Http_Object(self):
+        return self._httplib2.Http()
+
+    def Authorize(self):
+        pass
+
+    def Refresh(self):
+        pass
+
+
+def connect_drive(url: str):
+    from pydrive.drive import GoogleDrive
+    return GoogleDrive(_FakeAuth(url))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fake Drive API v2 server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--latency-ms', type=float, default=0.0)
+    parser.add_argument('--bandwidth-mbps', type=float, default=0.0)
+    parser.add_argument('--quota-per-sec', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--error-status', type=int, nargs='+',
+                        default=[500, 503, 429])
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+    config = FakeDriveConfig(latency=args.latency_ms / 1000.0,
+                             bandwidth=args.bandwidth_mbps * 1e6 / 8,
+                             quota_per_sec=args.quota_per_sec,
+                             error_rate=args.error_rate,
+                             error_status=args.error_status,
+                             seed=args.seed)
+    server = FakeDriveServer(config, args.host, args.port)
+    print('fake Drive API at {}drive/v2/'.format(server.url))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+
+
+if __name__ == '__main__':
+    main()
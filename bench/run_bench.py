@@ -0,0 +1,276 @@
+# End to end upload benchmark. Synthetic job trees are uploaded by
+# FilesUploadJob (--mode job) or UploadsSupervisor (--mode supervisor)
+# to local fake Drive server (fake_drive_server.py) with injected
+# latency, reported are files/s, MB/s, API calls per file and peak
+# RSS. Every scenario runs in own process, so its peak RSS is not
+# mixed with others. Results are written as JSON to --output, so
+# runs of different versions can be compared.
+#
+# Scenarios (sizes of --full run in brackets):
+#   photos  2000 x 50 KB in 100 file dirs   (10000 x 50 KB)
+#   videos  4 x 64 MB                       (20 x 2 GB)
+#   deep    nested dirs depth 6, width 3,   (depth 7, width 4)
+#           2 x 10 KB files per dir
+#   empty   2000 x 0 B in 20 file dirs      (10000 x 0 B)
+#
+# --batch-calls N sends metadata only calls (folders, empty files)
+# in batch requests of N calls. Supervisor runs with its default
+# request governor settings unless --govern-requests or
+# --max-requests-per-sec are given.
+#
+#   python run_bench.py --latency-ms 20 --output results.json
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from fake_drive_server import FakeDriveServer, FakeDriveConfig, connect_drive
+
+
+KB = 1024
+MB = 1024 * KB
+GB = 1024 * MB
+
+SCENARIOS = {
+    'photos': {'quick': dict(files=2000, size=50 * KB, per_dir=100),
+               'full' : dict(files=10000, size=50 * KB, per_dir=100)},
+    'videos': {'quick': dict(files=4, size=64 * MB, per_dir=20),
+               'full' : dict(files=20, size=2 * GB, per_dir=20)},
+    'deep'  : {'quick': dict(depth=6, width=3, per_dir=2, size=10 * KB),
+               'full' : dict(depth=7, width=4, per_dir=2, size=10 * KB)},
+    'empty' : {'quick': dict(files=2000, size=0, per_dir=20),
+               'full' : dict(files=10000, size=0, per_dir=20)}}
+
+
+def write_file(path, size, block):
+    with open(path, 'wb') as f:
+        # first bytes differ, so files have different md5
+        f.write(os.urandom(min(size, 16)))
+        left = size - min(size, 16)
+        while left > 0:
+            f.write(block[:min(left, len(block))])
+            left -= min(left, len(block))
+
+
+def create_flat(root, files, size, per_dir, block):
+    for i in range(files):
+        dir_path = os.path.join(root, 'dir{:04d}'.format(i // per_dir))
+        if i % per_dir == 0:
+            os.makedirs(dir_path)
+        write_file(os.path.join(dir_path, 'file{:05d}.jpg'.format(i)),
+                   size, block)
+    return files, files * size
+
+
+def create_deep(root, depth, width, per_dir, size, block):
+    files = 0
+    for i in range(per_dir):
+        write_file(os.path.join(root, 'file{}.txt'.format(i)), size, block)
+        files += 1
+    if depth > 0:
+        for i in range(width):
+            dir_path = os.path.join(root, 'level{}_{}'.format(depth, i))
+            os.mkdir(dir_path)
+            files += create_deep(dir_path, depth - 1, width, per_dir,
+                                 size, block)[0]
+    return files, files * size
+
+
+# -> (files, bytes) of job created in jobs_path/job_name
+def create_job(jobs_path, job_name, scenario, params):
+    job_path = os.path.join(jobs_path, job_name)
+    data_path = os.path.join(job_path, 'data')
+    os.makedirs(data_path)
+    open(os.path.join(job_path, '.lock'), 'w').close()
+    block = os.urandom(MB)
+    if scenario == 'deep':
+        return create_deep(data_path, block=block, **params)
+    return create_flat(data_path, block=block, **params)
+
+
+def run_job(drive, jobs_path, job_name, args):
+    from files_upload_job import FilesUploadJob
+    released = []
+    job = FilesUploadJob(drive, job_name, os.path.join(jobs_path, job_name),
+                         'bench/' + job_name,
+                         lambda command, data: released.append(command),
+                         upload_workers=args.upload_workers,
+                         batch_calls=args.batch_calls)
+    job._run_impl()
+    return released
+
+
+def run_supervisor(drive, jobs_path, args):
+    from uploads_supervisor import UploadsSupervisor
+    governor = {}
+    if args.govern_requests is not None:
+        governor['govern_requests'] = args.govern_requests == 'on'
+    if args.max_requests_per_sec is not None:
+        governor['max_requests_per_sec'] = args.max_requests_per_sec
+    supervisor = UploadsSupervisor(lambda: drive, jobs_path, 'bench',
+                                   upload_workers=args.upload_workers,
+                                   max_jobs=args.jobs,
+                                   max_uploads=args.upload_workers * args.jobs,
+                                   watch_jobs=False,
+                                   metadata_batch_calls=args.batch_calls,
+                                   **governor)
+    supervisor.start()
+    try:
+        while any(not n.startswith('.') for n in os.listdir(jobs_path)):
+            time.sleep(0.05)
+    finally:
+        supervisor.stop()
+
+
+def run_scenario(scenario, args):
+    params = SCENARIOS[scenario]['full' if args.full else 'quick']
+    work_path = tempfile.mkdtemp(prefix='upload_bench_')
+    jobs_path = os.path.join(work_path, 'jobs')
+    os.makedirs(jobs_path)
+    config = FakeDriveConfig(latency=args.latency_ms / 1000.0,
+                             bandwidth=args.bandwidth_mbps * 1e6 / 8,
+                             quota_per_sec=args.quota_per_sec,
+                             error_rate=args.error_rate,
+                             seed=1)
+    server = FakeDriveServer(config)
+    server.start()
+    try:
+        files, size = 0, 0
+        job_names = ['job{}'.format(i) for i in range(args.jobs)]
+        for job_name in job_names:
+            job_files, job_size = create_job(jobs_path, job_name,
+                                             scenario, params)
+            files += job_files
+            size += job_size
+        drive = connect_drive(server.url)
+        started = time.monotonic()
+        if args.mode == 'job':
+            for job_name in job_names:
+                run_job(drive, jobs_path, job_name, args)
+        else:
+            run_supervisor(drive, jobs_path, args)
+        elapsed = time.monotonic() - started
+        stats = server.drive.stats()
+    finally:
+        server.stop()
+        shutil.rmtree(work_path, ignore_errors=True)
+    calls = sum(stats['requests'].values())
+    return {
+        'scenario'          : scenario,
+        'mode'              : args.mode,
+        'govern_requests'   : args.govern_requests or 'default',
+        'max_requests_per_sec': (args.max_requests_per_sec
+                                 if args.max_requests_per_sec is not None
+                                 else 'default'),
+        'jobs'              : args.jobs,
+        'files'             : files,
+        'bytes'             : size,
+        'seconds'           : round(elapsed, 3),
+        'files_per_sec'     : round(files / elapsed, 2),
+        'mb_per_sec'        : round(size / MB / elapsed, 2),
+        'api_calls'         : calls,
+        'api_calls_per_file': round(calls / max(1, files), 3),
+        'requests'          : stats['requests'],
+        'uploaded_bytes'    : stats['bytes'],
+        'remote_files'      : stats['files'],
+        'peak_rss_kb'       : resource.getrusage(
+                                resource.RUSAGE_SELF).ru_maxrss}
+
+
+def child_command(scenario, args):
+    command = [sys.executable, os.path.abspath(__file__),
+               '--child', scenario,
+               '--mode', args.mode,
+               '--jobs', str(args.jobs),
+               '--upload-workers', str(args.upload_workers),
+               '--latency-ms', str(args.latency_ms),
+               '--bandwidth-mbps', str(args.bandwidth_mbps),
+               '--quota-per-sec', str(args.quota_per_sec),
+               '--error-rate', str(args.error_rate),
+               '--batch-calls', str(args.batch_calls)]
+    if args.govern_requests is not None:
+        command += ['--govern-requests', args.govern_requests]
+    if args.max_requests_per_sec is not None:
+        command += ['--max-requests-per-sec', str(args.max_requests_per_sec)]
+    if args.full:
+        command.append('--full')
+    return command
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+                    ['git', 'rev-parse', '--short', 'HEAD'],
+                    cwd=os.path.dirname(os.path.abspath(__file__)),
+                    stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Upload benchmark')
+    parser.add_argument('--scenario', nargs='+', choices=sorted(SCENARIOS),
+                        default=sorted(SCENARIOS))
+    parser.add_argument('--mode', choices=['job', 'supervisor'],
+                        default='supervisor')
+    parser.add_argument('--jobs', type=int, default=1)
+    parser.add_argument('--upload-workers', type=int, default=8)
+    parser.add_argument('--latency-ms', type=float, default=20.0)
+    parser.add_argument('--bandwidth-mbps', type=float, default=0.0)
+    parser.add_argument('--quota-per-sec', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--batch-calls', type=int, default=0)
+    parser.add_argument('--govern-requests', choices=['on', 'off'],
+                        default=None,
+                        help='request governor of supervisor '
+                             '(default: supervisor default)')
+    parser.add_argument('--max-requests-per-sec', type=float, default=None,
+                        help='cap of governed request rate, 0 no cap '
+                             '(default: supervisor default)')
+    parser.add_argument('--full', action='store_true',
+                        help='sizes of full benchmark (needs ~45 GB)')
+    parser.add_argument('--output', default='bench_results.json')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child is not None:
+        print(json.dumps(run_scenario(args.child, args)))
+        return
+
+    results = []
+    print('{:<8} {:<10} {:>7} {:>9} {:>9} {:>9} {:>10} {:>10}'.format(
+          'scenario', 'mode', 'files', 'seconds', 'files/s', 'MB/s',
+          'calls/file', 'rss MB'))
+    for scenario in args.scenario:
+        output = subprocess.check_output(child_command(scenario, args))
+        result = json.loads(output.decode().strip().splitlines()[-1])
+        results.append(result)
+        print('{:<8} {:<10} {:>7} {:>9.2f} {:>9.1f} {:>9.2f} {:>10.2f} '
+              '{:>10.1f}'.format(
+              scenario, result['mode'], result['files'], result['seconds'],
+              result['files_per_sec'], result['mb_per_sec'],
+              result['api_calls_per_file'], result['peak_rss_kb'] / KB))
+    report = {
+        'revision'  : git_revision(),
+        'date'      : datetime.utcnow().isoformat() + 'Z',
+        'python'    : platform.python_version(),
+        'platform'  : platform.platform(),
+        'config'    : {k: v for k, v in vars(args).items()
+                       if k not in ['child', 'output']},
+        'results'   : results}
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print('results written to {}'.format(args.output))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+# Compares serial and parallel listing of deep directory tree.
+# Network filesystems are simulated by delaying every directory read
+# (--latency-ms), or real mount can be scanned with --root.
+#
+#   python scan_bench.py --depth 4 --width 4 --files 20 --latency-ms 5
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import parallel_scanner
+from parallel_scanner import ParallelScanner
+
+
+def create_tree(root, depth, width, files):
+    for i in range(files):
+        with open(os.path.join(root, 'file{}.jpg'.format(i)), 'w') as f:
+            f.write('x' * i)
+    if depth == 0:
+        return
+    for i in range(width):
+        dir_path = os.path.join(root, 'dir{}'.format(i))
+        os.mkdir(dir_path)
+        create_tree(dir_path, depth - 1, width, files)
+
+
+def slow_scandir(latency):
+    scandir = os.scandir
+
+    def scandir_delayed(path):
+        time.sleep(latency)
+        return scandir(path)
+
+    return scandir_delayed
+
+
+def serial_scan(root):
+    stack = [root]
+    while len(stack) > 0:
+        dirs = []
+        with parallel_scanner._scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.is_file(follow_symlinks=False):
+                    yield entry.path, entry.stat(follow_symlinks=False).st_size
+                elif entry.is_dir(follow_symlinks=False):
+                    dirs.append(entry.path)
+        stack.extend(reversed(dirs))
+
+
+def measure(name, func):
+    started = time.monotonic()
+    count = sum(1 for _ in func())
+    elapsed = time.monotonic() - started
+    print('{:<16} {:>8} files {:>8.3f} s {:>10.0f} files/s'.format(
+          name, count, elapsed, count / elapsed if elapsed > 0 else 0))
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--root', default=None)
+    parser.add_argument('--depth', type=int, default=4)
+    parser.add_argument('--width', type=int, default=4)
+    parser.add_argument('--files', type=int, default=20)
+    parser.add_argument('--latency-ms', type=float, default=2.0)
+    parser.add_argument('--workers', type=int, nargs='+', 
+                        default=[1, 4, 8, 16])
+    args = parser.parse_args()
+
+    root = args.root
+    tmp_dir = None
+    if root is None:
+        tmp_dir = tempfile.mkdtemp()
+        root = tmp_dir
+        create_tree(root, args.depth, args.width, args.files)
+    if args.latency_ms > 0:
+        parallel_scanner._scandir = slow_scandir(args.latency_ms / 1000.0)
+    try:
+        serial = measure('serial', lambda: serial_scan(root))
+        for workers in args.workers:
+            scanner = ParallelScanner(workers=workers)
+            elapsed = measure('parallel x{}'.format(workers),
+                              lambda: scanner.scan(root))
+            scanner.shutdown()
+            print('{:<16} speed-up {:.1f}x'.format('', serial / elapsed))
+    finally:
+        if tmp_dir is not None:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,179 @@
+# Per-file CPU cost of upload state machines. Current table driven
+# FilesUploadSM is compared with xworkflows based one loaded from git
+# history (--baseline, by default last revision using xworkflows),
+# both drive same job: lock, open session, every file uploaded once,
+# close session, remove data. Cost of transition dispatch alone
+# is measured on two state workflow.
+#
+#   python sm_bench.py --files 100000 --uploads 8
+import argparse
+import logging
+import os
+import subprocess
+import sys
+import time
+import types
+
+SRC_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        '..', 'src')
+sys.path.append(SRC_PATH)
+
+import files_upload_sm
+
+
+def git(*args):
+    return subprocess.check_output(['git'] + list(args), cwd=SRC_PATH,
+                                   stderr=subprocess.DEVNULL).decode()
+
+
+# -> newest revision whose state machine uses xworkflows
+def baseline_revision():
+    for rev in git('rev-list', 'HEAD', '--', 'files_upload_sm.py').split():
+        source = git('show', '{}:src/files_upload_sm.py'.format(rev))
+        if 'import xworkflows' in source:
+            return rev
+    raise OSError('no xworkflows revision of files_upload_sm.py')
+
+
+def load_baseline(rev):
+    source = git('show', '{}:src/files_upload_sm.py'.format(rev))
+    module = types.ModuleType('files_upload_sm_baseline')
+    exec(compile(source, 'files_upload_sm@' + rev, 'exec'), module.__dict__)
+    return module
+
+
+def run_job(module, files, uploads):
+    Command = module.Command
+    obj = module.FilesUploadSM(uploads)
+    obj.start(files)
+    obj.data_locked('<Lock>')
+    pending = [data[1] for command, data in obj.session_opened('<Session>')
+               if command == Command.upload_file]
+    closed = False
+    while len(pending) > 0:
+        path = pending.pop()
+        for command, data in obj.file_uploaded(path):
+            if command == Command.upload_file:
+                pending.append(data[1])
+            elif command == Command.close_session:
+                closed = True
+    if not closed:
+        raise RuntimeError('session not closed')
+    obj.session_closed()
+    obj.data_removed()
+    obj.data_unlocked()
+    obj.job_removed()
+
+
+class _LoopWorkflow:
+    states = (('idle', 'Idle'), ('busy', 'Busy'))
+    transitions = (('begin', 'idle', 'busy'), ('step', 'busy', 'busy'))
+    initial_state = 'idle'
+
+
+# -> object whose step() is one self transition of each engine,
+# measures dispatch only, without work of upload state machine
+def loop_machines():
+    from state_table import state_machine, transition, reset_state
+
+    @state_machine(_LoopWorkflow)
+    class TableLoop:
+        def __init__(self):
+            reset_state(self)
+
+        @transition('begin')
+        def begin(self):
+            return []
+
+        @transition('step')
+        def step(self):
+            return []
+
+    machines = {'table': TableLoop}
+    try:
+        import xworkflows
+    except ImportError:
+        return machines
+
+    class XLoopWorkflow(xworkflows.Workflow):
+        states = _LoopWorkflow.states
+        transitions = _LoopWorkflow.transitions
+        initial_state = _LoopWorkflow.initial_state
+
+    class XLoop(xworkflows.WorkflowEnabled):
+        _state = XLoopWorkflow()
+
+        @xworkflows.transition('begin')
+        def begin(self):
+            return []
+
+        @xworkflows.transition('step')
+        def step(self):
+            return []
+
+    machines['xworkflows'] = XLoop
+    return machines
+
+
+def measure_dispatch(count):
+    results = {}
+    for name, cls in loop_machines().items():
+        obj = cls()
+        obj.begin()
+        step = obj.step
+        started = time.perf_counter()
+        for _ in range(count):
+            step()
+        results[name] = (time.perf_counter() - started) / count * 1e6
+        print('{:<12} {:>8} transitions {:>8.2f} us/transition'.format(
+              name, count, results[name]))
+    if len(results) == 2:
+        print('dispatch speed-up {:.1f}x'.format(
+              results['xworkflows'] / results['table']))
+
+
+def measure(name, module, files, uploads, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run_job(module, files, uploads)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    per_file = best / len(files) * 1e6
+    print('{:<12} {:>8} files {:>8.3f} s {:>8.2f} us/file'.format(
+          name, len(files), best, per_file))
+    return per_file
+
+
+def main():
+    parser = argparse.ArgumentParser(description='State machine benchmark')
+    parser.add_argument('--files', type=int, default=100000)
+    parser.add_argument('--uploads', type=int, default=8)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--baseline', default=None,
+                        help='git revision of xworkflows state machine')
+    parser.add_argument('--debug-log', action='store_true',
+                        help='run with DEBUG logging enabled')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.DEBUG if args.debug_log
+                        else logging.WARNING)
+
+    measure_dispatch(args.files)
+    files = [('data/dir{}/file{}.jpg'.format(i // 100, i), 50000)
+             for i in range(args.files)]
+    current = measure('table', files_upload_sm, files, args.uploads,
+                      args.repeat)
+    try:
+        rev = args.baseline or baseline_revision()
+        baseline = load_baseline(rev)
+    except (OSError, subprocess.CalledProcessError) as e:
+        print('baseline not available: {}'.format(e))
+        return
+    previous = measure('xworkflows', baseline, files, args.uploads,
+                       args.repeat)
+    print('speed-up {:.1f}x (baseline {})'.format(previous / current,
+                                                  rev[:12]))
+
+
+if __name__ == '__main__':
+    main()
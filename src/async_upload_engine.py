@@ -0,0 +1,195 @@
+from typing import Any, Callable, Coroutine
+from files_upload_job import FilesUploadJob, FeedbackCommand, AsyncEvent
+from files_upload_sm import State
+from concurrent.futures import ThreadPoolExecutor, Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from threading import Thread
+import asyncio
+import logging
+
+
+# Runs jobs as coroutines on one event loop thread. Blocking work of
+# all jobs (filesystem, Drive API) is done by fixed executors:
+# io for short job steps and listing, upload for file uploads and
+# hash for digests of dedup, so number of OS threads does not
+# depend on number of jobs.
+class AsyncUploadEngine:
+
+    def __init__(self, io_workers: int = 4, upload_workers: int = 8,
+                 hash_workers: int = 2):
+        self._log           = logging.getLogger('AsyncUploadEngine')
+        self._loop          = asyncio.new_event_loop()
+        self._io_pool       = ThreadPoolExecutor(
+                                max_workers=max(1, io_workers),
+                                thread_name_prefix='AsyncEngine-io')
+        self._upload_pool   = ThreadPoolExecutor(
+                                max_workers=max(1, upload_workers),
+                                thread_name_prefix='AsyncEngine-upload')
+        self._hash_pool     = ThreadPoolExecutor(
+                                max_workers=max(1, hash_workers),
+                                thread_name_prefix='AsyncEngine-hash')
+        self._thread        = Thread(name='AsyncUploadEngine',
+                                     target=self._run, daemon=True)
+
+    @property
+    def upload_executor(self) -> ThreadPoolExecutor:
+        return self._upload_pool
+
+    @property
+    def hash_executor(self) -> ThreadPoolExecutor:
+        return self._hash_pool
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        if self._thread.is_alive():
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout=30.0)
+        self._io_pool.shutdown(wait=False)
+        self._upload_pool.shutdown(wait=False)
+        self._hash_pool.shutdown(wait=False)
+
+    # Thread safe, -> future of coroutine result
+    def spawn(self, coroutine: Coroutine) -> Future:
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop)
+
+    # Called on loop, runs func on io executor
+    async def run_io(self, func: Callable, *args) -> Any:
+        return await self._loop.run_in_executor(self._io_pool, func, *args)
+
+    # Thread safe, event is queued from any thread
+    def put_event(self, queue: asyncio.Queue, item):
+        self._loop.call_soon_threadsafe(queue.put_nowait, item)
+
+    # Thread safe, func is called on loop after delay
+    def call_later(self, delay: float, func: Callable, *args):
+        self._loop.call_soon_threadsafe(self._loop.call_later, delay,
+                                        func, *args)
+
+    def _run(self):
+        self._log.info('engine started')
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_forever()
+        self._log.info('engine stopped')
+
+
+# Queue of job async events filled from executor threads
+# and consumed by job coroutine.
+class _EngineEventsQueue:
+
+    def __init__(self, engine: AsyncUploadEngine):
+        self._engine    = engine
+        self._queue     = asyncio.Queue()
+
+    def put(self, item):
+        self._engine.put_event(self._queue, item)
+
+    async def get(self, timeout: float):
+        return await asyncio.wait_for(self._queue.get(), timeout)
+
+
+# FilesUploadJob driven by coroutine instead of own thread.
+# State machine protocol and side effect handlers are the same,
+# every step runs on engine io executor, one step of job at a time,
+# so state machine is still never touched concurrently.
+# Uploads and digests run on engine executors.
+class AsyncFilesUploadJob(FilesUploadJob):
+
+    def __init__(self, engine: AsyncUploadEngine, *args, **kwargs):
+        super().__init__(*args, upload_executor=engine.upload_executor,
+                         hash_executor=engine.hash_executor, **kwargs)
+        self._engine        = engine
+        self._async_events  = _EngineEventsQueue(engine)
+        self._task          = None
+
+    def start(self, retry_state: State = None):
+        self._retry_state = retry_state
+        self._task = self._engine.spawn(self._run_async())
+
+    def stop(self):
+        try:
+            self._cancel()
+        except Exception as e:
+            self._log.error('error canceling job %s', str(e))
+        if self._task is None:
+            return
+        try:
+            self._task.result(timeout=30.0)
+        except FutureTimeoutError:
+            self._log.error('job not stopped in time')
+
+    async def _run_async(self):
+        self._log.info('job started')
+        self._log.info('uploading from %s to GDrive:%s',
+                       self._src_path, self._dst_path)
+        try:
+            side_effects = await self._engine.run_io(
+                                self._entry_side_effects)
+            await self._loop_side_effects_async(side_effects)
+        except Exception as e:
+            self._log.error('error during job execution %s', str(e))
+            self._callback(FeedbackCommand.terminated, None)
+        finally:
+            self._shutdown_own_pools()
+        self._log.info('job finished')
+
+    async def _loop_side_effects_async(self, entry_side_effects):
+        side_effects = entry_side_effects
+        while not self._canceled:
+            if len(side_effects) == 0:
+                self._flush_empty_files()
+                if self._uploads_in_flight == 0 and not self._listing:
+                    break
+                side_effects = await self._wait_async_event_async()
+                self._report_progress()
+                continue
+            side_effects = await self._engine.run_io(
+                                self._process_side_effects, side_effects)
+            self._report_progress()
+
+    async def _wait_async_event_async(self):
+        try:
+            event, path, data = await self._async_events.get(timeout=1.0)
+        except asyncio.TimeoutError:
+            return []
+        handler = self._async_events_handlers_map[event]
+        return await self._engine.run_io(handler, path, data)
+
+    # Called from upload executor, events are queued by loop timer,
+    # so shared executor thread is not held by rate limited file.
+    def _put_events_after(self, delay, events):
+        self._engine.call_later(delay, self._put_events, events)
+
+    def _put_events(self, events):
+        for event in events:
+            self._async_events.put(event)
+
+    # Called from io executor by lock handler.
+    def _start_listing(self):
+        self._listing = True
+        self._engine.spawn(self._list_async())
+
+    # Listing is pulled in batches on io executor,
+    # so it does not hold executor thread for whole tree.
+    async def _list_async(self):
+        files = self._list_recursive(self._src_path)
+        try:
+            while True:
+                batch = await self._engine.run_io(_take, files,
+                                                  self._listing_batch)
+                if len(batch) == 0:
+                    break
+                self._async_events.put((AsyncEvent.listed, None, batch))
+            self._async_events.put((AsyncEvent.listed_all, None, None))
+        except Exception as e:
+            self._async_events.put((AsyncEvent.listed_all, None, e))
+
+
+def _take(iterator, count):
+    batch = []
+    for item in iterator:
+        batch.append(item)
+        if len(batch) >= count:
+            break
+    return batch
@@ -0,0 +1,144 @@
+from typing import Iterator, Optional, Tuple
+from array import array
+import sys
+
+
+Path = str
+Size = int
+Index = int
+FileEntry = Tuple[Path, Size]
+
+
+# Table of job files shared by FilesUploadSM and FilesUploadSubState.
+# Every path is stored once and referenced by its index, sizes and
+# retries live in typed arrays, uploaded files are marked in a bitmap.
+# Counters of files and bytes are kept up to date, so progress
+# does not need to walk the table.
+class FileTable:
+
+    def __init__(self):
+        self._paths         = [] # [Path], index -> path
+        self._indices       = {} # {Path: Index}
+        self._sizes         = array('q')
+        self._retries       = array('b')
+        self._done          = bytearray() # bitmap of uploaded files
+        self._total_size    = 0
+        self._done_files    = 0
+        self._done_size     = 0
+
+    def __len__(self):
+        return len(self._paths)
+
+    def __contains__(self, path: Path):
+        return path in self._indices
+
+    @property
+    def total_size(self) -> Size:
+        return self._total_size
+
+    @property
+    def done_files(self) -> int:
+        return self._done_files
+
+    @property
+    def done_size(self) -> Size:
+        return self._done_size
+
+    # -> index of new entry, None if path is already in table
+    def add(self, path: Path, size: Size) -> Optional[Index]:
+        if path in self._indices:
+            return None
+        index = len(self._paths)
+        path = sys.intern(path)
+        self._paths.append(path)
+        self._indices[path] = index
+        self._sizes.append(size)
+        self._retries.append(0)
+        if index % 8 == 0:
+            self._done.append(0)
+        self._total_size += size
+        return index
+
+    def index(self, path: Path) -> Optional[Index]:
+        return self._indices.get(path)
+
+    def path(self, index: Index) -> Path:
+        return self._paths[index]
+
+    def size(self, index: Index) -> Size:
+        return self._sizes[index]
+
+    def retries(self, index: Index) -> int:
+        return self._retries[index]
+
+    def set_retries(self, index: Index, retries: int):
+        self._retries[index] = retries
+
+    def is_done(self, index: Index) -> bool:
+        return bool(self._done[index >> 3] & (1 << (index & 7)))
+
+    # -> False if file was already marked as uploaded
+    def mark_done(self, index: Index) -> bool:
+        if self.is_done(index):
+            return False
+        self._done[index >> 3] |= 1 << (index & 7)
+        self._done_files += 1
+        self._done_size += self._sizes[index]
+        return True
+
+    def remaining(self) -> Iterator[Index]:
+        for byte_index, byte in enumerate(self._done):
+            if byte == 0xFF:
+                continue
+            first = byte_index << 3
+            for index in range(first, min(first + 8, len(self._paths))):
+                if not byte & (1 << (index - first)):
+                    yield index
+
+    def to_state(self) -> dict:
+        return {
+            'paths': list(self._paths),
+            'sizes': self._sizes.tobytes(),
+            'done' : bytes(self._done)}
+
+    def load_state(self, state: dict):
+        self._paths = [sys.intern(p) for p in state['paths']]
+        self._indices = {p: i for i, p in enumerate(self._paths)}
+        self._sizes = array('q', state['sizes'])
+        self._retries = array('b', bytes(len(self._paths)))
+        self._done = bytearray(state['done'])
+        self._total_size = sum(self._sizes)
+        self._done_files = 0
+        self._done_size = 0
+        for index in range(len(self._paths)):
+            if self.is_done(index):
+                self._done_files += 1
+                self._done_size += self._sizes[index]
+
+
+# FIFO of table indices backed by array, used instead of deque
+# of tuples to keep queued files compact.
+class IndexQueue:
+
+    def __init__(self):
+        self._items = array('l')
+        self._head  = 0
+
+    def __len__(self):
+        return len(self._items) - self._head
+
+    def append(self, index: Index):
+        self._items.append(index)
+
+    def extend(self, indices):
+        self._items.extend(indices)
+
+    def popleft(self) -> Index:
+        if self._head >= len(self._items):
+            raise IndexError('pop from empty IndexQueue')
+        index = self._items[self._head]
+        self._head += 1
+        if self._head >= 1024 and self._head * 2 >= len(self._items):
+            del self._items[:self._head]
+            self._head = 0
+        return index
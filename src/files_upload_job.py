@@ -1,17 +1,35 @@
-from typing import Callable, Any, List, Union
+from typing import Callable, Any, List, Union, Tuple
 from files_upload_sm import Command, FilesUploadSM
 from files_upload_sm import Path, Seconds, State
 from files_upload_sm import Lock, Session, CommandT
 from files_upload_sm import ScheduleData, UploadData
 from files_upload_sm import CommandData, SideEffect, SideEffects
+from upload_scheduler import UploadSlots
+from resumable_upload import ResumableUpload, DEFAULT_CHUNK_SIZE
+from gdrive_dirs import GDriveDirsResolver, FOLDER_MIME_TYPE
+from gdrive_dirs import quote_query_value
+from gdrive_dir_cache import GDriveDirCache
+from job_journal import JobJournal
+from parallel_scanner import ParallelScanner
+from hash_index import HashIndex
+from token_manager import TokenManager
+from retry_scheduler import BackoffPolicy
+from request_governor import RequestGovernor, governed
+from reclaimer import Reclaimer
+from metadata_batch import MetadataBatch, MAX_BATCH_CALLS
+from upload_errors import ErrorClass, FilePolicy, FILE_POLICIES
+from upload_errors import UPLOAD_ERRORS, classify_error
 from pydrive.drive import GoogleDrive
 from pydrive.auth import RefreshError
-from pydrive.files import ApiRequestError, FileNotUploadedError
-from threading import Thread
+from threading import Thread, Lock
+from concurrent.futures import ThreadPoolExecutor, Future
+from queue import Queue, Empty
 import os
+import time
 import fcntl
+import hashlib
+import mimetypes
 import shutil
-from functools import reduce
 import logging
 from os.path import join as fs_join
 
@@ -23,12 +41,37 @@ FeedbackCallback = Callable[[str, CallbackData], Any]
 # (FeedbackCommand.schedule_retry , (Seconds, State))
 # (FeedbackCommand.release        , None)
 # (FeedbackCommand.terminated     , None)
+# (files_done, size_done, files_total, size_total) change since last call
+ProgressDelta = Tuple[int, int, int, int]
+ProgressCallback = Callable[[ProgressDelta], Any]
+
+
+def file_md5(path: Path, chunk_size: int = 1024 * 1024) -> str:
+    md5 = hashlib.md5()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            md5.update(chunk)
+    return md5.hexdigest()
 
 
 class FeedbackCommand:
     schedule_retry  = 'schedule_retry'
     release         = 'release'
     terminated      = 'terminated'
+    progress        = 'progress'
+
+
+# Results of work done off job thread, passed to job thread
+# through queue as (AsyncEvent.*, Path, Data).
+# (AsyncEvent.listed          , None, [FileEntry])
+# (AsyncEvent.listed_all      , None, None or Exception)
+# (AsyncEvent.upload_progress , Path, ResumePoint)
+# (AsyncEvent.upload_done     , Path, True, ErrorClass or Exception)
+class AsyncEvent:
+    listed          = 'listed'
+    listed_all      = 'listed_all'
+    upload_progress = 'upload_progress'
+    upload_done     = 'upload_done'
 
 
 # local_src_path is root for local job,
@@ -48,7 +91,23 @@ class FilesUploadJob:
     def __init__(self, drive: GoogleDrive, job_id: str,
                  local_src_path: Path, drive_dst_path: str,
                  feedback_callback: FeedbackCallback,
-                 file_exceptions: PathExceptions = []):
+                 file_exceptions: PathExceptions = [],
+                 upload_workers: int = 1,
+                 upload_slots: UploadSlots = None,
+                 chunk_size: int = DEFAULT_CHUNK_SIZE,
+                 gdirs_cache: GDriveDirCache = None,
+                 progress_callback: ProgressCallback = None,
+                 journal: JobJournal = None,
+                 scanner: ParallelScanner = None,
+                 dedup: bool = False,
+                 hash_workers: int = 2,
+                 hash_index: HashIndex = None,
+                 token_manager: TokenManager = None,
+                 governor: RequestGovernor = None,
+                 reclaimer: Reclaimer = None,
+                 batch_calls: int = 0,
+                 upload_executor: ThreadPoolExecutor = None,
+                 hash_executor: ThreadPoolExecutor = None):
         _name               = 'FUJ[{}]'.format(job_id) 
         self._log           = logging.getLogger(_name)
         self._total_files   = 0
@@ -61,11 +120,67 @@ class FilesUploadJob:
                                                       'data'))
         self._dst_path      = drive_dst_path
         self._callback      = feedback_callback
-        self._state         = FilesUploadSM()
+        self._prog_callback = progress_callback
+        self._upload_workers= max(1, upload_workers)
+        # metadata only calls (folders, empty files) are sent in
+        # batches of batch_calls, 0 means every call is own request
+        self._batch_calls   = min(MAX_BATCH_CALLS, max(0, batch_calls))
+        self._empty_files   = [] # [(Path, GoogleDrive)] for next batch
+        self._batched_files = set() # {Path} of batch being sent
+        # more files in flight, so batches of empty files can fill,
+        # other files wait for upload workers in pool queue
+        self._state         = FilesUploadSM(max(self._upload_workers,
+                                                self._batch_calls))
         self._file_except   = set(file_exceptions)
         self._lock          = None
         self._retry_state   = None
-        self._relative_gdirs= {}
+        self._relative_gdirs= gdirs_cache
+        if self._relative_gdirs is None:
+            self._relative_gdirs = GDriveDirCache()
+        self._gdirs_lock    = Lock()
+        self._journal       = journal
+        if self._journal is None:
+            self._journal = JobJournal()
+        self._uploaded_before = set() # uploaded before crash
+        self._scanner       = scanner
+        self._own_scanner   = scanner is None
+        if self._own_scanner:
+            self._scanner = ParallelScanner()
+        self._gdirs_prefetched = False
+        # executors given by engine are shared by jobs, not shut down
+        self._uploads_pool  = upload_executor
+        self._own_uploads   = upload_executor is None
+        if self._own_uploads:
+            self._uploads_pool = ThreadPoolExecutor(
+                                    max_workers=self._upload_workers,
+                                    thread_name_prefix=_name)
+        self._async_events  = Queue()
+        self._uploads_in_flight = 0
+        self._listing       = False
+        self._listing_batch = 256
+        self._upload_slots  = upload_slots
+        self._dedup         = dedup
+        self._hash_pool     = hash_executor
+        self._own_hash_pool = hash_executor is None
+        self._hash_index    = hash_index
+        self._token_manager = token_manager
+        self._governor      = governor # of Drive API requests
+        self._reclaimer     = reclaimer # removes files in background
+        if dedup and self._own_hash_pool:
+            self._hash_pool = ThreadPoolExecutor(
+                                max_workers=max(1, hash_workers),
+                                thread_name_prefix=_name + '-hash')
+        if dedup and self._hash_index is None:
+            self._hash_index = HashIndex()
+        self._remote_files  = {} # {FileId: Future of RemoteChecksums}
+        self._remote_lock   = Lock()
+        # files limited by API wait before retry, after rate_waits
+        # limits in row they are retried as transient errors
+        self._rate_backoff  = BackoffPolicy(1, 2.0, 60)
+        self._rate_waits    = 6
+        self._rate_limited  = 0
+        self._rate_lock     = Lock()
+        self._chunk_size    = chunk_size
         self._photo_exts   = set(['jpg', 'jpeg', 'png', 
                                   'gif', 'tif', 'tiff'])
         
@@ -81,6 +196,17 @@ class FilesUploadJob:
             Command.schedule_retry: self._schedule_retry,
             Command.release_sm    : self._release_sm}
         
+        self._async_events_handlers_map = {
+            AsyncEvent.listed          : self._on_listed,
+            AsyncEvent.listed_all      : self._on_listed_all,
+            AsyncEvent.upload_progress : self._on_upload_progress,
+            AsyncEvent.upload_done     : self._on_upload_done}
+        
+        self._reported      = (0, 0, 0, 0)
+        # changes are merged, at most one report per interval
+        self._progress_interval = 0.25
+        self._reported_at   = None
+        self._released      = False
         self._thread        = Thread(name=_name, target=self._run)
         self._canceled		= False
         
@@ -112,76 +238,176 @@ class FilesUploadJob:
         except Exception as e:
             self._log.error('error during job execution %s', str(e))
             self._callback(FeedbackCommand.terminated, None)
+        finally:
+            self._shutdown_own_pools()
         self._log.info('job finished')
         
+    def _shutdown_own_pools(self):
+        if self._own_uploads:
+            self._uploads_pool.shutdown(wait=False)
+        if self._own_hash_pool and self._hash_pool is not None:
+            self._hash_pool.shutdown(wait=False)
+        if self._own_scanner:
+            self._scanner.shutdown()
+        
     def _run_impl(self):
+        self._loop_side_effects(self._entry_side_effects())
+        
+    def _entry_side_effects(self):
+        checkpoint = self._journal.checkpoint(self._job_id)
+        if checkpoint is not None:
+            self._uploaded_before = set(checkpoint.uploaded)
         if self._retry_state is None:
-            self._run_first()
-        else:
-            state = self._retry_state
-            self._retry_state = None
-            self._run_retry(state)
+            return self._start_first()
+        state = self._retry_state
+        self._retry_state = None
+        return self._start_retry(state)
             
-    def _run_first(self):
-        file_list = self._list_recursive(self._src_path)
-        self._total_files = len(file_list)
-        self._total_size = reduce(lambda x, y: x + y, 
-                                  [sz for _, sz in file_list], 0)
-        self._log.debug('job listed following files for upload:')
-        for path, _ in file_list:
-            self._log.debug(path)
-        self._loop_side_effects(self._state.start(file_list))
+    # Files are listed after job is locked, uploads start 
+    # while rest of directory is still being listed.
+    def _start_first(self):
+        return self._state.start([], listed_all=False)
         
-    def _run_retry(self, state):
+    def _start_retry(self, state):
         self._log.debug('job retrying with state:')
         self._log.debug(str(state))
-        self._loop_side_effects(self._state.retry(state))
+        side_effects = self._state.retry(state)
+        self._state.skip_uploaded(self._uploaded_before)
+        # restored counters were reported by previous run,
+        # only changes of this run are new progress
+        self._reported = self._state.counters
+        return side_effects
         
     def _loop_side_effects(self, entry_side_effects):
         side_effects = entry_side_effects
-        while len(side_effects) > 0 and not self._canceled:
+        while not self._canceled:
+            if len(side_effects) == 0:
+                self._flush_empty_files()
+                if self._uploads_in_flight == 0 and not self._listing:
+                    break
+                side_effects = self._wait_async_event()
+                # chunk progress changes counters without side effects
+                self._report_progress()
+                continue
             se = self._process_side_effects(side_effects)
             side_effects = se
+            self._report_progress()
             
-    def _process_side_effects(self, side_effects):
+    # Sends change of counters since last report, so supervisor
+    # keeps running totals without polling jobs.
+    def _report_progress(self, force: bool = False):
+        if self._prog_callback is None or self._released:
+            return
+        now = time.monotonic()
+        if (not force and self._reported_at is not None and
+            now - self._reported_at < self._progress_interval):
+            return
+        counters = self._state.counters
+        if counters == self._reported:
+            return
+        self._reported_at = now
+        delta = tuple([c - r for c, r in zip(counters, self._reported)])
+        self._reported = counters
+        try:
+            self._prog_callback(delta)
+        except Exception as e:
+            self._log.error('error reporting progress %s', str(e))
+            
+    def _wait_async_event(self):
+        try:
+            event, path, data = self._async_events.get(timeout=1.0)
+        except Empty:
+            return []
+        return self._async_events_handlers_map[event](path, data)
         
-        def execute_command(self, side_effect):
-            cmd_map = self._side_effects_handlers_map
-            command, data = side_effect
-            self._log.debug('processing command (%s, %s)', 
-                            command, str(data))
-            if command in cmd_map:
-                f = cmd_map[command]
-                return f(command, data)
-            self._log.warn('unknown command processing side effect:'
-                           + ' (%s, %s)', command, str(data))
+    def _on_listed(self, _, file_list):
+        # released job only drains events, retry lists on its own
+        if self._released:
             return []
+        if len(self._uploaded_before) > 0:
+            file_list = [(path, size) for path, size in file_list
+                         if path not in self._uploaded_before]
+        self._total_files += len(file_list)
+        self._total_size += sum([sz for _, sz in file_list])
+        self._log.debug('job listed following files for upload:')
+        for path, _ in file_list:
+            self._log.debug(path)
+        if self._gdirs_prefetched:
+            self._prefetch_gdrive_dirs(self._drive, 
+                                       [path for path, _ in file_list])
+        return self._state.files_listed(file_list)
+        
+    def _on_listed_all(self, _, error):
+        self._listing = False
+        if error is not None:
+            raise error
+        return self._state.listing_done()
+        
+    def _on_upload_progress(self, path, resume_point):
+        return self._state.file_upload_progress(path, resume_point)
         
-        ex = lambda se: execute_command(self, se)
-        transformed = [ex(se) for se in side_effects]
-        return reduce(lambda x, y: x + y, transformed, [])
+    def _on_upload_done(self, path, result):
+        self._uploads_in_flight -= 1
+        self._batched_files.discard(path)
+        if isinstance(result, Exception):
+            raise result
+        if result is True:
+            return self._state.file_uploaded(path)
+        policy = FILE_POLICIES.get(result)
+        if policy == FilePolicy.drop:
+            self._log.warning('file %s removed after listing, dropped', path)
+        if policy == FilePolicy.quarantine:
+            if self._state.quarantine_given_up(path):
+                self._log.error('file %s given up (%s error)', path, result)
+            else:
+                self._log.warning('file %s quarantined (%s error)', 
+                                  path, result)
+        return self._state.file_upload_failed(path, result)
+            
+    def _process_side_effects(self, side_effects):
+        cmd_map = self._side_effects_handlers_map
+        result = []
+        for command, data in side_effects:
+            self._log.debug('processing command (%s, %s)', command, data)
+            handler = cmd_map.get(command)
+            if handler is None:
+                self._log.warn('unknown command processing side effect:'
+                               + ' (%s, %s)', command, data)
+                continue
+            result.extend(handler(command, data))
+        return result
         
+    # Iterative walk, yields (Path, Size) without building
+    # lists of whole tree, order is same as depth first listing
+    # (files of directory, then its subdirectories).
     def _list_recursive(self, path: str):
         
-        def filter_file(self, file_entry):
-            not_in_except = file_entry.name not in self._file_except
-            not_symlink = not file_entry.is_symlink()
-            return not_in_except and not_symlink
-                   
-        entries = os.scandir(path)
-        entries = [f for f in entries if filter_file(self, f)]
-        files = [f for f in entries if f.is_file(follow_symlinks=False)]
-        dirs  = [f for f in entries if f.is_dir(follow_symlinks=False)]
-        entries = None
-        
-        def get_size(file_entry):
-            stat = file_entry.stat(follow_symlinks=False)
-            return stat.st_size 
+        def filter_file(file_entry):
+            return file_entry.name not in self._file_except
             
-        files = [(f.path, get_size(f)) for f in files]
-        dirs  = [d.path for d in dirs]
-        files_dirs = [self._list_recursive(path) for path in dirs]
-        return reduce(lambda x, y: x + y, files_dirs, files)
+        return self._scanner.scan(path, filter_file, 
+                                  lambda: self._canceled)
+            
+    def _start_listing(self):
+        self._listing = True
+        thread = Thread(name=self._thread.name + '-list', 
+                        target=self._list_worker)
+        thread.start()
+        
+    # Runs on listing thread, passes files in batches.
+    def _list_worker(self):
+        batch = []
+        try:
+            for file_entry in self._list_recursive(self._src_path):
+                batch.append(file_entry)
+                if len(batch) >= self._listing_batch:
+                    self._async_events.put((AsyncEvent.listed, None, batch))
+                    batch = []
+            if len(batch) > 0:
+                self._async_events.put((AsyncEvent.listed, None, batch))
+            self._async_events.put((AsyncEvent.listed_all, None, None))
+        except Exception as e:
+            self._async_events.put((AsyncEvent.listed_all, None, e))
         
     def _lock_job(self, _1, _2):
         if not os.path.exists(self._lock_path):
@@ -194,21 +420,26 @@ class FilesUploadJob:
         try:
             fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
             self._lock = lock
-            return self._state.data_locked((self._lock_path, lock))
         except:
             lock.close()
             return self._state.data_lock_failed_taken() 
+        if not self._state.listed_all:
+            self._start_listing()
+        return self._state.data_locked((self._lock_path, lock))
         
     def _unlock_job(self, _1, _2):
         self._free_lock()
         return self._state.data_unlocked()
         
+    # Token shared with other jobs is refreshed by token manager,
+    # so expiry does not make all jobs refresh at once.
     def _open_session(self, _1, _2):
         auth = self._drive.auth
-        if not auth.access_token_expired:
-            return self._state.session_opened((self._job_id, self._drive))
         try:
-            auth.Refresh()
+            if self._token_manager is not None:
+                self._token_manager.ensure_fresh()
+            elif auth.access_token_expired:
+                auth.Refresh()
             return self._state.session_opened((self._job_id, self._drive))
         except RefreshError as e:
             self._log.error('error trying to refresh access token %s', 
@@ -221,56 +452,302 @@ class FilesUploadJob:
     def _upload_file(self, _, data: UploadData):
         sess_info, path = data
         _, drive = sess_info
+        if not self._gdirs_prefetched:
+            self._gdirs_prefetched = True
+            self._prefetch_gdrive_dirs(drive, 
+                                       self._state.remaining_files())
+        size = self._state.file_size(path)
+        resume = self._state.resume_point(path)
+        self._uploads_in_flight += 1
+        if self._batch_calls > 0 and size == 0 and resume is None:
+            self._empty_files.append((path, drive))
+            if len(self._empty_files) >= self._batch_calls:
+                self._flush_empty_files(full=True)
+            return []
+        self._uploads_pool.submit(self._upload_worker, 
+                                  path, size, resume, drive)
+        return []
+        
+    # Empty files collected while previous batch is sent are
+    # created by one batch of metadata inserts, full batch is sent
+    # at once.
+    def _flush_empty_files(self, full: bool = False):
+        if len(self._empty_files) == 0:
+            return
+        if len(self._batched_files) > 0 and not full:
+            return
+        files = self._empty_files
+        self._empty_files = []
+        self._batched_files.update([path for path, _ in files])
+        self._uploads_pool.submit(self._batch_worker, files)
+        
+    # Runs on upload pool thread, state machine is only touched
+    # from job thread, so results are passed back through queue.
+    def _upload_worker(self, path, size, resume, drive):
+        if self._canceled:
+            return
+        if (self._dedup and resume is None and 
+            self._uploaded_remotely(drive, path, size)):
+            self._log.info('file %s already on GDrive, skipping', path)
+            self._async_events.put((AsyncEvent.upload_done, path, True))
+            return
+        slots = self._upload_slots
+        if slots is not None and not slots.acquire(self._job_id, size):
+            self._async_events.put((AsyncEvent.upload_done, path, 
+                                    ErrorClass.transient))
+            return
         self._log.info('uploading file %s', path)
+        result = ErrorClass.transient
         try:
-            return self._upload_file_impl(path, drive)
-        except (ApiRequestError, FileNotUploadedError) as e:
+            self._upload_file_impl(path, size, resume, drive)
+            result = True
+        except UPLOAD_ERRORS as e:
             self._log.error('error uploading file %s', str(e))
-            self._clear_gdrive_dir()
-            return self._state.file_upload_failed(path)
+            self._clear_gdrive_dir(path)
+            result = classify_error(e)
+        except Exception as e:
+            result = e
+        finally:
+            if slots is not None:
+                slots.release(self._job_id)
+        delay = 0
+        if result is True:
+            with self._rate_lock:
+                self._rate_limited = 0
+        elif result == ErrorClass.rate_limit:
+            result, delay = self._rate_limit_backoff()
+        self._put_events_after(delay, [(AsyncEvent.upload_done, path, 
+                                        result)])
+        
+    # Batch of empty files takes one upload slot, result of every
+    # file is passed back as if it was uploaded alone.
+    def _batch_worker(self, files):
+        if self._canceled:
+            return
+        _, drive = files[0]
+        paths = [path for path, _ in files]
+        if self._dedup:
+            skipped = set([p for p in paths 
+                           if self._uploaded_remotely(drive, p, 0)])
+            for path in skipped:
+                self._log.info('file %s already on GDrive, skipping', path)
+                self._async_events.put((AsyncEvent.upload_done, path, True))
+            paths = [p for p in paths if p not in skipped]
+            if len(paths) == 0:
+                return
+        results = {p: ErrorClass.transient for p in paths}
+        slots = self._upload_slots
+        if slots is None or slots.acquire(self._job_id, 0):
+            self._log.info('creating %d empty files', len(paths))
+            try:
+                results = self._insert_empty_files(drive, paths)
+            except UPLOAD_ERRORS as e:
+                self._log.error('error creating empty files %s', str(e))
+                results = {p: classify_error(e) for p in paths}
+            except Exception as e:
+                results = {p: e for p in paths}
+            finally:
+                if slots is not None:
+                    slots.release(self._job_id)
+        delay = 0
+        if ErrorClass.rate_limit in results.values():
+            waited, delay = self._rate_limit_backoff()
+            results = {p: waited if r == ErrorClass.rate_limit else r
+                       for p, r in results.items()}
+        elif True in results.values():
+            with self._rate_lock:
+                self._rate_limited = 0
+        self._put_events_after(delay, [(AsyncEvent.upload_done, path, 
+                                        results[path]) for path in paths])
+        
+    # -> {Path: True or ErrorClass}
+    def _insert_empty_files(self, drive, paths):
+        batch = self._metadata_batch(drive)
+        calls = []
+        for path in paths:
+            metadata = self._file_metadata(drive, path)
+            mime_type, _ = mimetypes.guess_type(path)
+            metadata['mimeType'] = mime_type or 'application/octet-stream'
+            calls.append(batch.insert(metadata))
+        results = {}
+        for path, result in zip(paths, batch.execute(calls)):
+            if isinstance(result, Exception):
+                self._log.error('error uploading file %s: %s', path, 
+                                str(result))
+                self._clear_gdrive_dir(path)
+                results[path] = classify_error(result)
+            else:
+                self._log.info('success uploading file %s', path)
+                results[path] = True
+        return results
+        
+    def _metadata_batch(self, drive):
+        if self._batch_calls == 0:
+            return None
+        return MetadataBatch(drive, self._batch_calls, self._governor)
+        
+    # Called after upload slot is released, so other jobs
+    # are not blocked by waiting file.
+    # -> (ErrorClass of limited file, seconds to wait before retry)
+    def _rate_limit_backoff(self):
+        with self._rate_lock:
+            attempt = self._rate_limited
+            self._rate_limited += 1
+        if attempt >= self._rate_waits:
+            return ErrorClass.transient, 0
+        delay = self._rate_backoff.delay(attempt)
+        self._log.warning('rate limited, waiting %.1f s', delay)
+        return ErrorClass.rate_limit, delay
         
+    # Runs on upload pool thread of job, waits there, so
+    # rate limited file is retried only after delay.
+    def _put_events_after(self, delay, events):
+        deadline = time.monotonic() + delay
+        while not self._canceled and time.monotonic() < deadline:
+            time.sleep(min(0.5, max(0.0, deadline - time.monotonic())))
+        for event in events:
+            self._async_events.put(event)
+        
+    # Remote file with same title, size and md5Checksum in destination
+    # folder means file was uploaded before (ex. by interrupted run).
+    # Files are hashed only when such title and size exist.
+    def _uploaded_remotely(self, drive, path, size):
+        try:
+            parent = self._get_gdrive_parent(drive, path)
+            folder_id = 'root' if parent is None else parent['id']
+            checksums = self._remote_checksums(drive, folder_id)
+            candidates = checksums.get((os.path.basename(path), size))
+            if candidates is None:
+                return False
+            md5 = self._hash_pool.submit(self._hash_index.digest, 
+                                         path, file_md5).result()
+            return md5 in candidates
+        except Exception as e:
+            self._log.warning('error checking remote copy of %s: %s', 
+                              path, str(e))
+            return False
+            
+    # -> {(title, size): set(md5)} of files in remote folder,
+    # every folder is listed once even when asked by many workers.
+    def _remote_checksums(self, drive, folder_id):
+        with self._remote_lock:
+            future = self._remote_files.get(folder_id)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._remote_files[folder_id] = future
+        if owner:
+            try:
+                future.set_result(self._list_remote_checksums(drive, 
+                                                              folder_id))
+            except Exception as e:
+                with self._remote_lock:
+                    del self._remote_files[folder_id]
+                future.set_exception(e)
+        return future.result()
+        
+    def _list_remote_checksums(self, drive, folder_id):
+        query = "'{}' in parents and trashed=false and mimeType!='{}'".format(
+                    quote_query_value(folder_id), FOLDER_MIME_TYPE)
+        checksums = {}
+        file_list = governed(self._governor, 
+                             drive.ListFile({'q': query}).GetList)
+        for f in file_list:
+            md5 = f.get('md5Checksum')
+            if md5 is None:
+                continue
+            key = (f['title'], int(f.get('fileSize', -1)))
+            checksums.setdefault(key, set()).add(md5)
+        return checksums
+        
+    # File is in journal before it is removed, so file left by crash
+    # is not uploaded again and is removed with data tree
     def _release_file(self, _, path: Path):
+        self._journal.file_uploaded(self._job_id, path)
+        if self._reclaimer is not None:
+            self._reclaimer.remove_file(path)
+            return []
         try:
             os.remove(path)
         except Exception as e:
             self._log.error('error removing file %s: %s', path, str(e))
         return []
         
+    def _remove_tree(self, path: Path):
+        if self._reclaimer is not None:
+            try:
+                self._reclaimer.remove_tree(path)
+                return
+            except OSError as e:
+                if not os.path.lexists(path):
+                    return
+                self._log.warning('error renaming %s for reclaim: %s', 
+                                  path, str(e))
+        shutil.rmtree(path, ignore_errors=True)
+        
     def _remove_data(self, _1, _2):
-        shutil.rmtree(self._src_path, ignore_errors=True)
+        self._remove_tree(self._src_path)
         return self._state.data_removed()
         
     def _remove_job(self, _1, _2):
         path = os.path.dirname(self._src_path)
-        shutil.rmtree(path, ignore_errors=True)
+        self._remove_tree(path)
+        self._journal.job_done(self._job_id)
         return self._state.job_removed()
         
     def _schedule_retry(self, _, data: ScheduleData):
+        _, state = data
+        self._journal.job_state(self._job_id, state)
         try:
             self._callback(FeedbackCommand.schedule_retry, data)
         except Exception as e:
             self._log.error('error scheduling retry %s', str(e))
         return self._state.scheduled_retry()
         
+    # SM is done, listing thread stops with the job, so it does
+    # not race with retry of the job.
     def _release_sm(self, _1, _2):
+        self._report_progress(force=True)
+        self._released = True
+        self._canceled = True
         try:
             self._callback(FeedbackCommand.release, None)
         except Exception as e:
             self._log.error('error releasing SM %s', str(e))
         return []
     
-    def _upload_file_impl(self, path, drive):
+    def _file_metadata(self, drive, path):
         parent = self._get_gdrive_parent(drive, path)
         metadata = {
             'title'     : os.path.basename(path),
             'spaces'    : self._get_gdrive_spaces(path)}
         if parent is not None:
             metadata['parents'] = [parent]
-        gfile = drive.CreateFile(metadata)
-        gfile.SetContentFile(path)
-        gfile.Upload()
+        return metadata
+        
+    def _upload_file_impl(self, path, size, resume, drive):
+        metadata = self._file_metadata(drive, path)
+        if size > self._chunk_size or resume is not None:
+            self._upload_resumable(path, metadata, resume, drive)
+        else:
+            gfile = drive.CreateFile(metadata)
+            gfile.SetContentFile(path)
+            governed(self._governor, gfile.Upload)
         self._log.info('success uploading file %s', path)
-        return self._state.file_uploaded(path)
+        
+    def _upload_resumable(self, path, metadata, resume, drive):
+        
+        def chunk_committed(session_uri, offset):
+            self._log.debug('file %s committed %d bytes', path, offset)
+            self._async_events.put((AsyncEvent.upload_progress, path,
+                                    (session_uri, offset)))
+        
+        upload = ResumableUpload(drive, path, metadata,
+                                 chunk_size=self._chunk_size,
+                                 resume_point=resume,
+                                 progress_callback=chunk_committed,
+                                 governor=self._governor)
+        upload.run()
         
     def _cancel(self):
         self._log.warn('hard canceling job')
@@ -287,34 +764,74 @@ class FilesUploadJob:
         self._lock = None
         
     def _get_gdrive_parent(self, drive, path):
+        with self._gdirs_lock:
+            return self._get_gdrive_parent_impl(drive, path)
+            
+    def _get_gdrive_parent_impl(self, drive, path):
+        gdrive_path = self._get_gdrive_dir_path(path)
+        if gdrive_path is None:
+            return None
+        return self._get_gdrive_parent_cached(drive, gdrive_path)
+        
+    # -> remote dir path of file or None for drive root
+    def _get_gdrive_dir_path(self, path):
         dir_path = os.path.dirname(os.path.abspath(path))
         src_path = self._src_path
         if dir_path == src_path:
-            return self._get_gdrive_root(drive)
+            if len(self._split_gdrive_path(self._dst_path)) == 0:
+                return None
+            return self._dst_path
         if not dir_path.startswith(src_path):
             raise RuntimeError('file from unexpected path'
                                + ' {}, root {}'.format(path, src_path))
         relative_dir = dir_path[len(src_path):]
-        relative_dir = self._dst_path + relative_dir
-        return self._get_gdrive_parent_cached(drive, relative_dir)
-
-    def _get_gdrive_root(self, drive):
-        dirs = self._dst_path.split(os.sep)
-        dirs = [d for d in dirs if len(d) > 0]
+        return self._dst_path + relative_dir
+        
+    def _split_gdrive_path(self, gdrive_path):
+        dirs = gdrive_path.split(os.sep)
+        return tuple([d for d in dirs if len(d) > 0])
+        
+    # Resolves remote dirs of files before they are uploaded,
+    # on failure dirs are resolved one by one during uploads.
+    def _prefetch_gdrive_dirs(self, drive, paths):
+        dirs = {}
+        known = {}
+        for path in paths:
+            gdrive_path = self._get_gdrive_dir_path(path)
+            if gdrive_path is None or gdrive_path in dirs:
+                continue
+            dirs_path = self._split_gdrive_path(gdrive_path)
+            dirs[gdrive_path] = dirs_path
+            for depth in range(1, len(dirs_path) + 1):
+                file_id = self._relative_gdirs.get(
+                                    '/'.join(dirs_path[:depth]))
+                if file_id is not None:
+                    known[dirs_path[:depth]] = file_id
+        dirs = {k: v for k, v in dirs.items() if v not in known}
         if len(dirs) == 0:
-            return None
-        return self._get_gdrive_parent_cached(drive, self._dst_path)
+            return
+        try:
+            resolver = GDriveDirsResolver(drive, governor=self._governor,
+                                          batch=self._metadata_batch(drive))
+            resolved = resolver.resolve(dirs.values(), known)
+        except UPLOAD_ERRORS as e:
+            self._log.error('error resolving remote dirs %s', str(e))
+            return
+        with self._gdirs_lock:
+            for dirs_path, file_id in resolved.items():
+                if len(dirs_path) > 0:
+                    self._relative_gdirs.put('/'.join(dirs_path), file_id)
         
     def _get_gdrive_parent_cached(self, drive, gdrive_path):
-        if gdrive_path in self._relative_gdirs:
-            return self._relative_gdirs[gdrive_path]
+        file_id = self._relative_gdirs.get(gdrive_path)
+        if file_id is not None:
+            return {'kind': 'drive#fileLink', 'id': file_id}
         result = self._find_create_gdrive_dir(drive, gdrive_path)
-        self._relative_gdirs[gdrive_path] = result
+        self._relative_gdirs.put(gdrive_path, result['id'])
         return result
 
     def _find_create_gdrive_dir(self, drive, dir_path):
-        dirs = dir_path.split(os.sep)
-        dirs = [d for d in dirs if len(d) > 0]
+        dirs = list(self._split_gdrive_path(dir_path))
         file_id = self._find_create_gdrive_dir_rec(drive, dirs, 'root')
         return {'kind': 'drive#fileLink', 'id': file_id}
         
@@ -323,7 +840,8 @@ class FilesUploadJob:
             return file_id
         lookup_name = dirs[0]
         query = "'{}' in parents and trashed=false".format(file_id)
-        file_list = drive.ListFile({'q': query}).GetList()
+        file_list = governed(self._governor, 
+                             drive.ListFile({'q': query}).GetList)
         for f in file_list:
             if f['title'] == lookup_name:
                 dirs = dirs[1:]
@@ -339,11 +857,17 @@ class FilesUploadJob:
             'mimeType'  : 'application/vnd.google-apps.folder',
             'parents'   : [{'kind': 'drive#fileLink', 'id': file_id}]}
         new_dir = drive.CreateFile(metadata)
-        new_dir.Upload()
+        governed(self._governor, new_dir.Upload)
         return self._create_gdrive_mkdirs(drive, dirs[1:], new_dir['id'])
         
-    def _clear_gdrive_dir(self):
-        self._relative_gdirs = {}
+    # Only dir of failed file is dropped, it may have been 
+    # removed remotely, other cached dirs stay valid.
+    def _clear_gdrive_dir(self, path):
+        gdrive_path = self._get_gdrive_dir_path(path)
+        if gdrive_path is None:
+            return
+        with self._gdirs_lock:
+            self._relative_gdirs.invalidate(gdrive_path)
         
     def _get_gdrive_spaces(self, path):
         _, ext = os.path.splitext(path)
@@ -1,13 +1,14 @@
-from typing import List, Tuple, Union, Any
-from functools import reduce
-from collections import deque
-import xworkflows
-import logging as log
+from typing import List, Tuple, Union, Any, Optional
+from file_table import FileTable, IndexQueue
+from upload_errors import ErrorClass, ErrorClassT, FilePolicy, FILE_POLICIES
+from state_table import state_machine, transition, reset_state
 
 
 Path = str
 Size = int # size bytes
 Seconds = int
+Offset = int # committed bytes of resumable upload
+ResumePoint = Tuple[str, Offset] # (SessionUri, Offset)
 FileEntry = Tuple[Path, Size]
 State = Any
 Lock = Any
@@ -44,7 +45,7 @@ class Command:
     release_sm      = 'release_sm'
 
 
-class FilesUploadWorkflow(xworkflows.Workflow):
+class FilesUploadWorkflow:
     
     states = (
         ('idle',                'Initial state'),
@@ -85,18 +86,12 @@ class FilesUploadWorkflow(xworkflows.Workflow):
     initial_state = 'idle'
     
     
-    def log_transition(_, transition, from_state, *args, **kwargs):
-        log.debug('FilesUploadSM transition <%s> from <%s> to <%s>',
-                  str(transition.name), 
-                  str(from_state), 
-                  str(transition.target))
-    
-    
-class FilesUploadSubWorkflow(xworkflows.Workflow):
+class FilesUploadSubWorkflow:
     
     states = (
         ('idle',                'Initial state'),
-        ('uploading_file',      'Uploading one file to remote'),
+        ('uploading_file',      'Uploading files to remote'),
+        ('draining',            'Waiting for in-flight uploads (failed)'),
         ('done',                'Done'),
     )
 
@@ -107,26 +102,42 @@ class FilesUploadSubWorkflow(xworkflows.Workflow):
         ('uploaded_ok_empty',       'uploading_file', 'done'),
         ('upload_err_retry',        'uploading_file', 'uploading_file'),
         ('upload_err_final',        'uploading_file', 'done'),
+        ('upload_err_skip',         'uploading_file', 'uploading_file'),
+        ('upload_err_skip_empty',   'uploading_file', 'done'),
+        ('upload_err_drain',        'uploading_file', 'draining'),
+        ('drained_not_empty',       'draining',       'draining'),
+        ('drained_empty',           'draining',       'done'),
+        ('files_added',             'uploading_file', 'uploading_file'),
+        ('feed_closed_empty',       'uploading_file', 'done'),
     )
 
     initial_state = 'idle'
-
-
-    def log_transition(_, transition, from_state, *args, **kwargs):
-        log.debug('FilesUploadSubState transition <%s> from <%s> to <%s>',
-                  str(transition.name), 
-                  str(from_state), 
-                  str(transition.target))
     
 
-class FilesUploadSubState(xworkflows.WorkflowEnabled):
-    
-    _state = FilesUploadSubWorkflow()
-    
+# Keeps up to max_in_flight files uploading at the same time.
+# After a final error no new uploads are issued, files still
+# in flight are drained (released or dropped) and only then
+# '_final_error' is reported to the parent state machine.
+# While feed is open more files may be added with add_files(),
+# '_empty' is reported only after close_feed().
+# Failed file is handled by FilePolicy of its error class, files
+# with quarantine policy are skipped and left for next job run,
+# dropped files are reported as '_dropped' and forgotten.
+@state_machine(FilesUploadSubWorkflow)
+class FilesUploadSubState:
     
-    def __init__(self):
-        self._files          = deque() # [(Path, RetriesLeft)]
-        self._current_file   = None
+    def __init__(self, max_in_flight: int = 1, 
+                 file_table: FileTable = None):
+        reset_state(self)
+        self._table          = file_table
+        if self._table is None:
+            self._table = FileTable()
+        self._files          = IndexQueue() # [Index]
+        self._current_files  = set()        # {Index}
+        self._max_in_flight  = max(1, max_in_flight)
+        self._final_error    = None
+        self._feed_open      = False
+        self._quarantined    = set()        # {Index}
     
     @property
     def _retries(self):
@@ -136,97 +147,207 @@ class FilesUploadSubState(xworkflows.WorkflowEnabled):
     def state(self):
         return str(self._state)
         
-    def start(self, file_list: List[FileEntry]) -> SideEffects:
-        self._files = deque([(path, self._retries) 
-                             for path, _ in file_list])
-        if len(self._files) == 0:
+    @property
+    def in_flight(self) -> int:
+        return len(self._current_files)
+        
+    def quarantined_files(self) -> List[Path]:
+        return [self._table.path(index) for index in self._quarantined]
+        
+    def start(self, file_list: List[FileEntry], 
+              feed_open: bool = False) -> SideEffects:
+        self._files = IndexQueue()
+        self._quarantined = set()
+        self._queue_files(file_list)
+        self._feed_open = feed_open
+        if self._is_empty():
             return self._start_empty()
         return self._start_not_empty()
         
+    def add_files(self, file_list: List[FileEntry]) -> SideEffects:
+        self._queue_files(file_list)
+        if self._state != 'uploading_file':
+            return []
+        return self._files_added()
+        
+    def close_feed(self) -> SideEffects:
+        self._feed_open = False
+        if self._state == 'uploading_file' and self._is_empty():
+            return self._feed_closed_empty()
+        return []
+        
     def upload_succeed(self, file_path: Path) -> SideEffects:
         self._remove_file(file_path)
         result = [(Command.release_file, file_path)]
-        if len(self._files) == 0:
+        if self._state == 'draining':
+            return result + self._drained()
+        if self._is_empty():
             return result + self._uploaded_ok_empty()
         return result + self._uploaded_ok_not_empty()
         
-    def upload_failed(self, file_path: Path) -> SideEffects:
-        if self._can_retry(file_path):
+    def upload_failed(self, file_path: Path, 
+                      error_class: ErrorClassT = ErrorClass.transient
+                      ) -> SideEffects:
+        if self._state == 'draining':
+            self._remove_file(file_path)
+            return self._drained()
+        policy = FILE_POLICIES.get(error_class, FilePolicy.retry)
+        if policy == FilePolicy.quarantine:
+            return self._quarantine(file_path)
+        if policy == FilePolicy.drop:
+            return self._drop(file_path)
+        if policy == FilePolicy.backoff:
+            return self._upload_err_retry(file_path, False)
+        if policy == FilePolicy.retry and self._can_retry(file_path):
             return self._upload_err_retry(file_path)
+        if len(self._current_files) > 1:
+            return self._upload_err_drain(file_path)
         return self._upload_err_final(file_path)
         
-    def _check_current_file(self, file_path: Path):
-        path, _ = self._current_file
-        if path != file_path:
+    def _queue_files(self, file_list):
+        table = self._table
+        for path, size in file_list:
+            index = table.index(path)
+            if index is None:
+                index = table.add(path, size)
+            table.set_retries(index, self._retries)
+            self._files.append(index)
+        
+    def _current_index(self, file_path: Path):
+        index = self._table.index(file_path)
+        if index is None or index not in self._current_files:
             raise ValueError('Unexpected FilePath')
+        return index
         
     def _remove_file(self, file_path: Path):
-        self._check_current_file(file_path)
-        path, _ = self._current_file
-        self._current_file = None
+        self._current_files.remove(self._current_index(file_path))
         
     def _can_retry(self, file_path: Path):
-        self._check_current_file(file_path)
-        path, retries = self._current_file
-        return retries > 0
+        index = self._current_index(file_path)
+        return self._table.retries(index) > 0
+        
+    def _is_empty(self):
+        return (len(self._files) == 0 and 
+                len(self._current_files) == 0 and
+                not self._feed_open)
         
     def _next(self):
-        self._current_file = self._files.popleft()
-        path, _ = self._current_file
-        return path
+        index = self._files.popleft()
+        self._current_files.add(index)
+        return self._table.path(index)
+        
+    def _next_uploads(self):
+        result = []
+        while (len(self._files) > 0 and 
+               len(self._current_files) < self._max_in_flight):
+            path = self._next()
+            result.append((Command.upload_file, path))
+        return result
+        
+    def _drained(self):
+        if len(self._current_files) == 0:
+            return self._drained_empty()
+        return self._drained_not_empty()
+        
+    def _quarantine(self, file_path: Path):
+        index = self._current_index(file_path)
+        self._current_files.remove(index)
+        self._quarantined.add(index)
+        if self._is_empty():
+            return self._upload_err_skip_empty()
+        return self._upload_err_skip()
+        
+    def _drop(self, file_path: Path):
+        self._remove_file(file_path)
+        result = [('_dropped', file_path)]
+        if self._is_empty():
+            return result + self._upload_err_skip_empty()
+        return result + self._upload_err_skip()
         
-    @xworkflows.transition('start_empty')
+    @transition('start_empty')
     def _start_empty(self):
         return [('_empty', None)]
     
-    @xworkflows.transition('start_not_empty')    
+    @transition('start_not_empty')    
     def _start_not_empty(self):
-        path = self._next()
-        return [(Command.upload_file, path)]
+        return self._next_uploads()
         
-    @xworkflows.transition('uploaded_ok_empty')
+    @transition('uploaded_ok_empty')
     def _uploaded_ok_empty(self):
         return [('_empty', None)]
     
-    @xworkflows.transition('uploaded_ok_not_empty')    
+    @transition('uploaded_ok_not_empty')    
     def _uploaded_ok_not_empty(self):
-        path = self._next()
-        return [(Command.upload_file, path)]
+        return self._next_uploads()
     
-    @xworkflows.transition('upload_err_retry')    
-    def _upload_err_retry(self, file_path):
-        self._check_current_file(file_path)
-        path, retries = self._current_file
-        self._current_file = None
-        self._files.append((path, retries - 1))
-        path = self._next()
-        return [(Command.upload_file, path)]
-        
-    @xworkflows.transition('upload_err_final')
+    @transition('upload_err_retry')    
+    def _upload_err_retry(self, file_path, use_retry=True):
+        index = self._current_index(file_path)
+        self._current_files.remove(index)
+        if use_retry:
+            self._table.set_retries(index, self._table.retries(index) - 1)
+        self._files.append(index)
+        return self._next_uploads()
+        
+    @transition('upload_err_skip')
+    def _upload_err_skip(self):
+        return self._next_uploads()
+        
+    @transition('upload_err_skip_empty')
+    def _upload_err_skip_empty(self):
+        return [('_empty', None)]
+        
+    @transition('upload_err_final')
     def _upload_err_final(self, file_path):
-        self._check_current_file(file_path)
         return [('_final_error', file_path)]
+        
+    @transition('upload_err_drain')
+    def _upload_err_drain(self, file_path):
+        self._current_files.remove(self._current_index(file_path))
+        self._final_error = file_path
+        return []
+        
+    @transition('drained_not_empty')
+    def _drained_not_empty(self):
+        return []
+        
+    @transition('drained_empty')
+    def _drained_empty(self):
+        return [('_final_error', self._final_error)]
+        
+    @transition('files_added')
+    def _files_added(self):
+        return self._next_uploads()
+        
+    @transition('feed_closed_empty')
+    def _feed_closed_empty(self):
+        return [('_empty', None)]
 
 
-class FilesUploadSM(xworkflows.WorkflowEnabled):    
+@state_machine(FilesUploadWorkflow)
+class FilesUploadSM:
     
-    _state = FilesUploadWorkflow()
-    
-    
-    def __init__(self):
-        self._files_state    = FilesUploadSubState()
-        
-        self._files          = dict()
-        self._files_original = dict()
-        self._total_size     = 0
-        self._uploaded_size  = 0
+    def __init__(self, max_uploads: int = 1):
+        reset_state(self)
+        self._table          = FileTable()
+        self._files_state    = FilesUploadSubState(max_uploads, 
+                                                   self._table)
+        self._resume         = dict() # {Path: ResumePoint}
+        self._partial_size   = 0 # committed bytes of files in progress
+        self._listed_all     = True
         self._lock           = None
         self._session        = None
+        # job runs failed by quarantined file, {Path: failures}
+        self._quarantine_failures = dict()
+        # after that many failed runs file is given up, job succeeds
+        self._max_quarantine_failures = 3
         
-        self._retry_seconds  = 5 * 60
+        # base delay, supervisor backs off from it on repeated failures
+        self._retry_seconds  = 30
         self._sub_sm_side_effects_handlers_map = {
             Command.upload_file : self._handle_sub_sm_upload,
             Command.release_file: self._handle_sub_sm_release,
+            '_dropped'          : self._handle_sub_sm_dropped,
             '_empty'            : self._handle_sub_sm_empty,
             '_final_error'      : self._handle_sub_sm_final_error}
     
@@ -236,38 +357,96 @@ class FilesUploadSM(xworkflows.WorkflowEnabled):
         
     @property
     def progress(self):
-        num_files_all = len(self._files_original)
-        num_files_done = num_files_all - len(self._files)
-        if num_files_all == 0 or self._total_size == 0:
+        table = self._table
+        num_files_all = len(table)
+        if num_files_all == 0 or table.total_size == 0:
             return 0.0, 0.0
-        progress_files = num_files_done / num_files_all
-        progress_size = self._uploaded_size / self._total_size
+        progress_files = table.done_files / num_files_all
+        progress_size = (table.done_size + self._partial_size) / \
+                        table.total_size
         return float(progress_files), float(progress_size)
     
-    @xworkflows.transition('start')
-    def start(self, file_list: List[FileEntry]) -> SideEffects:
-        total_size = self._calculate_size(file_list)
-        self._files_original = {f: (f, d) for f, d in file_list}
-        self._files = self._files_original.copy()
-        self._total_size = total_size
-        _uploaded_size = 0
+    def file_size(self, file_path: Path) -> Size:
+        index = self._table.index(file_path)
+        if index is None:
+            return 0
+        return self._table.size(index)
+    
+    # -> (files_done, size_done, files_total, size_total)
+    @property
+    def counters(self) -> Tuple[int, Size, int, Size]:
+        table = self._table
+        return (table.done_files, table.done_size + self._partial_size,
+                len(table), table.total_size)
+        
+    @property
+    def listed_all(self) -> bool:
+        return self._listed_all
+        
+    def remaining_files(self) -> List[Path]:
+        table = self._table
+        return [table.path(index) for index in table.remaining()]
+        
+    def resume_point(self, file_path: Path) -> Optional[ResumePoint]:
+        return self._resume.get(file_path)
+        
+    def file_upload_progress(self, file_path: Path, 
+                             resume_point: ResumePoint) -> SideEffects:
+        index = self._table.index(file_path)
+        if index is not None and not self._table.is_done(index):
+            self._drop_partial(file_path)
+            self._resume[file_path] = resume_point
+            self._partial_size += resume_point[1]
+        return []
+    
+    # Marks files uploaded by run not covered by retry state,
+    # ex. recovered from journal after crash.
+    def skip_uploaded(self, file_paths) -> None:
+        for file_path in file_paths:
+            index = self._table.index(file_path)
+            if index is not None and self._table.mark_done(index):
+                self._drop_partial(file_path)
+            
+    # With listed_all=False more files are expected from
+    # files_listed() until listing_done() is called.
+    @transition('start')
+    def start(self, file_list: List[FileEntry], 
+              listed_all: bool = True) -> SideEffects:
+        for path, size in file_list:
+            self._table.add(path, size)
+        self._listed_all = listed_all
         return [(Command.lock_job, None)]
         
-    @xworkflows.transition('retry')
+    def files_listed(self, file_list: List[FileEntry]) -> SideEffects:
+        new_files = [(f, d) for f, d in file_list 
+                     if self._table.add(f, d) is not None]
+        if self._state != 'uploading':
+            return []
+        side_effects = self._files_state.add_files(new_files)
+        return self._handle_sub_sm_side_effects(side_effects)
+        
+    def listing_done(self) -> SideEffects:
+        self._listed_all = True
+        if self._state != 'uploading':
+            return []
+        side_effects = self._files_state.close_feed()
+        return self._handle_sub_sm_side_effects(side_effects)
+        
+    @transition('retry')
     def retry(self, state: State) -> SideEffects:
         self.__setstate__(state)
         return [(Command.lock_job, None)]
        
-    @xworkflows.transition('data_locked')
+    @transition('data_locked')
     def data_locked(self, lock: Lock) -> SideEffects:
         self._lock = lock
         return [(Command.open_session, None)]
         
-    @xworkflows.transition('data_lock_failed_taken')
+    @transition('data_lock_failed_taken')
     def data_lock_failed_taken(self) -> SideEffects:
         return [(Command.release_sm, None)]
         
-    @xworkflows.transition('data_lock_failed_other')
+    @transition('data_lock_failed_other')
     def data_lock_failed_other(self) -> SideEffects:
         state = self.__getstate__()
         return [(Command.schedule_retry, 
@@ -275,11 +454,14 @@ class FilesUploadSM(xworkflows.WorkflowEnabled):
         
     def session_opened(self, session: Session) -> SideEffects:
         result = self._session_opened(session)
-        files = list(self._files.values())
-        side_effects = self._files_state.start(files)
+        table = self._table
+        files = [(table.path(index), table.size(index)) 
+                 for index in table.remaining()]
+        side_effects = self._files_state.start(files, 
+                                               not self._listed_all)
         return result + self._handle_sub_sm_side_effects(side_effects)
         
-    @xworkflows.transition('session_open_failed')
+    @transition('session_open_failed')
     def session_open_failed(self) -> SideEffects:
         lock = self._lock
         self._lock = None
@@ -289,16 +471,29 @@ class FilesUploadSM(xworkflows.WorkflowEnabled):
         side_effects = self._files_state.upload_succeed(file_path)
         return self._handle_sub_sm_side_effects(side_effects)
         
-    def file_upload_failed(self, file_path: Path) -> SideEffects:
-        side_effects = self._files_state.upload_failed(file_path)
+    def file_upload_failed(self, file_path: Path, 
+                           error_class: ErrorClassT = ErrorClass.transient
+                           ) -> SideEffects:
+        side_effects = self._files_state.upload_failed(file_path, 
+                                                       error_class)
         return self._handle_sub_sm_side_effects(side_effects)
         
+    # Files skipped by current session, they stay in retry state
+    def quarantined_files(self) -> List[Path]:
+        return self._files_state.quarantined_files()
+        
+    # -> True if quarantined file already failed max_quarantine_failures
+    # job runs, it is given up when current session ends
+    def quarantine_given_up(self, file_path: Path) -> bool:
+        failures = self._quarantine_failures.get(file_path, 0)
+        return failures >= self._max_quarantine_failures
+        
     def session_closed(self) -> SideEffects:
         if self._state == 'closing_sess_retry':
             return self._session_closed_retry()
         return self._session_closed()
         
-    @xworkflows.transition('data_removed')
+    @transition('data_removed')
     def data_removed(self) -> SideEffects:
         lock = self._lock
         self._lock = None
@@ -309,46 +504,46 @@ class FilesUploadSM(xworkflows.WorkflowEnabled):
             return self._data_unlocked_retry()
         return self._data_unlocked()
         
-    @xworkflows.transition('job_removed')
+    @transition('job_removed')
     def job_removed(self) -> SideEffects:
         return [(Command.release_sm, None)]
     
-    @xworkflows.transition('scheduled_retry')
+    @transition('scheduled_retry')
     def scheduled_retry(self) -> SideEffects:
         return [(Command.release_sm, None)]
         
-    @xworkflows.transition('session_opened')
+    @transition('session_opened')
     def _session_opened(self, session: Session):
         self._session = session
         return []
         
-    @xworkflows.transition('upload_done_all')
+    @transition('upload_done_all')
     def _upload_done_all(self):
         session = self._session
         self._session = None
         return [(Command.close_session, session)]
         
-    @xworkflows.transition('upload_error')
+    @transition('upload_error')
     def _upload_error(self):
         session = self._session
         self._session = None
         return [(Command.close_session, session)]
         
-    @xworkflows.transition('session_closed')
+    @transition('session_closed')
     def _session_closed(self):
         return [(Command.remove_data, None)]
         
-    @xworkflows.transition('session_closed_retry')
+    @transition('session_closed_retry')
     def _session_closed_retry(self):
         lock = self._lock
         self._lock = None
         return [(Command.unlock_job, lock)]
         
-    @xworkflows.transition('data_unlocked')
+    @transition('data_unlocked')
     def _data_unlocked(self):
         return [(Command.remove_job, None)]
         
-    @xworkflows.transition('data_unlocked_retry')
+    @transition('data_unlocked_retry')
     def _data_unlocked_retry(self):
         state = self.__getstate__()
         return [(Command.schedule_retry, 
@@ -356,54 +551,74 @@ class FilesUploadSM(xworkflows.WorkflowEnabled):
         
     def _handle_sub_sm_side_effects(
         self, side_effects: SideEffects) -> SideEffects:
-            
-        def execute_command(cmd_map, side_effect):
-            command, data = side_effect
-            if command in cmd_map:
-                f = cmd_map[command]
-                return f(command, data)
-            return [(command, data)]
-        
         cmd_map = self._sub_sm_side_effects_handlers_map
-        ex = lambda se: execute_command(cmd_map, se)
-        transformed = [ex(se) for se in side_effects]
-        return reduce(lambda x, y: x + y, transformed, [])
+        result = []
+        for command, data in side_effects:
+            handler = cmd_map.get(command)
+            if handler is None:
+                result.append((command, data))
+            else:
+                result.extend(handler(command, data))
+        return result
         
     def _handle_sub_sm_upload(self, _, file_path):
         return [(Command.upload_file, (self._session, file_path))]
         
     def _handle_sub_sm_release(self, _, file_path):
-        if file_path in self._files:
-            _, size = self._files[file_path]
-            self._uploaded_size += size
-            del self._files[file_path]
+        index = self._table.index(file_path)
+        if index is not None:
+            self._table.mark_done(index)
+        self._drop_partial(file_path)
+        self._quarantine_failures.pop(file_path, None)
         return [(Command.release_file, file_path)]
         
+    # Dropped file is marked done, so it is not retried
+    def _handle_sub_sm_dropped(self, _, file_path):
+        self._forget(file_path)
+        return []
+        
+    def _forget(self, file_path):
+        index = self._table.index(file_path)
+        if index is not None:
+            self._table.mark_done(index)
+        self._drop_partial(file_path)
+        self._quarantine_failures.pop(file_path, None)
+        
+    def _drop_partial(self, file_path):
+        resume_point = self._resume.pop(file_path, None)
+        if resume_point is not None:
+            self._partial_size -= resume_point[1]
+        
+    # With quarantined files job ends as failed, so its data is kept
+    # and next run retries only quarantined files. File which failed
+    # max_quarantine_failures runs already is given up instead.
     def _handle_sub_sm_empty(self, _, _2):
+        failed = False
+        for file_path in self._files_state.quarantined_files():
+            if self.quarantine_given_up(file_path):
+                self._forget(file_path)
+                continue
+            failures = self._quarantine_failures.get(file_path, 0)
+            self._quarantine_failures[file_path] = failures + 1
+            failed = True
+        if failed:
+            return self._upload_error()
         return self._upload_done_all()
         
     def _handle_sub_sm_final_error(self, _, _2):
         return self._upload_error()
         
-    def _calculate_size(self, file_list: List[FileEntry]) -> int:
-        total_size = reduce(
-            lambda x, y: x + y, 
-            [i for _, i in file_list],
-            0)
-        return total_size
-
     def __getstate__(self):
         return {
             'class': 'FilesUploadSM',
-            'files': self._files,
-            'files_original': self._files_original}
+            'table': self._table.to_state(),
+            'resume': dict(self._resume),
+            'listed': self._listed_all,
+            'quarantined': dict(self._quarantine_failures)}
 
     def __setstate__(self, state):
-        files = state['files']
-        files_original = state['files_original']
-        total_size = self._calculate_size(files_original.values())
-        remains_size = self._calculate_size(files.values())
-        self._files = dict(files)
-        self._files_original = dict(files_original)
-        self._total_size = total_size
-        self._uploaded_size = total_size - remains_size
+        self._table.load_state(state['table'])
+        self._resume = dict(state.get('resume', {}))
+        self._partial_size = sum([o for _, o in self._resume.values()])
+        self._listed_all = state.get('listed', True)
+        self._quarantine_failures = dict(state.get('quarantined', {}))
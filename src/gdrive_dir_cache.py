@@ -0,0 +1,121 @@
+from typing import Optional
+from collections import OrderedDict
+from threading import Lock
+import json
+import os
+import time
+import logging
+
+
+GDrivePath = str # 'GDriveDormouse/photos/summer'
+FileId = str
+Seconds = int
+
+
+def normalize_gdrive_path(gdrive_path: str) -> GDrivePath:
+    dirs = [d for d in gdrive_path.split('/') if len(d) > 0]
+    return '/'.join(dirs)
+
+
+# Remote folder path -> id cache shared by all jobs.
+# Entries expire after ttl_seconds, least recently used entries
+# are evicted above max_entries. Optionally saved to json file
+# so folder ids survive restarts, file is written only if cache
+# changed and at most once per save_interval.
+# Thread safe, used from job upload threads.
+class GDriveDirCache:
+
+    def __init__(self, path: Optional[str] = None,
+                 ttl_seconds: Seconds = 7 * 24 * 60 * 60,
+                 max_entries: int = 10000,
+                 save_interval: Seconds = 60):
+        self._log       = logging.getLogger('GDriveDirCache')
+        self._path      = path
+        self._ttl       = ttl_seconds
+        self._max       = max(1, max_entries)
+        self._lock      = Lock()
+        self._entries   = OrderedDict() # {GDrivePath: (FileId, time)}
+        self._dirty     = False
+        self._save_interval = save_interval
+        self._saved_at  = None
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def get(self, gdrive_path: str) -> Optional[FileId]:
+        key = normalize_gdrive_path(gdrive_path)
+        with self._lock:
+            if key not in self._entries:
+                return None
+            file_id, stored = self._entries[key]
+            if self._expired(stored):
+                del self._entries[key]
+                self._dirty = True
+                return None
+            self._entries.move_to_end(key)
+            return file_id
+
+    def put(self, gdrive_path: str, file_id: FileId):
+        key = normalize_gdrive_path(gdrive_path)
+        with self._lock:
+            self._entries[key] = (file_id, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max:
+                self._entries.popitem(last=False)
+            self._dirty = True
+
+    # Drops path and all paths below it.
+    def invalidate(self, gdrive_path: str):
+        key = normalize_gdrive_path(gdrive_path)
+        prefix = key + '/'
+        with self._lock:
+            keys = [k for k in self._entries.keys()
+                    if k == key or k.startswith(prefix) or key == '']
+            for k in keys:
+                del self._entries[k]
+            if len(keys) > 0:
+                self._dirty = True
+
+    def load(self):
+        if self._path is None or not os.path.exists(self._path):
+            return
+        try:
+            with open(self._path, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            self._log.error('error loading dir cache %s', str(e))
+            return
+        with self._lock:
+            self._entries = OrderedDict()
+            for key, file_id, stored in data.get('entries', []):
+                if not self._expired(stored):
+                    self._entries[key] = (file_id, stored)
+            self._dirty = False
+        self._log.info('loaded %d cached dirs', len(self._entries))
+
+    # force=True writes changes at once (ex. on shutdown)
+    def save(self, force: bool = False):
+        if self._path is None:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            now = time.monotonic()
+            if (not force and self._saved_at is not None and
+                now - self._saved_at < self._save_interval):
+                return
+            self._saved_at = now
+            entries = [[k, file_id, stored] for k, (file_id, stored)
+                       in self._entries.items()]
+            self._dirty = False
+        tmp_path = self._path + '.tmp'
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump({'entries': entries}, f)
+            os.replace(tmp_path, self._path)
+        except OSError as e:
+            self._log.error('error saving dir cache %s', str(e))
+
+    def _expired(self, stored):
+        return time.time() - stored > self._ttl
@@ -0,0 +1,142 @@
+from typing import Dict, Tuple, Iterable, Optional
+from pydrive.drive import GoogleDrive
+from pydrive.files import ApiRequestError
+from request_governor import RequestGovernor, governed
+from metadata_batch import MetadataBatch
+import logging
+
+
+DirPath = Tuple[str, ...] # ('photos', 'summer')
+FileId = str
+
+FOLDER_MIME_TYPE = 'application/vnd.google-apps.folder'
+
+
+def quote_query_value(value: str) -> str:
+    return value.replace('\\', '\\\\').replace("'", "\\'")
+
+
+# Resolves many remote directories at once, level by level.
+# For every level existing folders are looked up with one listing
+# query (split only when query would become too long) matching
+# both parents and titles, missing folders are created (with batch
+# requests if batch is given). Children of created folders are known
+# to be missing and never listed.
+class GDriveDirsResolver:
+
+    def __init__(self, drive: GoogleDrive, max_query_terms: int = 40,
+                 governor: Optional[RequestGovernor] = None,
+                 batch: Optional[MetadataBatch] = None):
+        self._log       = logging.getLogger('GDriveDirsResolver')
+        self._drive     = drive
+        self._max_terms = max(2, max_query_terms)
+        self._governor  = governor
+        self._batch     = batch
+
+    # -> {DirPath: FileId}, () is resolved to 'root'
+    # known dirs (ex. cached ids) are neither listed nor created.
+    def resolve(self, dir_paths: Iterable[DirPath],
+                known: Optional[Dict[DirPath, FileId]] = None
+                ) -> Dict[DirPath, FileId]:
+        levels = {} # {depth: set(DirPath)}
+        for dir_path in dir_paths:
+            for depth in range(1, len(dir_path) + 1):
+                levels.setdefault(depth, set()).add(dir_path[:depth])
+        resolved = {(): 'root'}
+        if known is not None:
+            resolved.update(known)
+        created = set([])
+        for depth in sorted(levels.keys()):
+            level = sorted([p for p in levels[depth] if p not in resolved])
+            to_lookup = [p for p in level if p[:-1] not in created]
+            found = self._lookup_level(to_lookup, resolved)
+            resolved.update(found)
+            missing = [p for p in level if p not in found]
+            resolved.update(self._create_dirs(missing, resolved))
+            created.update(missing)
+        self._log.debug('resolved %d dirs, created %d',
+                        len(resolved) - 1, len(created))
+        return resolved
+
+    def _lookup_level(self, dir_paths, resolved):
+        found = {}
+        for chunk in self._split_queries(dir_paths, resolved):
+            found.update(self._lookup_chunk(chunk, resolved))
+        return found
+
+    # Split so that parents + titles terms of every query fit limit.
+    def _split_queries(self, dir_paths, resolved):
+        chunk = []
+        parents = set([])
+        titles = set([])
+        for dir_path in dir_paths:
+            parent_id = resolved[dir_path[:-1]]
+            new_parents = parents | set([parent_id])
+            new_titles = titles | set([dir_path[-1]])
+            if (len(chunk) > 0 and
+                len(new_parents) + len(new_titles) > self._max_terms):
+                yield chunk
+                chunk = []
+                new_parents = set([parent_id])
+                new_titles = set([dir_path[-1]])
+            chunk.append(dir_path)
+            parents = new_parents
+            titles = new_titles
+        if len(chunk) > 0:
+            yield chunk
+
+    def _lookup_chunk(self, dir_paths, resolved):
+        by_parent = {} # {(FileId, title): DirPath}
+        for dir_path in dir_paths:
+            by_parent[(resolved[dir_path[:-1]], dir_path[-1])] = dir_path
+        parent_ids = sorted(set([p for p, _ in by_parent.keys()]))
+        titles = sorted(set([t for _, t in by_parent.keys()]))
+        query = '({}) and ({}) and mimeType=\'{}\' and trashed=false'.format(
+                    ' or '.join(["'{}' in parents".format(
+                                     quote_query_value(p))
+                                 for p in parent_ids]),
+                    ' or '.join(["title='{}'".format(quote_query_value(t))
+                                 for t in titles]),
+                    FOLDER_MIME_TYPE)
+        file_list = governed(self._governor, 
+                             self._drive.ListFile({'q': query}).GetList)
+        found = {}
+        for f in file_list:
+            for parent_id in self._item_parents(f, parent_ids):
+                key = (parent_id, f['title'])
+                if key in by_parent and by_parent[key] not in found:
+                    found[by_parent[key]] = f['id']
+        return found
+
+    def _item_parents(self, item, queried_parents):
+        if len(queried_parents) == 1:
+            return queried_parents
+        return [p['id'] for p in item['parents']]
+
+    # Dirs of one level, their parents are already resolved.
+    def _create_dirs(self, dir_paths, resolved):
+        if self._batch is None or len(dir_paths) < 2:
+            return {p: self._create_dir(p[-1], resolved[p[:-1]])
+                    for p in dir_paths}
+        calls = [self._batch.insert(self._dir_metadata(
+                                        p[-1], resolved[p[:-1]]))
+                 for p in dir_paths]
+        created = {}
+        for dir_path, result in zip(dir_paths,
+                                    self._batch.execute(calls)):
+            if isinstance(result, Exception):
+                raise ApiRequestError(result)
+            created[dir_path] = result['id']
+        return created
+
+    def _dir_metadata(self, title, parent_id):
+        return {
+            'title'     : title,
+            'mimeType'  : FOLDER_MIME_TYPE,
+            'parents'   : [{'kind': 'drive#fileLink', 'id': parent_id}]}
+
+    def _create_dir(self, title, parent_id):
+        new_dir = self._drive.CreateFile(self._dir_metadata(title,
+                                                            parent_id))
+        governed(self._governor, new_dir.Upload)
+        return new_dir['id']
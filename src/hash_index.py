@@ -0,0 +1,126 @@
+from typing import Callable, Optional
+from threading import Lock
+import sqlite3
+import os
+import logging
+
+
+Path = str
+Digest = str
+HashFunction = Callable[[Path], Digest]
+
+
+# Persistent cache of file digests, so files seen by earlier runs
+# (ex. retried jobs) are not read again. Entry is valid while device,
+# inode, size and mtime_ns of file are unchanged. Least recently used
+# entries are evicted above max_entries.
+# Without path index is kept in memory.
+# Thread safe, used from hashing threads of jobs.
+class HashIndex:
+
+    def __init__(self, path: Optional[Path] = None,
+                 max_entries: int = 100000):
+        self._log           = logging.getLogger('HashIndex')
+        self._max           = max(1, max_entries)
+        self._lock          = Lock()
+        self._db            = self._open(path)
+        self._count         = self._db.execute(
+                                'SELECT COUNT(*) FROM hashes').fetchone()[0]
+        self._clock         = self._db.execute(
+                                'SELECT MAX(used) FROM hashes').fetchone()[0]
+        if self._clock is None:
+            self._clock = 0
+        self._hits          = 0
+        self._misses        = 0
+
+    def __len__(self):
+        with self._lock:
+            return self._count
+
+    # -> (hits, misses)
+    @property
+    def stats(self):
+        with self._lock:
+            return self._hits, self._misses
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def get(self, st: os.stat_result) -> Optional[Digest]:
+        with self._lock:
+            row = self._db.execute(
+                    'SELECT digest FROM hashes WHERE dev=? AND ino=? '
+                    'AND size=? AND mtime_ns=?', _key(st)).fetchone()
+            if row is None:
+                self._misses += 1
+                return None
+            self._hits += 1
+            self._clock += 1
+            self._db.execute('UPDATE hashes SET used=? WHERE dev=? AND ino=?',
+                             (self._clock, st.st_dev, st.st_ino))
+            return row[0]
+
+    def put(self, st: os.stat_result, digest: Digest):
+        with self._lock:
+            self._clock += 1
+            cursor = self._db.execute(
+                        'DELETE FROM hashes WHERE dev=? AND ino=?',
+                        (st.st_dev, st.st_ino))
+            self._count -= cursor.rowcount
+            self._db.execute('INSERT INTO hashes VALUES (?, ?, ?, ?, ?, ?)',
+                             _key(st) + (digest, self._clock))
+            self._count += 1
+            if self._count > self._max:
+                self._evict()
+
+    # -> digest of file, hash_function is called only when file
+    # is not in index or changed since it was hashed
+    def digest(self, path: Path, hash_function: HashFunction) -> Digest:
+        st = os.stat(path)
+        digest = self.get(st)
+        if digest is not None:
+            return digest
+        digest = hash_function(path)
+        if _key(os.stat(path)) == _key(st):
+            self.put(st, digest)
+        return digest
+
+    # Evicts tenth of entries at once, so eviction is not
+    # paid on every insert.
+    def _evict(self):
+        target = self._max - self._max // 10
+        cursor = self._db.execute(
+                    'DELETE FROM hashes WHERE rowid IN (SELECT rowid FROM '
+                    'hashes ORDER BY used LIMIT ?)', (self._count - target,))
+        self._count -= cursor.rowcount
+        self._log.debug('evicted %d digests', cursor.rowcount)
+
+    def _open(self, path):
+        db = None
+        try:
+            db = self._connect(path)
+        except sqlite3.DatabaseError as e:
+            self._log.error('error opening hash index %s, recreating',
+                            str(e))
+            if path is not None and os.path.exists(path):
+                os.remove(path)
+            db = self._connect(path)
+        return db
+
+    def _connect(self, path):
+        db = sqlite3.connect(path or ':memory:', isolation_level=None,
+                             check_same_thread=False)
+        if path is not None:
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+        db.execute('CREATE TABLE IF NOT EXISTS hashes ('
+                   'dev INTEGER, ino INTEGER, size INTEGER, '
+                   'mtime_ns INTEGER, digest TEXT, used INTEGER, '
+                   'PRIMARY KEY (dev, ino))')
+        db.execute('CREATE INDEX IF NOT EXISTS hashes_used ON hashes(used)')
+        return db
+
+
+def _key(st: os.stat_result):
+    return st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns
@@ -0,0 +1,112 @@
+from typing import Callable, Dict
+from collections import deque
+from threading import Lock, BoundedSemaphore
+from urllib.parse import urlsplit
+import httplib2
+import logging
+
+
+HttpFactory = Callable[[], httplib2.Http]
+
+
+# Thread safe replacement of httplib2.Http shared by all jobs.
+# httplib2.Http must not be used by two threads at once, so every
+# request borrows one authorized Http from pool of idle ones kept per
+# host and returns it afterwards, connections stay open (keep-alive)
+# and TLS handshake is paid once per pooled connection.
+# At most max_per_host requests run to one host at a time, at most
+# max_idle connections are kept open.
+class SharedHttp:
+
+    def __init__(self, http_factory: HttpFactory,
+                 max_per_host: int = 8, max_idle: int = 16):
+        self._log           = logging.getLogger('SharedHttp')
+        self._factory       = http_factory
+        self._max_per_host  = max(1, max_per_host)
+        self._max_idle      = max(0, max_idle)
+        self._lock          = Lock()
+        self._idle          = {} # {host: deque(Http)}
+        self._idle_n        = 0
+        self._limits        = {} # {host: BoundedSemaphore}
+        self._created       = 0
+        self._reused        = 0
+
+    # -> (connections created, requests served by reused connection)
+    @property
+    def stats(self):
+        with self._lock:
+            return self._created, self._reused
+
+    def request(self, uri, method='GET', body=None, headers=None,
+                redirections=httplib2.DEFAULT_MAX_REDIRECTS,
+                connection_type=None):
+        host = urlsplit(uri).netloc
+        with self._host_limit(host):
+            http = self._checkout(host)
+            reusable = False
+            try:
+                result = http.request(uri, method=method, body=body,
+                                      headers=headers,
+                                      redirections=redirections,
+                                      connection_type=connection_type)
+                reusable = True
+                return result
+            finally:
+                self._checkin(host, http, reusable)
+
+    def close(self):
+        with self._lock:
+            idle = [http for pool in self._idle.values() for http in pool]
+            self._idle = {}
+            self._idle_n = 0
+        for http in idle:
+            _close(http)
+
+    def _host_limit(self, host):
+        with self._lock:
+            if host not in self._limits:
+                self._limits[host] = BoundedSemaphore(self._max_per_host)
+            return self._limits[host]
+
+    def _checkout(self, host):
+        with self._lock:
+            pool = self._idle.get(host)
+            if pool:
+                self._idle_n -= 1
+                self._reused += 1
+                return pool.pop()
+            self._created += 1
+        http = self._factory()
+        # 308 is resumable upload progress, not redirect
+        try:
+            http.redirect_codes = http.redirect_codes - {308}
+        except AttributeError:
+            pass
+        return http
+
+    # Connection of failed request may be broken, so it is dropped.
+    def _checkin(self, host, http, reusable):
+        if reusable:
+            with self._lock:
+                if self._idle_n < self._max_idle:
+                    self._idle.setdefault(host, deque()).append(http)
+                    self._idle_n += 1
+                    return
+        _close(http)
+
+
+def _close(http):
+    try:
+        http.close()
+    except Exception:
+        pass
+
+
+# Makes every pydrive call of auth use SharedHttp. pydrive asks
+# auth.Get_Http_Object() for each request, by default it creates
+# new Http (and new TLS connection) every time.
+def install_shared_http(auth, max_per_host: int = 8,
+                        max_idle: int = 16) -> SharedHttp:
+    shared = SharedHttp(auth.Get_Http_Object, max_per_host, max_idle)
+    auth.Get_Http_Object = lambda: shared
+    return shared
@@ -0,0 +1,192 @@
+from typing import Optional, Dict, Set, Any
+from threading import Lock
+import base64
+import json
+import os
+import time
+import logging
+
+
+Path = str
+State = Any
+
+
+# Checkpoint of single job recovered from journal.
+class JobCheckpoint:
+
+    def __init__(self):
+        self.state      = None  # last retry state, None if not scheduled
+        self.uploaded   = set() # paths uploaded since state was saved
+
+
+# Append-only journal of jobs shared by all jobs of supervisor.
+# Every line is json record:
+#   {"op": "state", "job": name, "state": retry state}
+#   {"op": "uploaded", "job": name, "path": path}
+#   {"op": "done", "job": name}
+# State and done records are synced immediately, uploaded records
+# are synced in batches - losing some of them after crash means
+# only that those files may be uploaded again. Journal is rewritten
+# without obsolete records when it grows too much.
+# Without path nothing is stored.
+# Thread safe, used from job threads.
+class JobJournal:
+
+    def __init__(self, path: Optional[Path] = None,
+                 sync_interval: float = 1.0, sync_batch: int = 64,
+                 compact_min_records: int = 1000):
+        self._log           = logging.getLogger('JobJournal')
+        self._path          = path
+        self._sync_interval = sync_interval
+        self._sync_batch    = max(1, sync_batch)
+        self._compact_min   = compact_min_records
+        self._lock          = Lock()
+        self._file          = None
+        self._jobs          = {} # {job_name: JobCheckpoint}
+        self._records       = 0
+        self._unsynced      = 0
+        self._synced_time   = time.monotonic()
+
+    # -> {job_name: JobCheckpoint} of jobs not finished before
+    def load(self) -> Dict[str, JobCheckpoint]:
+        if self._path is None:
+            return {}
+        with self._lock:
+            self._jobs = {}
+            if os.path.exists(self._path):
+                self._replay()
+            self._compact()
+            self._log.info('loaded %d unfinished jobs', len(self._jobs))
+            return dict(self._jobs)
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._sync()
+                self._file.close()
+                self._file = None
+
+    def checkpoint(self, job_name: str) -> Optional[JobCheckpoint]:
+        with self._lock:
+            return self._jobs.get(job_name)
+
+    def jobs(self) -> Set[str]:
+        with self._lock:
+            return set(self._jobs.keys())
+
+    def job_state(self, job_name: str, state: State):
+        self._append({'op': 'state', 'job': job_name,
+                      'state': _encode(state)}, sync=True)
+
+    def file_uploaded(self, job_name: str, path: Path):
+        self._append({'op': 'uploaded', 'job': job_name, 'path': path},
+                     sync=False)
+
+    def job_done(self, job_name: str):
+        self._append({'op': 'done', 'job': job_name}, sync=True)
+
+    def _append(self, record, sync):
+        if self._path is None:
+            return
+        with self._lock:
+            self._apply(record)
+            try:
+                if self._file is None:
+                    self._file = open(self._path, 'a')
+                self._file.write(json.dumps(record) + '\n')
+                self._file.flush()
+                self._records += 1
+                self._unsynced += 1
+                now = time.monotonic()
+                if (sync or self._unsynced >= self._sync_batch or
+                    now - self._synced_time >= self._sync_interval):
+                    self._sync()
+            except OSError as e:
+                self._log.error('error writing journal %s', str(e))
+                return
+            live = sum([len(c.uploaded) + 1 for c in self._jobs.values()])
+            if self._records > self._compact_min + 2 * live:
+                self._compact()
+
+    def _apply(self, record):
+        op = record.get('op')
+        job_name = record.get('job')
+        if op == 'done':
+            self._jobs.pop(job_name, None)
+            return
+        checkpoint = self._jobs.setdefault(job_name, JobCheckpoint())
+        if op == 'state':
+            checkpoint.state = _decode(record['state'])
+            checkpoint.uploaded = set()
+        elif op == 'uploaded':
+            checkpoint.uploaded.add(record['path'])
+
+    def _replay(self):
+        try:
+            with open(self._path, 'r') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # last line may be cut by crash
+                        self._log.warning('skipping broken journal record')
+                        continue
+                    self._apply(record)
+        except OSError as e:
+            self._log.error('error reading journal %s', str(e))
+
+    def _sync(self):
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._synced_time = time.monotonic()
+
+    def _compact(self):
+        records = []
+        for job_name, checkpoint in self._jobs.items():
+            if checkpoint.state is not None:
+                records.append({'op': 'state', 'job': job_name,
+                                'state': _encode(checkpoint.state)})
+            for path in sorted(checkpoint.uploaded):
+                records.append({'op': 'uploaded', 'job': job_name,
+                                'path': path})
+        tmp_path = self._path + '.tmp'
+        try:
+            with open(tmp_path, 'w') as f:
+                for record in records:
+                    f.write(json.dumps(record) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            os.replace(tmp_path, self._path)
+            self._records = len(records)
+            self._unsynced = 0
+        except OSError as e:
+            self._log.error('error compacting journal %s', str(e))
+
+
+# Retry state holds bytes and tuples, json keeps only lists,
+# so they are tagged.
+def _encode(value):
+    if isinstance(value, (bytes, bytearray)):
+        return {'__b': base64.b64encode(bytes(value)).decode('ascii')}
+    if isinstance(value, tuple):
+        return {'__t': [_encode(v) for v in value]}
+    if isinstance(value, list):
+        return [_encode(v) for v in value]
+    if isinstance(value, dict):
+        return {k: _encode(v) for k, v in value.items()}
+    return value
+
+
+def _decode(value):
+    if isinstance(value, list):
+        return [_decode(v) for v in value]
+    if isinstance(value, dict):
+        if '__b' in value:
+            return base64.b64decode(value['__b'])
+        if '__t' in value:
+            return tuple([_decode(v) for v in value['__t']])
+        return {k: _decode(v) for k, v in value.items()}
+    return value
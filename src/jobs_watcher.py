@@ -0,0 +1,277 @@
+from typing import Callable, Any, Dict, Set, Tuple, Optional
+from threading import Thread, Event
+import ctypes
+import ctypes.util
+import struct
+import select
+import errno
+import os
+import time
+import logging
+
+
+Path = str
+Seconds = float
+JobCallback = Callable[[str], Any]
+# (touched job names, removed job names)
+Changes = Tuple[Set[str], Set[str]]
+
+
+IN_MODIFY       = 0x00000002
+IN_ATTRIB       = 0x00000004
+IN_CLOSE_WRITE  = 0x00000008
+IN_MOVED_FROM   = 0x00000040
+IN_MOVED_TO     = 0x00000080
+IN_CREATE       = 0x00000100
+IN_DELETE       = 0x00000200
+IN_DELETE_SELF  = 0x00000400
+IN_Q_OVERFLOW   = 0x00004000
+IN_IGNORED      = 0x00008000
+IN_ONLYDIR      = 0x01000000
+IN_ISDIR        = 0x40000000
+IN_NONBLOCK     = 0o4000
+IN_CLOEXEC      = 0o2000000
+
+_ROOT_MASK = IN_CREATE | IN_MOVED_TO | IN_MOVED_FROM | IN_DELETE | IN_ONLYDIR
+_JOB_MASK = (IN_CREATE | IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO |
+             IN_MOVED_FROM | IN_ATTRIB | IN_DELETE | IN_ONLYDIR)
+_EVENT_HEADER = struct.Struct('iIII')
+
+
+def _is_job_name(name: str) -> bool:
+    return not name.startswith('.')
+
+
+def _job_complete(job_path: Path) -> bool:
+    return (os.path.isfile(os.path.join(job_path, '.lock')) and
+            os.path.isdir(os.path.join(job_path, 'data')))
+
+
+# Reports changes of job directories using inotify. Job directory
+# and its data directory are watched, so writes deep inside data
+# tree are not seen - jobs are expected to be moved in complete or
+# to be written from top. Queue overflow turns into rescan.
+class _InotifyBackend:
+
+    def __init__(self, jobs_path: Path):
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6',
+                           use_errno=True)
+        self._inotify_add_watch = libc.inotify_add_watch
+        self._inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p,
+                                            ctypes.c_uint32]
+        self._jobs_path = jobs_path
+        self._fd        = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self._watches   = {} # {wd: job name, '' for jobs_path}
+        self._add_watch(jobs_path, '', _ROOT_MASK)
+
+    def close(self):
+        os.close(self._fd)
+
+    def watch_job(self, name: str):
+        job_path = os.path.join(self._jobs_path, name)
+        self._add_watch(job_path, name, _JOB_MASK)
+        self._add_watch(os.path.join(job_path, 'data'), name, _JOB_MASK)
+
+    def wait(self, timeout: Seconds) -> Optional[Changes]:
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        if len(ready) == 0:
+            return set(), set()
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return set(), set()
+        touched = set()
+        removed = set()
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            wd, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            name = os.fsdecode(name)
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                return None
+            if mask & IN_IGNORED:
+                self._watches.pop(wd, None)
+                continue
+            job_name = self._watches.get(wd)
+            if job_name is None:
+                continue
+            if job_name != '':
+                touched.add(job_name)
+                if name == 'data' and mask & IN_ISDIR:
+                    self._add_watch(os.path.join(self._jobs_path,
+                                                 job_name, 'data'),
+                                    job_name, _JOB_MASK)
+                continue
+            if not _is_job_name(name):
+                continue
+            if mask & (IN_DELETE | IN_MOVED_FROM):
+                removed.add(name)
+            elif mask & IN_ISDIR:
+                touched.add(name)
+                self.watch_job(name)
+        return touched, removed
+
+    def _add_watch(self, path, job_name, mask):
+        wd = self._inotify_add_watch(self._fd, os.fsencode(path), mask)
+        if wd < 0:
+            err = ctypes.get_errno()
+            if err in (errno.ENOENT, errno.ENOTDIR):
+                return
+            raise OSError(err, 'inotify_add_watch failed for ' + path)
+        self._watches[wd] = job_name
+
+
+# Reports changes by comparing snapshots of jobs_path taken
+# every poll_interval, job is changed when inode or mtime of its
+# directory or data directory changes.
+class _PollingBackend:
+
+    def __init__(self, jobs_path: Path, poll_interval: Seconds):
+        self._jobs_path     = jobs_path
+        self._interval      = poll_interval
+        self._snapshot      = self._take_snapshot()
+
+    def close(self):
+        pass
+
+    def watch_job(self, name: str):
+        pass
+
+    def wait(self, timeout: Seconds) -> Optional[Changes]:
+        time.sleep(min(timeout, self._interval))
+        snapshot = self._take_snapshot()
+        touched = set([name for name, stamp in snapshot.items()
+                       if self._snapshot.get(name) != stamp])
+        removed = set(self._snapshot.keys()) - set(snapshot.keys())
+        self._snapshot = snapshot
+        return touched, removed
+
+    # -> {job name: (inode, mtime_ns, data mtime_ns)}
+    def _take_snapshot(self) -> Dict[str, Tuple[int, int, int]]:
+        snapshot = {}
+        try:
+            entries = list(os.scandir(self._jobs_path))
+        except OSError:
+            return snapshot
+        for entry in entries:
+            if not _is_job_name(entry.name):
+                continue
+            try:
+                if not entry.is_dir(follow_symlinks=True):
+                    continue
+                st = entry.stat(follow_symlinks=True)
+                try:
+                    data_mtime = os.stat(os.path.join(entry.path,
+                                                      'data')).st_mtime_ns
+                except OSError:
+                    data_mtime = 0
+            except OSError:
+                continue
+            snapshot[entry.name] = (st.st_ino, st.st_mtime_ns, data_mtime)
+        return snapshot
+
+
+# Discovers new job directories in jobs_path and reports every
+# job once, when it is complete (has .lock file and data directory)
+# and nothing changed in it for wait_time seconds. Jobs existing
+# when watcher starts are not reported. Uses inotify when available,
+# otherwise polls jobs_path.
+class JobsWatcher:
+
+    def __init__(self, jobs_path: Path, on_job: JobCallback,
+                 wait_time: Seconds = 5, poll_interval: Seconds = 1.0,
+                 use_inotify: bool = True):
+        self._log           = logging.getLogger('JobsWatcher')
+        self._jobs_path     = jobs_path
+        self._on_job        = on_job
+        self._wait_time     = max(0.0, float(wait_time))
+        self._poll_interval = poll_interval
+        self._use_inotify   = use_inotify
+        self._backend       = None
+        self._pending       = {} # {job name: time of last change}
+        self._reported      = set()
+        self._stopped       = Event()
+        self._thread        = Thread(name='JobsWatcher', target=self._run,
+                                     daemon=True)
+
+    @property
+    def uses_inotify(self) -> bool:
+        return isinstance(self._backend, _InotifyBackend)
+
+    def start(self):
+        self._backend = self._create_backend()
+        self._reported = set(self._list_jobs())
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout=5.0)
+
+    def _create_backend(self):
+        if self._use_inotify:
+            try:
+                return _InotifyBackend(self._jobs_path)
+            except (OSError, AttributeError) as e:
+                self._log.warning('inotify not available, polling: %s',
+                                  str(e))
+        return _PollingBackend(self._jobs_path, self._poll_interval)
+
+    def _list_jobs(self):
+        try:
+            return [e.name for e in os.scandir(self._jobs_path)
+                    if _is_job_name(e.name) and
+                       e.is_dir(follow_symlinks=True)]
+        except OSError as e:
+            self._log.error('error listing jobs %s', str(e))
+            return []
+
+    def _run(self):
+        self._log.info('watching %s', self._jobs_path)
+        while not self._stopped.is_set():
+            try:
+                changes = self._backend.wait(self._next_timeout())
+                if changes is None:
+                    self._log.warning('events lost, rescanning jobs')
+                    names = set(self._list_jobs())
+                    changes = (names - self._reported,
+                               self._reported - names)
+                self._process(changes, time.monotonic())
+            except Exception as e:
+                self._log.error('error watching jobs %s', str(e))
+                self._stopped.wait(self._poll_interval)
+        self._backend.close()
+        self._log.info('watcher stopped')
+
+    def _next_timeout(self):
+        if len(self._pending) == 0:
+            return self._poll_interval
+        deadline = min(self._pending.values()) + self._wait_time
+        return min(self._poll_interval,
+                   max(0.0, deadline - time.monotonic()))
+
+    def _process(self, changes: Changes, now: float):
+        touched, removed = changes
+        for name in removed:
+            self._pending.pop(name, None)
+            self._reported.discard(name)
+        for name in touched:
+            if name not in self._reported:
+                self._pending[name] = now
+        for name, changed in list(self._pending.items()):
+            if now - changed < self._wait_time:
+                continue
+            job_path = os.path.join(self._jobs_path, name)
+            if not os.path.isdir(job_path):
+                del self._pending[name]
+            elif _job_complete(job_path):
+                del self._pending[name]
+                self._reported.add(name)
+                self._log.info('new Job "%s"', name)
+                self._on_job(name)
+            else:
+                self._pending[name] = now
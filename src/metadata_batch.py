@@ -0,0 +1,77 @@
+from typing import List, Union, Optional
+from pydrive.drive import GoogleDrive
+from pydrive.files import ApiRequestError
+from googleapiclient.http import HttpRequest
+from googleapiclient.errors import HttpError
+from request_governor import RequestGovernor, governed
+from upload_errors import ErrorClass, classify_error
+import logging
+
+
+# Drive API accepts at most 100 calls in one batch request
+MAX_BATCH_CALLS = 100
+
+CallResult = Union[dict, Exception]
+
+
+# Sends metadata only calls (ex. inserts of folders and empty
+# files, metadata patches) as multipart batch requests of at most
+# max_calls calls. Results are returned in order of calls, failed
+# call gives its HttpError. Failure of whole batch is raised
+# (HttpError as ApiRequestError, like single call).
+# Batch is one request for governor, rate limited calls inside
+# it slow governor down as limited request would.
+class MetadataBatch:
+
+    def __init__(self, drive: GoogleDrive,
+                 max_calls: int = MAX_BATCH_CALLS,
+                 governor: Optional[RequestGovernor] = None):
+        self._log       = logging.getLogger('MetadataBatch')
+        self._drive     = drive
+        self._max_calls = min(MAX_BATCH_CALLS, max(1, max_calls))
+        self._governor  = governor
+
+    @property
+    def max_calls(self) -> int:
+        return self._max_calls
+
+    @property
+    def service(self):
+        auth = self._drive.auth
+        if auth.service is None:
+            auth.Authorize()
+        return auth.service
+
+    def insert(self, metadata: dict) -> HttpRequest:
+        return self.service.files().insert(body=metadata)
+
+    # -> [file resource or HttpError], one per call
+    def execute(self, calls: List[HttpRequest]) -> List[CallResult]:
+        results = []
+        for start in range(0, len(calls), self._max_calls):
+            chunk = calls[start:start + self._max_calls]
+            try:
+                results.extend(self._execute_chunk(chunk))
+            except HttpError as e:
+                raise ApiRequestError(e)
+        return results
+
+    def _execute_chunk(self, calls):
+        results = [None] * len(calls)
+
+        def call_done(request_id, response, error):
+            results[int(request_id)] = response if error is None else error
+
+        batch = self.service.new_batch_http_request(callback=call_done)
+        for i, call in enumerate(calls):
+            batch.add(call, request_id=str(i))
+        governed(self._governor, batch.execute,
+                 http=self._drive.auth.Get_Http_Object())
+        limited = [r for r in results if isinstance(r, Exception) and
+                   classify_error(r) == ErrorClass.rate_limit]
+        if len(limited) > 0 and self._governor is not None:
+            self._governor.on_rate_limited()
+        self._log.debug('batch of %d calls, %d failed', len(calls),
+                        len([r for r in results
+                             if isinstance(r, Exception)]))
+        return results
@@ -0,0 +1,135 @@
+from typing import Callable, Iterator, List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor, Future
+from threading import Lock
+import os
+import logging
+
+
+Path = str
+Size = int
+FileEntry = Tuple[Path, Size]
+EntryFilter = Callable[[os.DirEntry], bool]
+
+# replaced by benchmark to simulate slow network filesystems
+_scandir = os.scandir
+
+
+# Walks directory trees using bounded thread pool. Every directory
+# is read and its files are stat-ed by one pool task, subdirectories
+# are read ahead concurrently while results are returned in depth
+# first order with entries sorted by name, so output does not depend
+# on number of workers nor on filesystem order.
+# At most max_pending directories are read ahead, so memory stays
+# bounded on huge trees. One scanner can be shared by many walks.
+class ParallelScanner:
+
+    def __init__(self, workers: int = 4, max_pending: int = 256):
+        self._log           = logging.getLogger('ParallelScanner')
+        self._workers       = max(1, workers)
+        self._max_pending   = max(1, max_pending)
+        self._pool          = ThreadPoolExecutor(
+                                max_workers=self._workers,
+                                thread_name_prefix='ParallelScanner')
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False)
+
+    # -> (path, size) of regular files below path, symlinks are skipped
+    # entry_filter is called from pool threads, scan ends early when
+    # canceled returns True.
+    def scan(self, path: Path,
+             entry_filter: Optional[EntryFilter] = None,
+             canceled: Optional[Callable[[], bool]] = None
+             ) -> Iterator[FileEntry]:
+        walk = _Walk(self._pool, self._max_pending, entry_filter)
+        stack = [walk.submit(path)] # [Future or Path]
+        try:
+            while len(stack) > 0:
+                if canceled is not None and canceled():
+                    return
+                item = stack.pop()
+                if isinstance(item, Future):
+                    walk.consumed()
+                else:
+                    item = walk.submit(item)
+                    walk.consumed()
+                files, children = item.result()
+                for file_entry in files:
+                    yield file_entry
+                stack.extend(reversed(children))
+        finally:
+            walk.cancel()
+            for item in stack:
+                if isinstance(item, Future):
+                    item.cancel()
+
+    # -> sorted names of directories in path, symlinks to directories
+    # included
+    def list_dirs(self, path: Path) -> List[str]:
+        with _scandir(path) as entries:
+            names = sorted([e.name for e in entries])
+        chunk = max(1, len(names) // self._workers + 1)
+        chunks = [names[i:i + chunk] for i in range(0, len(names), chunk)]
+        futures = [self._pool.submit(_filter_dirs, path, c) for c in chunks]
+        result = []
+        for future in futures:
+            result.extend(future.result())
+        return result
+
+
+
+# Single walk of scan(). Directory task submits reads of its
+# subdirectories as soon as it finishes, so reading runs ahead of
+# consumer, until max_pending read directories wait for consumer.
+class _Walk:
+
+    def __init__(self, pool, max_pending, entry_filter):
+        self._pool          = pool
+        self._max_pending   = max_pending
+        self._filter        = entry_filter
+        self._lock          = Lock()
+        self._pending       = 0
+        self._canceled      = False
+
+    def submit(self, path: Path) -> Future:
+        with self._lock:
+            self._pending += 1
+        return self._pool.submit(self._read_dir, path)
+
+    def consumed(self):
+        with self._lock:
+            self._pending -= 1
+
+    def cancel(self):
+        with self._lock:
+            self._canceled = True
+
+    # -> ([FileEntry], [Future or Path]) of directory
+    def _read_dir(self, path):
+        files = []
+        dirs = []
+        with _scandir(path) as entries:
+            for entry in entries:
+                if self._filter is not None and not self._filter(entry):
+                    continue
+                if entry.is_symlink():
+                    continue
+                if entry.is_file(follow_symlinks=False):
+                    stat = entry.stat(follow_symlinks=False)
+                    files.append((entry.path, stat.st_size))
+                elif entry.is_dir(follow_symlinks=False):
+                    dirs.append(entry.path)
+        files.sort()
+        dirs.sort()
+        children = []
+        for dir_path in dirs:
+            with self._lock:
+                read_ahead = (not self._canceled and
+                              self._pending < self._max_pending)
+            children.append(self.submit(dir_path) if read_ahead 
+                            else dir_path)
+        return files, children
+
+
+def _filter_dirs(path: Path, names: List[str]) -> List[str]:
+    return [n for n in names if os.path.isdir(os.path.join(path, n))]
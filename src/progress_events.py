@@ -0,0 +1,109 @@
+from typing import Callable, Any, Tuple
+from threading import Thread, Lock, Event
+import logging
+import math
+import time
+
+
+Size = int
+# (files_done, size_done, files_total, size_total, bytes_per_sec)
+ProgressSnapshot = Tuple[int, Size, int, Size, float]
+ProgressSubscriber = Callable[[ProgressSnapshot], Any]
+
+
+# Delivers progress of all jobs to subscribers from its own thread.
+# Updates are coalesced, subscribers get only the latest snapshot
+# and at most max_rate_hz times per second, so slow subscribers
+# never block the supervisor. Throughput is exponentially weighted
+# moving average of uploaded bytes with time constant avg_seconds.
+class ProgressStream:
+
+    def __init__(self, max_rate_hz: float = 10.0, avg_seconds: float = 5.0):
+        self._log           = logging.getLogger('ProgressStream')
+        self._interval      = 1.0 / max_rate_hz if max_rate_hz > 0 else 0.0
+        self._avg_seconds   = max(0.001, avg_seconds)
+        self._lock          = Lock()
+        self._wakeup        = Event()
+        self._subscribers   = []
+        self._counters      = (0, 0, 0, 0)
+        self._uploaded      = 0 # bytes sent, never decreases
+        self._rate          = 0.0
+        self._rate_time     = None
+        self._rate_bytes    = 0
+        self._stopped       = False
+        self._thread        = Thread(name='ProgressStream',
+                                     target=self._run, daemon=True)
+
+    @property
+    def bytes_per_sec(self) -> float:
+        with self._lock:
+            return self._rate
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        with self._lock:
+            self._stopped = True
+        self._wakeup.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout=5.0)
+
+    def subscribe(self, subscriber: ProgressSubscriber):
+        with self._lock:
+            if subscriber not in self._subscribers:
+                self._subscribers.append(subscriber)
+
+    def unsubscribe(self, subscriber: ProgressSubscriber):
+        with self._lock:
+            if subscriber in self._subscribers:
+                self._subscribers.remove(subscriber)
+
+    # counters: (files_done, size_done, files_total, size_total)
+    # uploaded: total bytes sent so far
+    def update(self, counters: Tuple[int, Size, int, Size], uploaded: Size):
+        with self._lock:
+            self._counters = tuple(counters)
+            self._uploaded = max(self._uploaded, uploaded)
+        self._wakeup.set()
+
+    # -> latest snapshot, updates throughput estimate
+    def snapshot(self) -> ProgressSnapshot:
+        with self._lock:
+            self._update_rate(time.monotonic())
+            return self._counters + (self._rate,)
+
+    def _update_rate(self, now):
+        if self._rate_time is None:
+            self._rate_time = now
+            self._rate_bytes = self._uploaded
+            return
+        elapsed = now - self._rate_time
+        if elapsed <= 0.0:
+            return
+        rate = (self._uploaded - self._rate_bytes) / elapsed
+        alpha = 1.0 - math.exp(-elapsed / self._avg_seconds)
+        self._rate += alpha * (rate - self._rate)
+        self._rate_time = now
+        self._rate_bytes = self._uploaded
+
+    def _run(self):
+        while True:
+            # idle wakeups let throughput decay once uploads stop
+            updated = self._wakeup.wait(timeout=1.0)
+            self._wakeup.clear()
+            with self._lock:
+                if self._stopped:
+                    break
+                subscribers = list(self._subscribers)
+                idle = not updated and self._rate < 1.0
+            if len(subscribers) == 0 or idle:
+                continue
+            snapshot = self.snapshot()
+            for subscriber in subscribers:
+                try:
+                    subscriber(snapshot)
+                except Exception as e:
+                    self._log.error('error delivering progress %s', str(e))
+            if self._interval > 0.0:
+                time.sleep(self._interval)
@@ -0,0 +1,173 @@
+from typing import List
+from threading import Thread, Lock, Condition
+import itertools
+import os
+import shutil
+import logging
+
+
+Path = str
+
+RECLAIM_PREFIX = '.reclaim-'
+
+
+# Removes uploaded files and finished job trees on background
+# thread, so unlink latency of slow disks is not paid by jobs.
+# Files are unlinked in batches grouped by directory, every
+# directory is opened once and files are removed relative to its
+# descriptor (unlinkat). Tree is first renamed to hidden sibling
+# .reclaim-<name>-<n>, so it disappears for jobs at once, renamed
+# trees left by crash are removed by sweep().
+# Files are reclaimed only after they are written to journal, files
+# lost by crash are removed with data tree of finished job.
+class Reclaimer:
+
+    def __init__(self, batch_size: int = 256):
+        self._log           = logging.getLogger('Reclaimer')
+        self._batch_size    = max(1, batch_size)
+        self._cond          = Condition()
+        self._files         = [] # [Path]
+        self._trees         = [] # [Path]
+        self._busy          = False
+        self._stopped       = False
+        self._counter       = itertools.count()
+        self._stats_lock    = Lock()
+        self._removed       = 0
+        self._thread        = Thread(name='Reclaimer', target=self._run,
+                                     daemon=True)
+
+    def __len__(self):
+        with self._cond:
+            return len(self._files) + len(self._trees)
+
+    # -> number of files and trees removed
+    @property
+    def removed(self) -> int:
+        with self._stats_lock:
+            return self._removed
+
+    def start(self):
+        self._thread.start()
+
+    # Pending removals are finished before thread stops
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        if self._thread.is_alive():
+            self._thread.join(timeout=60.0)
+
+    def remove_file(self, path: Path):
+        with self._cond:
+            self._files.append(path)
+            self._cond.notify_all()
+
+    # Renames tree to reclaim marker before return, raises error
+    # of rename (ex. tree does not exist)
+    def remove_tree(self, path: Path):
+        path = os.path.abspath(path)
+        marker = os.path.join(os.path.dirname(path), '{}{}-{}'.format(
+                              RECLAIM_PREFIX, os.path.basename(path),
+                              next(self._counter)))
+        while os.path.lexists(marker):
+            marker = '{}-{}'.format(marker, next(self._counter))
+        os.rename(path, marker)
+        with self._cond:
+            self._trees.append(marker)
+            self._cond.notify_all()
+
+    # Blocks until queued removals are done
+    def flush(self, timeout: float = None) -> bool:
+        with self._cond:
+            return self._cond.wait_for(
+                lambda: (len(self._files) == 0 and len(self._trees) == 0
+                         and not self._busy), timeout)
+
+    # Queues reclaim markers in root and in its subdirectories
+    # (ex. data tree inside job directory), -> number of markers
+    def sweep(self, root: Path) -> int:
+        markers = []
+        try:
+            with os.scandir(root) as entries:
+                subdirs = []
+                for entry in entries:
+                    if entry.name.startswith(RECLAIM_PREFIX):
+                        markers.append(entry.path)
+                    elif entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.path)
+            for subdir in subdirs:
+                try:
+                    with os.scandir(subdir) as entries:
+                        markers.extend([e.path for e in entries
+                                        if e.name.startswith(RECLAIM_PREFIX)])
+                except OSError:
+                    pass
+        except OSError as e:
+            self._log.error('error sweeping %s: %s', root, str(e))
+        if len(markers) > 0:
+            self._log.info('reclaiming %d trees left by previous run',
+                           len(markers))
+            with self._cond:
+                self._trees.extend(markers)
+                self._cond.notify_all()
+        return len(markers)
+
+    def _take(self):
+        with self._cond:
+            self._busy = False
+            self._cond.notify_all()
+            while (len(self._files) == 0 and len(self._trees) == 0 and
+                   not self._stopped):
+                self._cond.wait()
+            if len(self._files) == 0 and len(self._trees) == 0:
+                return None, None
+            self._busy = True
+            files = self._files[:self._batch_size]
+            del self._files[:self._batch_size]
+            trees = []
+            # trees wait for queued files, they may be inside them
+            if len(self._files) == 0:
+                trees = self._trees
+                self._trees = []
+            return files, trees
+
+    def _run(self):
+        while True:
+            files, trees = self._take()
+            if files is None:
+                break
+            removed = self._unlink_batch(files)
+            for tree in trees:
+                shutil.rmtree(tree, ignore_errors=True)
+                if not os.path.lexists(tree):
+                    removed += 1
+                else:
+                    self._log.error('error removing tree %s', tree)
+            with self._stats_lock:
+                self._removed += removed
+
+    def _unlink_batch(self, files: List[Path]) -> int:
+        by_dir = {}
+        for path in files:
+            dir_path, name = os.path.split(path)
+            by_dir.setdefault(dir_path, []).append(name)
+        removed = 0
+        for dir_path, names in by_dir.items():
+            try:
+                dir_fd = os.open(dir_path, os.O_RDONLY | os.O_DIRECTORY)
+            except OSError:
+                continue # removed with its tree
+            try:
+                for name in names:
+                    try:
+                        os.unlink(name, dir_fd=dir_fd)
+                        removed += 1
+                    except FileNotFoundError:
+                        pass
+                    except OSError as e:
+                        self._log.error('error removing file %s: %s',
+                                        os.path.join(dir_path, name),
+                                        str(e))
+            finally:
+                os.close(dir_fd)
+        return removed
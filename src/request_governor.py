@@ -0,0 +1,159 @@
+from typing import Callable, Any, Optional
+from upload_errors import ErrorClass, classify_error
+from threading import Lock
+import time
+import logging
+
+
+RequestsPerSec = float
+Seconds = float
+
+
+# Token bucket shared by Drive API requests of all jobs.
+# Without rate (and max_rate) requests pass freely until first rate
+# limited response, then rate starts from request rate measured
+# before it multiplied by decrease. Rate is adjusted by AIMD: every
+# successful request adds increase/rate (about increase per second
+# at full speed), rate limited response (403 rateLimitExceeded, 429)
+# multiplies rate by decrease. Rate is decreased at most once per
+# cooldown, responses of requests sent before decrease report the
+# same limit. Bucket holds at most burst tokens, by default one
+# second of rate.
+class RequestGovernor:
+
+    def __init__(self, rate: Optional[RequestsPerSec] = None,
+                 min_rate: RequestsPerSec = 0.5,
+                 max_rate: Optional[RequestsPerSec] = None,
+                 increase: RequestsPerSec = 1.0,
+                 decrease: float = 0.5,
+                 burst: Optional[float] = None,
+                 cooldown: Seconds = 1.0):
+        self._log           = logging.getLogger('RequestGovernor')
+        self._min_rate      = max(0.01, min_rate)
+        self._max_rate      = max_rate
+        if max_rate is not None:
+            self._max_rate  = max(self._min_rate, max_rate)
+        if rate is None:
+            rate = self._max_rate
+        self._rate          = None # not limited
+        if rate is not None:
+            self._rate      = self._clamp(rate)
+        self._increase      = increase
+        self._decrease      = min(1.0, max(0.01, decrease))
+        self._burst         = burst
+        self._cooldown      = cooldown
+        self._lock          = Lock()
+        self._tokens        = 1.0
+        self._refilled      = time.monotonic()
+        self._decreased     = None
+        self._requests      = 0
+        self._limited       = 0
+        # request rate measured while not limited
+        self._window_start  = self._refilled
+        self._window_n      = 0
+        self._measured      = None
+
+    # -> None while requests are not limited
+    @property
+    def rate(self) -> Optional[RequestsPerSec]:
+        with self._lock:
+            return self._rate
+
+    # -> (requests, rate limited responses)
+    @property
+    def stats(self):
+        with self._lock:
+            return self._requests, self._limited
+
+    # Blocks until request may be sent
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if self._rate is None:
+                    self._requests += 1
+                    self._measure(now)
+                    return
+                self._refill(now)
+                if self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    self._requests += 1
+                    return
+                wait = (1.0 - self._tokens) / self._rate
+            time.sleep(wait)
+
+    def on_success(self):
+        with self._lock:
+            if self._rate is not None:
+                self._rate = self._clamp(self._rate + 
+                                         self._increase / self._rate)
+
+    def on_rate_limited(self):
+        with self._lock:
+            self._limited += 1
+            now = time.monotonic()
+            if (self._decreased is not None and
+                now - self._decreased < self._cooldown):
+                return
+            if self._rate is None:
+                self._rate = self._measured_rate(now)
+                self._refilled = now
+                self._tokens = 0.0
+            self._refill(now)
+            self._decreased = now
+            self._rate = self._clamp(self._rate * self._decrease)
+            self._tokens = min(self._tokens, self._capacity())
+            self._log.warning('rate limited, request rate %.2f/s',
+                              self._rate)
+
+    # Sends request func(*args, **kwargs) when bucket allows,
+    # its result adjusts rate, errors are raised to caller.
+    def call(self, func: Callable, *args, **kwargs) -> Any:
+        self.acquire()
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            if classify_error(e) == ErrorClass.rate_limit:
+                self.on_rate_limited()
+            raise
+        self.on_success()
+        return result
+
+    def _clamp(self, rate):
+        if self._max_rate is not None:
+            rate = min(self._max_rate, rate)
+        return max(self._min_rate, rate)
+
+    # Requests are counted in windows of one second
+    def _measure(self, now):
+        self._window_n += 1
+        elapsed = now - self._window_start
+        if elapsed >= 1.0:
+            self._measured = self._window_n / elapsed
+            self._window_start = now
+            self._window_n = 0
+
+    def _measured_rate(self, now):
+        elapsed = now - self._window_start
+        if self._measured is not None and elapsed < 1.0:
+            return self._measured
+        return self._window_n / max(0.1, elapsed)
+
+    def _capacity(self):
+        if self._burst is not None:
+            return max(1.0, self._burst)
+        return max(1.0, self._rate)
+
+    def _refill(self, now):
+        elapsed = max(0.0, now - self._refilled)
+        self._refilled = now
+        self._tokens = min(self._capacity(),
+                           self._tokens + elapsed * self._rate)
+
+
+# Sends request through governor or directly without one
+def governed(governor: Optional[RequestGovernor],
+             func: Callable, *args, **kwargs) -> Any:
+    if governor is None:
+        return func(*args, **kwargs)
+    return governor.call(func, *args, **kwargs)
@@ -0,0 +1,125 @@
+from typing import Callable, Any, Optional, Tuple
+from pydrive.drive import GoogleDrive
+from pydrive.files import ApiRequestError
+from googleapiclient.http import MediaFileUpload
+from googleapiclient.errors import HttpError
+from request_governor import RequestGovernor, governed
+import mimetypes
+import json
+import logging
+
+
+SessionUri = str
+Offset = int
+ResumePoint = Tuple[SessionUri, Offset]
+# (session_uri, committed_offset) -> Any
+ProgressCallback = Callable[[SessionUri, Offset], Any]
+
+
+# Google requires chunks to be multiple of 256 KB
+CHUNK_ALIGN = 256 * 1024
+DEFAULT_CHUNK_SIZE = 32 * CHUNK_ALIGN
+
+
+def align_chunk_size(chunk_size: int) -> int:
+    chunks = max(1, chunk_size // CHUNK_ALIGN)
+    return chunks * CHUNK_ALIGN
+
+
+# httplib2 follows 308 as redirect, in resumable upload it means
+# chunk committed (googleapiclient.http.build_http removes it too)
+def _without_308_redirect(http):
+    try:
+        http.redirect_codes = http.redirect_codes - {308}
+    except AttributeError:
+        pass
+    return http
+
+
+# Uploads one file to Google Drive in chunks using resumable
+# upload protocol (files.insert with uploadType=resumable).
+# After every committed chunk progress_callback is called with
+# session uri and committed offset, given back as resume_point
+# upload continues from that offset instead of starting over.
+# If remote session expired upload restarts from zero.
+class ResumableUpload:
+
+    def __init__(self, drive: GoogleDrive, path: str, metadata: dict,
+                 chunk_size: int = DEFAULT_CHUNK_SIZE,
+                 resume_point: Optional[ResumePoint] = None,
+                 progress_callback: Optional[ProgressCallback] = None,
+                 governor: Optional[RequestGovernor] = None):
+        self._log       = logging.getLogger('ResumableUpload')
+        self._drive     = drive
+        self._path      = path
+        self._metadata  = dict(metadata)
+        self._chunk_size= align_chunk_size(chunk_size)
+        self._resume    = resume_point
+        self._callback  = progress_callback
+        self._governor  = governor
+        if self._metadata.get('mimeType') is None:
+            mime_type, _ = mimetypes.guess_type(path)
+            self._metadata['mimeType'] = (mime_type or
+                                          'application/octet-stream')
+
+    # -> uploaded file metadata
+    def run(self) -> dict:
+        try:
+            return self._run_impl()
+        except HttpError as e:
+            raise ApiRequestError(e)
+
+    def _run_impl(self):
+        auth = self._drive.auth
+        if auth.service is None:
+            auth.Authorize()
+        http = _without_308_redirect(auth.Get_Http_Object())
+        media = MediaFileUpload(self._path,
+                                mimetype=self._metadata['mimeType'],
+                                chunksize=self._chunk_size,
+                                resumable=True)
+        try:
+            return self._upload(http, media)
+        finally:
+            media.stream().close()
+
+    def _upload(self, http, media):
+        service = self._drive.auth.service
+        request = service.files().insert(body=self._metadata,
+                                         media_body=media)
+        if self._resume is not None:
+            session_uri, _ = self._resume
+            resumed = governed(self._governor, self._query_offset, 
+                               http, session_uri, media.size())
+            if isinstance(resumed, dict):
+                return resumed
+            if resumed is not None:
+                self._log.info('resuming %s from offset %d',
+                               self._path, resumed)
+                request.resumable_uri = session_uri
+                request.resumable_progress = resumed
+        response = None
+        while response is None:
+            _, response = governed(self._governor, request.next_chunk, 
+                                   http=http)
+            if response is None and self._callback is not None:
+                self._callback(request.resumable_uri,
+                               request.resumable_progress)
+        return response
+
+    # -> committed offset, uploaded file metadata if upload
+    # was already finished or None if session is gone.
+    def _query_offset(self, http, session_uri, size):
+        headers = {'Content-Length': '0',
+                   'Content-Range': 'bytes */{}'.format(size)}
+        resp, content = http.request(session_uri, 'PUT', headers=headers)
+        if resp.status in [200, 201]:
+            return json.loads(content)
+        if resp.status == 308:
+            if 'range' not in resp:
+                return 0
+            return int(resp['range'].split('-')[1]) + 1
+        if resp.status in [404, 410]:
+            self._log.warning('upload session for %s expired', self._path)
+            return None
+        raise HttpError(resp, content, uri=session_uri)
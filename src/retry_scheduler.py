@@ -0,0 +1,144 @@
+from typing import Callable, Any, Hashable, Optional
+from threading import Thread, Condition
+import heapq
+import random
+import time
+import logging
+
+
+Seconds = float
+RetryCallback = Callable[[], Any]
+
+
+# Exponential backoff with jitter, delay of attempt n is
+# base * factor^n capped at max_seconds, of which jitter part is
+# random (0.5 is "equal jitter"), so jobs failed by same outage
+# do not come back at the same moment.
+class BackoffPolicy:
+
+    def __init__(self, base_seconds: Seconds = 30, factor: float = 2.0,
+                 max_seconds: Seconds = 30 * 60, jitter: float = 0.5):
+        self._base      = base_seconds
+        self._factor    = factor
+        self._max       = max_seconds
+        self._jitter    = min(1.0, max(0.0, jitter))
+
+    @property
+    def max_seconds(self) -> Seconds:
+        return self._max
+
+    # base overrides base_seconds, ex. delay proposed by state machine
+    def delay(self, attempt: int, base: Optional[Seconds] = None) -> Seconds:
+        base = self._base if base is None else base
+        exp = min(max(0, attempt), 64)
+        full = min(self._max, base * self._factor ** exp)
+        return full * (1.0 - self._jitter) + \
+               random.uniform(0.0, full * self._jitter)
+
+
+class RetryClass:
+    retry       = 'retry'       # job scheduled retry (lock, session, upload)
+    terminated  = 'terminated'  # job failed with unexpected error
+
+
+DEFAULT_RETRY_POLICIES = {
+    RetryClass.retry        : BackoffPolicy(30, 2.0, 30 * 60),
+    RetryClass.terminated   : BackoffPolicy(60, 2.0, 60 * 60)}
+
+
+# Single thread running all scheduled retries, pending retries are
+# kept in heap ordered by time. Scheduling retry with key already
+# scheduled replaces it. Callbacks run on scheduler thread and
+# should be short (ex. put event to queue).
+class RetryScheduler:
+
+    def __init__(self):
+        self._log       = logging.getLogger('RetryScheduler')
+        self._cond      = Condition()
+        self._heap      = [] # [(time, seq, key)]
+        self._entries   = {} # {key: (seq, RetryCallback)}
+        self._seq       = 0
+        self._stopped   = False
+        self._thread    = Thread(name='RetryScheduler', target=self._run,
+                                 daemon=True)
+
+    def __len__(self):
+        with self._cond:
+            return len(self._entries)
+
+    def __contains__(self, key: Hashable):
+        with self._cond:
+            return key in self._entries
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        if self._thread.is_alive():
+            self._thread.join(timeout=5.0)
+
+    def schedule(self, key: Hashable, delay: Seconds,
+                 callback: RetryCallback):
+        with self._cond:
+            self._seq += 1
+            self._entries[key] = (self._seq, callback)
+            heapq.heappush(self._heap,
+                           (time.monotonic() + delay, self._seq, key))
+            self._cond.notify()
+
+    # -> False if key was not scheduled
+    def cancel(self, key: Hashable) -> bool:
+        with self._cond:
+            return self._entries.pop(key, None) is not None
+
+    def clear(self):
+        with self._cond:
+            self._entries = {}
+            self._heap = []
+
+    # -> seconds until retry of key, None if not scheduled
+    def due_in(self, key: Hashable) -> Optional[Seconds]:
+        with self._cond:
+            if key not in self._entries:
+                return None
+            seq, _ = self._entries[key]
+            for when, item_seq, _ in self._heap:
+                if item_seq == seq:
+                    return max(0.0, when - time.monotonic())
+            return None
+
+    def _pop_due(self):
+        with self._cond:
+            while not self._stopped:
+                now = time.monotonic()
+                # canceled and replaced entries are dropped lazily
+                while len(self._heap) > 0:
+                    _, seq, key = self._heap[0]
+                    entry = self._entries.get(key)
+                    if entry is not None and entry[0] == seq:
+                        break
+                    heapq.heappop(self._heap)
+                if len(self._heap) == 0:
+                    self._cond.wait()
+                    continue
+                when, seq, key = self._heap[0]
+                if when > now:
+                    self._cond.wait(when - now)
+                    continue
+                heapq.heappop(self._heap)
+                _, callback = self._entries.pop(key)
+                return callback
+            return None
+
+    def _run(self):
+        while True:
+            callback = self._pop_due()
+            if callback is None:
+                break
+            try:
+                callback()
+            except Exception as e:
+                self._log.error('error running retry %s', str(e))
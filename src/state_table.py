@@ -0,0 +1,95 @@
+from typing import Callable, Dict, Any
+import logging as log
+
+
+StateName = str
+TransitionName = str
+
+
+class InvalidTransitionError(Exception):
+    pass
+
+
+# Transitions of workflow compiled to {source: target} dicts, one per
+# transition. Workflow is plain class with states, transitions
+# ((name, source or (sources), target), ...) and initial_state,
+# as in xworkflows.Workflow.
+class TransitionTable:
+
+    def __init__(self, workflow, name: str):
+        self.name           = name
+        self.states         = tuple([s for s, _ in workflow.states])
+        self.initial_state  = workflow.initial_state
+        self._targets       = {} # {TransitionName: {source: target}}
+        for transition, sources, target in workflow.transitions:
+            if isinstance(sources, str):
+                sources = (sources,)
+            targets = self._targets.setdefault(transition, {})
+            for source in sources + (target,):
+                if source not in self.states:
+                    raise ValueError('Unknown state {} of {}'.format(
+                                     source, transition))
+            for source in sources:
+                targets[source] = target
+
+    def targets(self, transition: TransitionName
+                ) -> Dict[StateName, StateName]:
+        if transition not in self._targets:
+            raise ValueError('Unknown transition {}'.format(transition))
+        return self._targets[transition]
+
+    # Like xworkflows transition is allowed only from its source
+    # states and state changes after implementation returned.
+    def compile(self, transition: TransitionName,
+                implementation: Callable) -> Callable:
+        targets = self.targets(transition)
+        name = self.name
+
+        def run(obj, *args, **kwargs):
+            source = obj._state
+            target = targets.get(source)
+            if target is None:
+                raise InvalidTransitionError(
+                    '{} transition <{}> not allowed from <{}>'.format(
+                    name, transition, source))
+            result = implementation(obj, *args, **kwargs)
+            obj._state = target
+            if log.root.isEnabledFor(log.DEBUG):
+                log.debug('%s transition <%s> from <%s> to <%s>',
+                          name, transition, source, target)
+            return result
+
+        run.__name__ = implementation.__name__
+        run.__doc__ = implementation.__doc__
+        return run
+
+
+# Marks method as implementation of transition
+def transition(name: TransitionName):
+
+    def mark(implementation):
+        implementation._transition = name
+        return implementation
+
+    return mark
+
+
+# Class decorator, compiles marked methods of class with transition
+# table of workflow. Instances keep state name in _state,
+# it is set to initial state by reset_state().
+def state_machine(workflow, name: str = None):
+
+    def compile_class(cls):
+        table = TransitionTable(workflow, name or cls.__name__)
+        for attr, value in list(cls.__dict__.items()):
+            transition_name = getattr(value, '_transition', None)
+            if transition_name is not None:
+                setattr(cls, attr, table.compile(transition_name, value))
+        cls._transitions_table = table
+        return cls
+
+    return compile_class
+
+
+def reset_state(obj: Any):
+    obj._state = obj._transitions_table.initial_state
@@ -0,0 +1,93 @@
+from typing import Optional
+from concurrent.futures import Future
+from threading import Thread, Lock, Event
+from datetime import datetime
+import logging
+
+
+Seconds = float
+
+
+# Keeps access token of auth shared by jobs valid.
+# Concurrent refresh requests are collapsed into one auth.Refresh()
+# call whose result all callers share, background thread refreshes
+# token refresh_margin seconds before it expires, so jobs rarely
+# find it expired at all.
+class TokenManager:
+
+    def __init__(self, auth, refresh_margin: Seconds = 5 * 60,
+                 check_interval: Seconds = 60):
+        self._log           = logging.getLogger('TokenManager')
+        self._auth          = auth
+        self._margin        = refresh_margin
+        self._interval      = check_interval
+        self._lock          = Lock()
+        self._in_flight     = None # Future of running refresh
+        self._refreshes     = 0
+        self._stopped       = Event()
+        self._thread        = Thread(name='TokenManager', target=self._run,
+                                     daemon=True)
+
+    @property
+    def refresh_count(self) -> int:
+        with self._lock:
+            return self._refreshes
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout=5.0)
+
+    # Refreshes expired token, raises error of refresh (ex. RefreshError)
+    def ensure_fresh(self):
+        if self._needs_refresh(0):
+            self._refresh()
+
+    # -> seconds until token expires, None if unknown
+    def expires_in(self) -> Optional[Seconds]:
+        credentials = getattr(self._auth, 'credentials', None)
+        expiry = getattr(credentials, 'token_expiry', None)
+        if not isinstance(expiry, datetime):
+            return None
+        return (expiry - datetime.utcnow()).total_seconds()
+
+    def _needs_refresh(self, margin):
+        if self._auth.access_token_expired:
+            return True
+        if margin <= 0:
+            return False
+        expires_in = self.expires_in()
+        return expires_in is not None and expires_in < margin
+
+    def _refresh(self):
+        with self._lock:
+            future = self._in_flight
+            owner = future is None
+            if owner:
+                future = Future()
+                self._in_flight = future
+        if owner:
+            try:
+                self._log.info('refreshing access token')
+                self._auth.Refresh()
+                with self._lock:
+                    self._refreshes += 1
+                future.set_result(None)
+            except Exception as e:
+                self._log.error('error refreshing access token %s', str(e))
+                future.set_exception(e)
+            finally:
+                with self._lock:
+                    self._in_flight = None
+        future.result()
+
+    def _run(self):
+        while not self._stopped.wait(self._interval):
+            try:
+                if self._needs_refresh(self._margin):
+                    self._refresh()
+            except Exception:
+                pass # logged by _refresh, jobs retry on demand
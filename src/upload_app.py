@@ -1,3 +1,5 @@
+from http_transport import install_shared_http
+from token_manager import TokenManager
 # ===
 
     def _start_supervisor(self):
@@ -9,18 +11,50 @@
             drive = GoogleDrive(auth)
             return drive
             
-        def create_gdrive_sync():
-            self._mutex.acquire()
-            try:
-                return create_gdrive()
-            finally:
-                self._mutex.release()
+        # All jobs share one drive whose requests go through
+        # pooled keep-alive connections and whose token is 
+        # refreshed by one token manager.
+        self._mutex.acquire()
+        try:
+            shared_drive = create_gdrive()
+        finally:
+            self._mutex.release()
+        install_shared_http(shared_drive.auth, 
+                            config.get('http_max_per_host', 8),
+                            config.get('http_max_idle', 16))
+        token_manager = TokenManager(shared_drive.auth)
         
         self._uploads_supervisor = UploadsSupervisor(
-                                        create_gdrive_sync(), 
+                                        lambda: shared_drive, 
                                         config['uploader_jobs_path'], 
                                         config['gdrive_dst_path'],
-                                        config['ignore_file_names'])
+                                        config['ignore_file_names'],
+                                        config.get('upload_workers', 1),
+                                        config.get('max_jobs', 4),
+                                        config.get('max_uploads', 8),
+                                        config.get('max_bytes_per_sec', 0),
+                                        dir_cache_path=config.get(
+                                            'gdrive_dirs_cache_path'),
+                                        journal_path=config.get(
+                                            'jobs_journal_path'),
+                                        jobs_wait_time=config.get(
+                                            'settings.monitoring.wait_time',
+                                            5),
+                                        dedup=config.get(
+                                            'dedup_uploads', False),
+                                        hash_index_path=config.get(
+                                            'hash_index_path'),
+                                        engine=config.get(
+                                            'upload_engine', 'threads'),
+                                        token_manager=token_manager,
+                                        govern_requests=config.get(
+                                            'govern_requests', False),
+                                        max_requests_per_sec=config.get(
+                                            'max_requests_per_sec', 0),
+                                        background_cleanup=config.get(
+                                            'background_cleanup', True),
+                                        metadata_batch_calls=config.get(
+                                            'metadata_batch_calls', 0))
                  
     def _authenticate(self, auth):
         if not auth.access_token_expired:
@@ -0,0 +1,102 @@
+from pydrive.files import ApiRequestError, FileNotUploadedError
+from googleapiclient.errors import HttpError
+from httplib2 import HttpLib2Error
+from pydrive.auth import RefreshError
+import socket
+
+
+ErrorClassT = str # Use ErrorClass (ex. ErrorClass.transient)
+
+
+class ErrorClass:
+    transient   = 'transient'   # network errors, 5xx, timeouts
+    rate_limit  = 'rate_limit'  # 429, 403 rate and quota limits
+    auth        = 'auth'        # 401, invalid or expired credentials
+    permanent   = 'permanent'   # other 4xx, request for file is rejected
+    local_io    = 'local_io'    # local file cannot be read
+    vanished    = 'vanished'    # local file removed after listing
+
+
+# What file upload state machine does with file failed with error class
+class FilePolicy:
+    retry       = 'retry'       # retried in place, job fails after retries
+    backoff     = 'backoff'     # retried in place without using retries
+    quarantine  = 'quarantine'  # skipped, retried by next job run
+    abort       = 'abort'       # job fails at once
+    drop        = 'drop'        # skipped and forgotten, job does not fail
+
+
+FILE_POLICIES = {
+    ErrorClass.transient    : FilePolicy.retry,
+    ErrorClass.rate_limit   : FilePolicy.backoff,
+    ErrorClass.auth         : FilePolicy.abort,
+    ErrorClass.permanent    : FilePolicy.quarantine,
+    ErrorClass.local_io     : FilePolicy.quarantine,
+    ErrorClass.vanished     : FilePolicy.drop}
+
+
+_RATE_LIMIT_REASONS = {'rateLimitExceeded', 'userRateLimitExceeded',
+                       'sharingRateLimitExceeded', 'dailyLimitExceeded',
+                       'quotaExceeded'}
+
+_LOCAL_IO_ERRORS = (PermissionError, IsADirectoryError, NotADirectoryError)
+
+
+# Errors of single file upload, others are bugs and fail whole job
+UPLOAD_ERRORS = (ApiRequestError, FileNotUploadedError, HttpError,
+                 HttpLib2Error, RefreshError, OSError)
+
+
+# -> ErrorClass of error raised by file upload,
+# unknown errors are transient
+def classify_error(error: BaseException) -> ErrorClassT:
+    if isinstance(error, ApiRequestError):
+        if len(error.args) > 0 and isinstance(error.args[0], HttpError):
+            return _classify_http_error(error.args[0])
+        return ErrorClass.transient
+    if isinstance(error, HttpError):
+        return _classify_http_error(error)
+    if isinstance(error, RefreshError):
+        return ErrorClass.auth
+    if isinstance(error, FileNotUploadedError):
+        return ErrorClass.permanent
+    if isinstance(error, (HttpLib2Error, socket.timeout, ConnectionError)):
+        return ErrorClass.transient
+    if isinstance(error, FileNotFoundError):
+        return ErrorClass.vanished
+    if isinstance(error, _LOCAL_IO_ERRORS):
+        return ErrorClass.local_io
+    if isinstance(error, OSError) and error.filename is not None:
+        return ErrorClass.local_io
+    return ErrorClass.transient
+
+
+def _classify_http_error(error: HttpError) -> ErrorClassT:
+    try:
+        status = int(error.resp.status)
+    except (AttributeError, TypeError, ValueError):
+        return ErrorClass.transient
+    if status == 429:
+        return ErrorClass.rate_limit
+    if status == 401:
+        return ErrorClass.auth
+    if status == 403:
+        if _reason(error) in _RATE_LIMIT_REASONS:
+            return ErrorClass.rate_limit
+        return ErrorClass.permanent
+    if status in [408, 409]:
+        return ErrorClass.transient
+    if 400 <= status < 500:
+        return ErrorClass.permanent
+    return ErrorClass.transient
+
+
+# -> reason of first error in Drive API error response, ex.
+# {"error": {"errors": [{"reason": "rateLimitExceeded"}], ...}}
+def _reason(error: HttpError):
+    details = getattr(error, 'error_details', None)
+    if isinstance(details, list) and len(details) > 0:
+        first = details[0]
+        if isinstance(first, dict):
+            return first.get('reason')
+    return None
@@ -0,0 +1,122 @@
+from typing import Callable, Any, Tuple, Optional
+from collections import deque
+from threading import Condition
+import heapq
+import time
+
+
+JobName = str
+State = Any
+Priority = int
+# (job_name, retry_state) -> Priority, lower starts first
+JobPriority = Callable[[JobName, State], Priority]
+
+
+# Queue of jobs waiting for a free job slot in UploadsSupervisor.
+# Jobs leave in FIFO order unless priority function is given,
+# jobs with equal priority still leave in FIFO order.
+# Not thread safe, used from supervisor thread only.
+class JobsQueue:
+
+    def __init__(self, priority: Optional[JobPriority] = None):
+        self._priority  = priority
+        self._heap      = []
+        self._names     = set()
+        self._counter   = 0
+
+    def __len__(self):
+        return len(self._heap)
+
+    def __contains__(self, job_name: JobName):
+        return job_name in self._names
+
+    def push(self, job_name: JobName, retry_state: State = None):
+        priority = 0
+        if self._priority is not None:
+            priority = self._priority(job_name, retry_state)
+        self._counter += 1
+        entry = (priority, self._counter, job_name, retry_state)
+        heapq.heappush(self._heap, entry)
+        self._names.add(job_name)
+
+    def pop(self) -> Tuple[JobName, State]:
+        _, _, job_name, retry_state = heapq.heappop(self._heap)
+        self._names.discard(job_name)
+        return job_name, retry_state
+
+    def clear(self):
+        self._heap = []
+        self._names = set()
+
+
+# Budget of in-flight file uploads shared by all jobs.
+# Free slots are handed out round robin between jobs waiting for
+# them, so job with many upload workers cannot starve other jobs.
+# Optional max_bytes_per_sec paces slot grants to keep total
+# upload rate around given value.
+# Thread safe, acquire() is called from job upload threads.
+class UploadSlots:
+
+    def __init__(self, max_uploads: int, max_bytes_per_sec: int = 0):
+        self._cond          = Condition()
+        self._free          = max(1, max_uploads)
+        self._bytes_per_sec = max(0, max_bytes_per_sec)
+        self._waiting       = {} # {JobName: waiting requests}
+        self._granted       = {} # {JobName: granted, not taken slots}
+        self._turns         = deque() # [JobName] round robin order
+        self._next_send     = 0.0
+        self._closed        = False
+
+    # Blocks until slot is given to job, returns False if closed.
+    def acquire(self, job_name: JobName, size: int = 0) -> bool:
+        with self._cond:
+            if self._closed:
+                return False
+            self._waiting[job_name] = self._waiting.get(job_name, 0) + 1
+            if self._waiting[job_name] == 1:
+                self._turns.append(job_name)
+            self._dispatch()
+            while self._granted.get(job_name, 0) == 0:
+                if self._closed:
+                    return False
+                self._cond.wait()
+            self._granted[job_name] -= 1
+            if self._granted[job_name] == 0:
+                del self._granted[job_name]
+            delay = self._reserve_bandwidth(size)
+        if delay > 0.0:
+            time.sleep(delay)
+        return True
+
+    def release(self, job_name: JobName):
+        with self._cond:
+            self._free += 1
+            self._dispatch()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def _dispatch(self):
+        granted_any = False
+        while self._free > 0 and len(self._turns) > 0:
+            job_name = self._turns.popleft()
+            self._free -= 1
+            self._granted[job_name] = self._granted.get(job_name, 0) + 1
+            self._waiting[job_name] -= 1
+            if self._waiting[job_name] > 0:
+                self._turns.append(job_name)
+            else:
+                del self._waiting[job_name]
+            granted_any = True
+        if granted_any:
+            self._cond.notify_all()
+
+    def _reserve_bandwidth(self, size):
+        if self._bytes_per_sec == 0 or size <= 0:
+            return 0.0
+        now = time.monotonic()
+        start = max(now, self._next_send)
+        self._next_send = start + float(size) / self._bytes_per_sec
+        return start - now
@@ -1,14 +1,25 @@
 from files_upload_job import FeedbackCommand as Command
 from files_upload_job import FilesUploadJob
-from typing import List, Callable, Tuple
+from async_upload_engine import AsyncUploadEngine, AsyncFilesUploadJob
+from upload_scheduler import JobsQueue, UploadSlots, JobPriority
+from gdrive_dir_cache import GDriveDirCache
+from job_journal import JobJournal
+from jobs_watcher import JobsWatcher
+from parallel_scanner import ParallelScanner
+from hash_index import HashIndex
+from token_manager import TokenManager
+from request_governor import RequestGovernor
+from reclaimer import Reclaimer
+from progress_events import ProgressStream, ProgressSubscriber
+from retry_scheduler import RetryScheduler, BackoffPolicy, RetryClass
+from retry_scheduler import DEFAULT_RETRY_POLICIES
+from typing import List, Callable, Tuple, Optional, Dict
 from pydrive.drive import GoogleDrive
 from queue import Queue
-from threading import Thread, Timer
+from threading import Thread
 from concurrent.futures import Future
 import logging
 from os.path import join as fs_join
-from functools import reduce
-import os
 
 
 PathExceptions = List[str]
@@ -17,6 +28,11 @@ Seconds = int
 GDriveFactory = Callable[[], GoogleDrive]
 
 
+class Engine:
+    threads = 'threads' # thread per job
+    asyncio = 'asyncio' # jobs multiplexed on AsyncUploadEngine
+
+
 class Events:
     scan_jobs           = 'scan_jobs'
     add_job             = 'add_job'
@@ -27,20 +43,86 @@ class Events:
     schedule_retry_job  = Command.schedule_retry
     release_job         = Command.release
     job_terminated      = Command.terminated
+    job_progress        = Command.progress
 
 
 class UploadsSupervisor:
     
     def __init__(self, gdrive_factory: GDriveFactory, 
                  jobs_path: Path, drive_dst_path: str,
-                 file_exceptions: PathExceptions = []):
+                 file_exceptions: PathExceptions = [],
+                 upload_workers: int = 1,
+                 max_jobs: int = 4,
+                 max_uploads: int = 8,
+                 max_bytes_per_sec: int = 0,
+                 job_priority: Optional[JobPriority] = None,
+                 dir_cache_path: Optional[Path] = None,
+                 progress_rate_hz: float = 10.0,
+                 journal_path: Optional[Path] = None,
+                 jobs_wait_time: Seconds = 5,
+                 watch_jobs: bool = True,
+                 scan_workers: int = 4,
+                 dedup: bool = False,
+                 hash_index_path: Optional[Path] = None,
+                 engine: str = Engine.threads,
+                 token_manager: Optional[TokenManager] = None,
+                 retry_policies: Optional[Dict[str, BackoffPolicy]] = None,
+                 govern_requests: bool = False,
+                 max_requests_per_sec: float = 0,
+                 background_cleanup: bool = True,
+                 metadata_batch_calls: int = 0):
         self._gdrive_factory    = gdrive_factory
         self._jobs_path         = jobs_path
         self._drive_dst_path    = drive_dst_path
         self._file_exceptions   = file_exceptions
+        self._upload_workers    = upload_workers
+        self._dedup             = dedup
+        self._hash_index        = None
+        if dedup:
+            self._hash_index    = HashIndex(hash_index_path)
         self._jobs              = {}
+        self._max_jobs          = max(1, max_jobs)
+        self._pending_jobs      = JobsQueue(job_priority)
+        self._upload_slots      = UploadSlots(max_uploads, 
+                                              max_bytes_per_sec)
+        self._gdirs_cache       = GDriveDirCache(dir_cache_path)
+        self._journal           = JobJournal(journal_path)
+        self._scanner           = ParallelScanner(scan_workers)
+        self._jobs_watcher      = None
+        if watch_jobs:
+            self._jobs_watcher  = JobsWatcher(jobs_path, self.add_job, 
+                                              jobs_wait_time)
+        self._token_manager     = token_manager
+        # Drive API requests of all jobs are slowed down after rate
+        # limited responses, max_requests_per_sec 0 means no cap
+        self._governor          = None
+        if govern_requests:
+            self._governor      = RequestGovernor(
+                                    max_rate=max_requests_per_sec or None)
+        # uploaded files and finished jobs are removed in background,
+        # only with journal, files queued for removal are lost by crash
+        # and journal keeps them from being uploaded again
+        self._reclaimer         = None
+        if background_cleanup and journal_path is not None:
+            self._reclaimer     = Reclaimer()
+        # 0 sends every metadata only call as own request
+        self._batch_calls       = metadata_batch_calls
+        self._async_engine      = None
+        if engine == Engine.asyncio:
+            self._async_engine  = AsyncUploadEngine(
+                                    upload_workers=max_uploads)
+        elif engine != Engine.threads:
+            raise ValueError('Unknown engine {}'.format(engine))
         self._scheduled_jobs    = {}
-        self._scheduled_timers  = {}
+        self._retry_scheduler   = RetryScheduler()
+        self._retry_policies    = dict(DEFAULT_RETRY_POLICIES)
+        self._retry_policies.update(retry_policies or {})
+        self._retry_attempts    = {} # {job_name: failed attempts in row}
+        # (files_done, size_done, files_total, size_total)
+        self._jobs_counters     = {} # {job_name: [counters]}
+        self._total_counters    = [0, 0, 0, 0]
+        self._uploaded_bytes    = 0
+        self._progress_stream   = ProgressStream(progress_rate_hz)
         self._events_queue      = Queue()
         self._log               = logging.getLogger('UploadsSupervisor')
         self._thread            = Thread(name='UploadsSupervisor', 
@@ -55,15 +137,38 @@ class UploadsSupervisor:
             Events.schedule_retry_job   : self._schedule_retry_job_impl,
             Events.release_job          : self._release_job_impl,
             Events.job_terminated       : self._job_terminated_impl,
+            Events.job_progress         : self._job_progress_impl,
             Events.get_jobs_n           : self._get_jobs_n_impl}
 
+    # Jobs found at start are scanned once, new jobs are reported 
+    # by watcher.
     def start(self):
+        self._progress_stream.start()
+        self._retry_scheduler.start()
+        if self._reclaimer is not None:
+            self._reclaimer.start()
+        if self._async_engine is not None:
+            self._async_engine.start()
+        if self._token_manager is not None:
+            self._token_manager.start()
         self._thread.start()
+        if self._jobs_watcher is not None:
+            self._jobs_watcher.start()
         self._events_queue.put((Events.scan_jobs, None), timeout=5)
         
     def stop(self):
+        if self._jobs_watcher is not None:
+            self._jobs_watcher.stop()
         self._events_queue.put((Events.stop_all, None), timeout=5)
         self._thread.join(timeout=150.0)
+        self._progress_stream.stop()
+        self._retry_scheduler.stop()
+        if self._reclaimer is not None:
+            self._reclaimer.stop()
+        if self._async_engine is not None:
+            self._async_engine.stop()
+        if self._token_manager is not None:
+            self._token_manager.stop()
         
     def add_job(self, job: str):
         self._events_queue.put((Events.add_job, job), timeout=5)
@@ -74,6 +179,22 @@ class UploadsSupervisor:
         self._events_queue.put((Events.get_progress, future), timeout=5)
         return future.result(timeout=5)
         
+    # subscriber is called from separate thread with
+    # (files_done, size_done, files_total, size_total, bytes_per_sec)
+    # at most progress_rate_hz times per second
+    def subscribe_progress(self, subscriber: ProgressSubscriber):
+        self._progress_stream.subscribe(subscriber)
+        
+    def unsubscribe_progress(self, subscriber: ProgressSubscriber):
+        self._progress_stream.unsubscribe(subscriber)
+        
+    # -> current Drive API requests per second, None if not limited
+    @property
+    def request_rate(self) -> Optional[float]:
+        if self._governor is None:
+            return None
+        return self._governor.rate
+        
     def get_jobs_number(self) -> int:
         future = Future()
         self._events_queue.put((Events.get_jobs_n, future), timeout=5)
@@ -83,16 +204,29 @@ class UploadsSupervisor:
         self._events_queue.put((Events.scan_jobs, None), timeout=5)
     
     def _scan_jobs_impl(self, _1, _2):
-        entries = os.scandir(self._jobs_path)
-        dirs = [f for f in entries if f.is_dir(follow_symlinks=True)]
-        for dir_entry in dirs:
-            if self._has_job(dir_entry.name):
+        # hidden dirs are not jobs (ex. job trees being reclaimed)
+        names = [n for n in self._scanner.list_dirs(self._jobs_path)
+                 if not n.startswith('.')]
+        for job_name in names:
+            if self._has_job(job_name):
                 continue
-            self.add_job(dir_entry.name)
+            self.add_job(job_name)
+        names = set(names)
+        for job_name in self._journal.jobs() - names:
+            if not self._has_job(job_name):
+                self._journal.job_done(job_name)
         
+    # Job interrupted by restart continues from its last retry state.
     def _add_job_impl(self, _, job_name):
         self._log.info('trying to add new Job "%s"', str(job_name))
-        self._create_job(job_name)
+        retry_state = None
+        checkpoint = self._journal.checkpoint(job_name)
+        if checkpoint is not None and not self._has_job(job_name):
+            retry_state = checkpoint.state
+            if retry_state is not None:
+                self._log.info('Job "%s" resumed from journal', 
+                               str(job_name))
+        self._create_job(job_name, retry_state)
         
     def _retry_job_impl(self, _, job_name):
         if job_name not in self._scheduled_jobs:
@@ -100,8 +234,7 @@ class UploadsSupervisor:
             return
         retry_state = self._scheduled_jobs[job_name]
         del self._scheduled_jobs[job_name]
-        if job_name in self._scheduled_timers:
-            del self._scheduled_timers[job_name]
+        self._retry_scheduler.cancel(job_name)
         self._log.info('retrying Job "%s"', str(job_name))
         self._create_job(job_name, retry_state)
         
@@ -109,17 +242,52 @@ class UploadsSupervisor:
         if self._has_job(job_name):
             self._log.warning('Job "%s" already exists', str(job_name))
             return
+        if len(self._jobs) >= self._max_jobs:
+            self._log.info('Job "%s" queued, %d jobs running', 
+                           str(job_name), len(self._jobs))
+            self._pending_jobs.push(job_name, retry_state)
+            return
+        self._start_job(job_name, retry_state)
+        
+    def _start_pending_jobs(self):
+        while (len(self._pending_jobs) > 0 and 
+               len(self._jobs) < self._max_jobs):
+            job_name, retry_state = self._pending_jobs.pop()
+            self._start_job(job_name, retry_state)
+        
+    def _start_job(self, job_name, retry_state):
         
         def job_callback(event, data):
             self._events_queue.put((event, (job_name, data)), timeout=5)
+            
+        def progress_callback(delta):
+            self._events_queue.put((Events.job_progress, (job_name, delta)), 
+                                   timeout=5)
         
-        job = FilesUploadJob(drive=self._gdrive_factory(), 
-                             job_id=job_name,
-                             local_src_path=fs_join(self._jobs_path, job_name), 
-                             drive_dst_path=self._drive_dst_path,
-                             feedback_callback=job_callback,
-                             file_exceptions=self._file_exceptions)
+        job_args = dict(drive=self._gdrive_factory(), 
+                        job_id=job_name,
+                        local_src_path=fs_join(self._jobs_path, job_name), 
+                        drive_dst_path=self._drive_dst_path,
+                        feedback_callback=job_callback,
+                        file_exceptions=self._file_exceptions,
+                        upload_workers=self._upload_workers,
+                        upload_slots=self._upload_slots,
+                        gdirs_cache=self._gdirs_cache,
+                        progress_callback=progress_callback,
+                        journal=self._journal,
+                        scanner=self._scanner,
+                        dedup=self._dedup,
+                        hash_index=self._hash_index,
+                        token_manager=self._token_manager,
+                        governor=self._governor,
+                        reclaimer=self._reclaimer,
+                        batch_calls=self._batch_calls)
+        if self._async_engine is None:
+            job = FilesUploadJob(**job_args)
+        else:
+            job = AsyncFilesUploadJob(self._async_engine, **job_args)
         self._jobs[job_name] = job
+        self._jobs_counters[job_name] = [0, 0, 0, 0]
         if retry_state is None:
             job.start()
         else:
@@ -129,15 +297,23 @@ class UploadsSupervisor:
     def _stop_all_impl(self, _1, _2):
         self._log.info('stopping all')
         self._scheduled_jobs = {}
-        for _, timer in self._scheduled_timers.items():
-            timer.cancel()
-        self._scheduled_timers = {}
+        self._pending_jobs.clear()
+        self._upload_slots.close()
+        self._retry_scheduler.clear()
+        self._retry_attempts = {}
         for _, job in self._jobs.items():
             job.stop()
         self._jobs = {}
+        self._jobs_counters = {}
+        self._total_counters = [0, 0, 0, 0]
+        self._gdirs_cache.save(force=True)
+        self._journal.close()
+        self._scanner.shutdown()
+        if self._hash_index is not None:
+            self._hash_index.close()
         
     def _get_jobs_n_impl(self, _, promise):
-        promise.set_result(len(self._jobs))
+        promise.set_result(len(self._jobs) + len(self._pending_jobs))
         
     def _get_progress_impl(self, _, promise):
         try:
@@ -145,6 +321,8 @@ class UploadsSupervisor:
         except Exception as e:
             promise.set_exception(e)
         
+    # Totals are updated by job progress deltas, so reporting
+    # does not depend on number of jobs.
     def _rep_progress_impl(self):
         if len(self._jobs) == 0:
             return 0.0, 0.0
@@ -154,58 +332,87 @@ class UploadsSupervisor:
                 return 0.0
             return val/denom
             
-        # ((progress_files, progress_size), (total_files, total_size))
-        progress_totals = [(job.progress, job.total) 
-                           for _, job in self._jobs.items()]
-        progresses, totals = map(list, zip(*progress_totals))
-        progress_files, progress_size = map(list, zip(*progresses))
-        total_files_l, total_size_l = map(list, zip(*totals))
-        total_files = reduce(lambda x, y: x + y, total_files_l, 0.0)
-        total_size = reduce(lambda x, y: x + y, total_size_l, 0.0)
-        files_mul = [div_ign(float(val), total_files) for val in total_files_l]
-        size_mul = [div_ign(float(val), total_size) for val in total_size_l]
-        progress_files_adj = [val*mul for val, mul in 
-                              list(zip(progress_files, files_mul))]
-        progress_size_adj = [val*mul for val, mul in 
-                             list(zip(progress_size, size_mul))]
-        res_files = reduce(lambda x, y: x + y, progress_files_adj, 0.0)
-        res_size = reduce(lambda x, y: x + y, progress_size_adj, 0.0)
-        return res_files, res_size
+        files_done, size_done, files_total, size_total = self._total_counters
+        return (div_ign(float(files_done), files_total), 
+                div_ign(float(size_done), size_total))
+        
+    def _job_progress_impl(self, _, data):
+        job_name, delta = data
+        if job_name not in self._jobs_counters:
+            return
+        counters = self._jobs_counters[job_name]
+        for i, val in enumerate(delta):
+            counters[i] += val
+            self._total_counters[i] += val
+        self._uploaded_bytes += max(0, delta[1])
+        self._progress_stream.update(self._total_counters, 
+                                     self._uploaded_bytes)
+            
+    def _drop_job_counters(self, job_name):
+        if job_name not in self._jobs_counters:
+            return
+        counters = self._jobs_counters.pop(job_name)
+        for i, val in enumerate(counters):
+            self._total_counters[i] -= val
+        self._progress_stream.update(self._total_counters, 
+                                     self._uploaded_bytes)
         
+    # Delay proposed by job is base of backoff, it grows with
+    # failed attempts in row, so short outage costs seconds and long
+    # one does not make jobs retry too often.
     def _schedule_retry_job_impl(self, _, data):
         job_name, sched_data = data
-        self._log.info('scheduling retry for Job "%s"', str(job_name))
         seconds, state = sched_data
+        self._schedule_retry(job_name, state, RetryClass.retry, seconds)
+        
+    def _schedule_retry(self, job_name, state, retry_class, seconds=None):
         
         def retry_job():
             self._events_queue.put((Events.retry_job, job_name), timeout=5)
         
+        attempt = self._retry_attempts.get(job_name, 0)
+        policy = self._retry_policies[retry_class]
+        delay = policy.delay(attempt, seconds)
+        self._retry_attempts[job_name] = attempt + 1
+        self._log.info('scheduling retry for Job "%s" in %.1f s, attempt %d', 
+                       str(job_name), delay, attempt + 1)
         self._scheduled_jobs[job_name] = state
-        timer = Timer(float(seconds), retry_job)
-        self._scheduled_timers[job_name] = timer
-        timer.start()
+        self._retry_scheduler.schedule(job_name, delay, retry_job)
         
+    # Job releases itself after scheduling retry too,
+    # only release without retry scheduled ends failures in row.
     def _release_job_impl(self, _, data):
         job_name, _ = data
         self._log.info('releasing Job "%s"', str(job_name))
         if job_name in self._jobs:
             del self._jobs[job_name]
+        if job_name not in self._scheduled_jobs:
+            self._retry_attempts.pop(job_name, None)
+        self._drop_job_counters(job_name)
+        self._gdirs_cache.save()
+        self._start_pending_jobs()
         
     def _job_terminated_impl(self, _, data):
         job_name, _ = data
         self._log.error('Job "%s" terminated', str(job_name))
         if job_name in self._jobs:
             del self._jobs[job_name]
-        self._schedule_retry_job_impl(Events.schedule_retry_job, 
-                                      (job_name, (30 * 60, None)))
+        self._drop_job_counters(job_name)
+        self._schedule_retry(job_name, None, RetryClass.terminated)
+        self._start_pending_jobs()
         
     def _has_job(self, job_name):
         in_jobs = job_name in self._jobs
         in_scheduled = job_name in self._scheduled_jobs
-        return in_jobs or in_scheduled
+        in_pending = job_name in self._pending_jobs
+        return in_jobs or in_scheduled or in_pending
     
     def _run(self):
         self._log.info('UploadsSupervisor started')
+        self._gdirs_cache.load()
+        self._journal.load()
+        if self._reclaimer is not None:
+            self._reclaimer.sweep(self._jobs_path)
         while True:
             event = None
             try:
@@ -218,7 +425,10 @@ class UploadsSupervisor:
         self._log.info('UploadsSupervisor finished')
         
     def _process_event(self, event, data):
-        self._log.info('processing event %s with data <%s>', str(event), str(data))
+        # progress comes with almost every uploaded file
+        level = logging.DEBUG if event == Events.job_progress else logging.INFO
+        self._log.log(level, 'processing event %s with data <%s>', 
+                      event, data)
         if event not in self._event_handlers:
             self._log.error('unknown event %s', str(event))
             return
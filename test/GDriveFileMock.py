@@ -27,6 +27,9 @@ class GDriveFileMock:
             raise RuntimeError('Unexpected key {}'.format(key))
         return self.__dict_items[key]
 
+    def get(self, key, default=None):
+        return self.__dict_items.get(key, default)
+
     def set_item(self, key, value):
         self.__dict_items[key] = value
         
@@ -0,0 +1,49 @@
+from unittest.mock import Mock, MagicMock
+from googleapiclient.errors import HttpError
+import httplib2
+import itertools
+
+
+class BatchMock:
+
+    def __init__(self, service, callback):
+        self._service = service
+        self._callback = callback
+        self._calls = []
+        #self.execute = (http: opt) -> void <raise HttpError>
+        self.execute = MagicMock()
+        self.execute.side_effect = self._execute
+
+    def add(self, call, request_id=None):
+        self._calls.append((request_id, call))
+
+    def _execute(self, *args, **kwargs):
+        self._service.batches.append([body for _, body in self._calls])
+        for request_id, body in self._calls:
+            status = self._service.fail_titles.get(body.get('title'))
+            if status is None:
+                response = dict(body)
+                response['id'] = 'id{}'.format(next(self._service.ids))
+                self._callback(request_id, response, None)
+            else:
+                error = HttpError(httplib2.Response({'status': status}),
+                                  b'{}')
+                self._callback(request_id, None, error)
+
+
+# Drive service (auth.service) with files().insert() and batches.
+# Inserts are answered with body and new id, titles in
+# fail_titles fail with given HTTP status.
+class GServiceMock:
+
+    def __init__(self):
+        self.batches = [] # [[body]] of executed batches
+        self.fail_titles = {} # {title: status}
+        self.ids = itertools.count(1)
+        #self.files = () -> files resource, insert(body) -> body
+        self.files = MagicMock()
+        self.files.return_value.insert.side_effect = \
+            lambda body=None, **kwargs: body
+
+    def new_batch_http_request(self, callback=None):
+        return BatchMock(self, callback)
@@ -7,6 +7,26 @@ sys.path.append('../src')
 from test_file_uploader_sub_sm import *
 from test_file_uploader import *
 from test_file_upload_job import *
+from test_upload_scheduler import *
+from test_gdrive_dirs import *
+from test_gdrive_dir_cache import *
+from test_file_table import *
+from test_uploads_supervisor import *
+from test_progress_events import *
+from test_job_journal import *
+from test_jobs_watcher import *
+from test_parallel_scanner import *
+from test_hash_index import *
+from test_async_upload_engine import *
+from test_http_transport import *
+from test_token_manager import *
+from test_retry_scheduler import *
+from test_upload_errors import *
+from test_request_governor import *
+from test_state_table import *
+from test_reclaimer import *
+from test_metadata_batch import *
+from test_resumable_upload import *
 
 
 logger = logging.getLogger()
@@ -0,0 +1,134 @@
+import unittest
+from async_upload_engine import AsyncUploadEngine, AsyncFilesUploadJob
+from files_upload_job import FeedbackCommand, AsyncEvent
+from upload_errors import ErrorClass
+from retry_scheduler import BackoffPolicy
+from parallel_scanner import ParallelScanner
+from GDriveMock import GDriveMock
+from GAuthMock import GAuthMock
+from pydrive.files import ApiRequestError
+from threading import Lock, Event
+import threading
+import logging as log
+import tempfile
+import time
+import shutil
+import os
+
+
+class TestAsyncUploadEngine(unittest.TestCase):
+
+    def setUp(self):
+        log.info('\n\nTest TestAsyncUploadEngine.%s started', 
+                 self._testMethodName)
+        self._dir = tempfile.mkdtemp()
+        self._lock = Lock()
+        self._finished = {}
+        self._all_done = Event()
+        self._jobs_n = 0
+
+    def tearDown(self):
+        shutil.rmtree(self._dir, ignore_errors=True)
+
+    def _create_job_dir(self, job_id, files=3):
+        job_dir = os.path.join(self._dir, job_id)
+        data_dir = os.path.join(job_dir, 'data')
+        os.makedirs(os.path.join(data_dir, 'photos'))
+        open(os.path.join(job_dir, '.lock'), 'w').close()
+        for i in range(files):
+            sub_dir = data_dir if i % 2 == 0 else os.path.join(data_dir, 
+                                                               'photos')
+            with open(os.path.join(sub_dir, 'file{}.txt'.format(i)), 
+                      'w') as f:
+                f.write('x' * (i + 1))
+        return job_dir
+
+    def _callback(self, job_id):
+        
+        def callback(cmd, data):
+            if cmd == FeedbackCommand.schedule_retry:
+                return
+            with self._lock:
+                self._finished[job_id] = cmd
+                if len(self._finished) == self._jobs_n:
+                    self._all_done.set()
+                    
+        return callback
+
+    def _run_jobs(self, jobs_n, drive_factory=None):
+        self._jobs_n = jobs_n
+        engine = AsyncUploadEngine(io_workers=2, upload_workers=3)
+        engine.start()
+        scanner = ParallelScanner(workers=2)
+        threads_before = threading.active_count()
+        jobs = []
+        for i in range(jobs_n):
+            job_id = 'job{}'.format(i)
+            job_dir = self._create_job_dir(job_id)
+            drive = GDriveMock(GAuthMock())
+            if drive_factory is not None:
+                drive = drive_factory()
+            job = AsyncFilesUploadJob(engine, drive, job_id, job_dir, 
+                                      '/dst', self._callback(job_id), 
+                                      upload_workers=2, scanner=scanner)
+            job.start()
+            jobs.append(job)
+        self.assertTrue(self._all_done.wait(timeout=30.0))
+        threads_during = threading.active_count()
+        engine.stop()
+        scanner.shutdown()
+        return jobs, threads_during - threads_before
+
+    def test_many_jobs(self):
+        jobs, new_threads = self._run_jobs(40)
+        self.assertEqual(set(self._finished.values()), 
+                         set([FeedbackCommand.release]))
+        self.assertEqual(os.listdir(self._dir), [])
+        for job in jobs:
+            self.assertEqual(job.progress, (1.0, 1.0))
+        self.assertTrue(new_threads <= 2 + 3 + 2)
+
+    def test_upload_error_retry(self):
+        
+        def failing_drive():
+            drive = GDriveMock(GAuthMock())
+            create_file = drive.CreateFile.side_effect
+            
+            def create_failing(metadata):
+                gfile = create_file(metadata)
+                if 'mimeType' not in metadata:
+                    gfile.Upload.side_effect = ApiRequestError(
+                                                    'upload failed')
+                return gfile
+                
+            drive.CreateFile.side_effect = create_failing
+            return drive
+            
+        self._run_jobs(3, failing_drive)
+        self.assertEqual(set(self._finished.values()), 
+                         set([FeedbackCommand.release]))
+        self.assertEqual(len(os.listdir(self._dir)), 3)
+
+    def test_engine_executors(self):
+        engine = AsyncUploadEngine(io_workers=1, upload_workers=1)
+        engine.start()
+        self.addCleanup(engine.stop)
+        scanner = ParallelScanner(workers=1)
+        self.addCleanup(scanner.shutdown)
+        job = AsyncFilesUploadJob(engine, GDriveMock(GAuthMock()), 'job0', 
+                                  self._create_job_dir('job0'), '/dst', 
+                                  self._callback('job0'), dedup=True, 
+                                  scanner=scanner)
+        self.assertIs(job._uploads_pool, engine.upload_executor)
+        self.assertIs(job._hash_pool, engine.hash_executor)
+        job._rate_backoff = BackoffPolicy(0.3, 2.0, 0.3, jitter=0.0)
+        started = time.monotonic()
+        result, delay = job._rate_limit_backoff()
+        self.assertEqual(result, ErrorClass.rate_limit)
+        event = (AsyncEvent.upload_done, 'file0.txt', result)
+        engine.upload_executor.submit(job._put_events_after, delay, 
+                                      [event]).result(timeout=1.0)
+        self.assertLess(time.monotonic() - started, 0.2)
+        received = engine.spawn(job._async_events.get(timeout=2.0))
+        self.assertEqual(received.result(timeout=3.0), event)
+        self.assertGreaterEqual(time.monotonic() - started, 0.25)
@@ -0,0 +1,70 @@
+import unittest
+from file_table import FileTable, IndexQueue
+import logging as log
+
+
+class TestFileTable(unittest.TestCase):
+
+    def setUp(self):
+        log.info('\n\nTest TestFileTable.%s started', self._testMethodName)
+
+    def test_add(self):
+        obj = FileTable()
+        self.assertEqual(obj.add('file1', 100), 0)
+        self.assertEqual(obj.add('file2', 200), 1)
+        self.assertEqual(obj.add('file1', 100), None)
+        self.assertEqual(len(obj), 2)
+        self.assertEqual(obj.index('file2'), 1)
+        self.assertEqual(obj.index('file3'), None)
+        self.assertEqual(obj.path(1), 'file2')
+        self.assertEqual(obj.size(1), 200)
+        self.assertEqual(obj.total_size, 300)
+
+    def test_done(self):
+        obj = FileTable()
+        for i in range(20):
+            obj.add('file{}'.format(i), i)
+        self.assertTrue(obj.mark_done(3))
+        self.assertFalse(obj.mark_done(3))
+        for i in range(8, 16):
+            obj.mark_done(i)
+        self.assertTrue(obj.is_done(3))
+        self.assertFalse(obj.is_done(4))
+        self.assertEqual(obj.done_files, 9)
+        self.assertEqual(obj.done_size, 3 + sum(range(8, 16)))
+        self.assertEqual(list(obj.remaining()), 
+                         [0, 1, 2, 4, 5, 6, 7] + list(range(16, 20)))
+
+    def test_state(self):
+        obj = FileTable()
+        for i in range(10):
+            obj.add('file{}'.format(i), 1000 + i)
+        obj.mark_done(0)
+        obj.mark_done(9)
+        obj2 = FileTable()
+        obj2.load_state(obj.to_state())
+        self.assertEqual(len(obj2), 10)
+        self.assertEqual(obj2.index('file5'), 5)
+        self.assertEqual(obj2.size(5), 1005)
+        self.assertEqual(obj2.done_files, 2)
+        self.assertEqual(obj2.done_size, 1000 + 1009)
+        self.assertEqual(obj2.total_size, obj.total_size)
+        self.assertEqual(list(obj2.remaining()), list(range(1, 9)))
+
+
+class TestIndexQueue(unittest.TestCase):
+
+    def setUp(self):
+        log.info('\n\nTest TestIndexQueue.%s started', self._testMethodName)
+
+    def test_fifo(self):
+        obj = IndexQueue()
+        obj.extend(range(3000))
+        popped = [obj.popleft() for _ in range(2000)]
+        obj.append(7)
+        self.assertEqual(popped, list(range(2000)))
+        self.assertEqual(len(obj), 1001)
+        rest = [obj.popleft() for _ in range(1001)]
+        self.assertEqual(rest, list(range(2000, 3000)) + [7])
+        with self.assertRaises(IndexError):
+            obj.popleft()
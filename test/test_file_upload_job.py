@@ -1,5 +1,6 @@
 import unittest
-from files_upload_job import FilesUploadJob, FeedbackCommand
+from files_upload_job import FilesUploadJob, FeedbackCommand, file_md5
+from files_upload_job import AsyncEvent
 import logging as log
 import random
 import string
@@ -12,8 +13,19 @@ from GDriveFileMock import GDriveFileMock, ListFileResult
 from GDriveMock import GDriveMock
 from GAuthMock import GAuthMock
 from CommandCallbackMock import CommandCallbackMock
+from GServiceMock import GServiceMock
+from job_journal import JobJournal
+from hash_index import HashIndex
+from token_manager import TokenManager
+from retry_scheduler import BackoffPolicy
+from request_governor import RequestGovernor
+from reclaimer import Reclaimer, RECLAIM_PREFIX
+from pydrive.auth import RefreshError
 from files_upload_sm import Command
 from pydrive.files import ApiRequestError
+from googleapiclient.errors import HttpError
+import httplib2
+from unittest.mock import MagicMock
 
 
 @ddt
@@ -104,6 +116,19 @@ class TestFilesUploadJob(unittest.TestCase):
                        (file8,  'file')]
         return job_id, data_dir, result_list
     
+    def _create_job_empty_files(self):
+        job_id, data_dir, _ = self._create_job_empty()
+        sub_dir = fs_join(data_dir, 'notes')
+        os.makedirs(sub_dir)
+        fs_list = [(fs_join(data_dir, 'text.txt'), 'file')]
+        self._create_random_file(fs_list[0][0])
+        for i in range(5):
+            path = fs_join(data_dir if i % 2 else sub_dir, 
+                           'empty{}.txt'.format(i))
+            self._touch(path)
+            fs_list.append((path, 'file'))
+        return job_id, data_dir, fs_list
+        
     def _create_job(self, scenario):
         func = getattr(self, '_create_job_' + scenario)
         return func()
@@ -112,11 +137,13 @@ class TestFilesUploadJob(unittest.TestCase):
         job_dir = fs_join(self._get_data_dir(), job_id)
         shutil.rmtree(job_dir, ignore_errors=True)
 
-    def _create_default_upload_job(self, job_id, dst_dir = ''):
+    def _create_default_upload_job(self, job_id, dst_dir = '', 
+                                   upload_workers = 1):
         drive = GDriveMock(GAuthMock())
         job_dir = fs_join(self._get_data_dir(), job_id)
         callback = CommandCallbackMock()
-        job = FilesUploadJob(drive, job_id, job_dir, dst_dir, callback)
+        job = FilesUploadJob(drive, job_id, job_dir, dst_dir, callback,
+                             upload_workers=upload_workers)
         return job, drive, callback
         
     def _mock_side_effects_handlers(self, job):
@@ -191,6 +218,39 @@ class TestFilesUploadJob(unittest.TestCase):
         callback.called.assert_called_once_with(FeedbackCommand.release, None)
         self._delete_job(job_id)
         
+    def test_session_refresh_token_manager(self):
+        job_id, _, _ = self._create_job('empty')
+        drive = GDriveMock(GAuthMock())
+        drive.auth.access_token_expired = True
+        token_manager = TokenManager(drive.auth)
+        job_dir = fs_join(self._get_data_dir(), job_id)
+        callback = CommandCallbackMock()
+        job = FilesUploadJob(drive, job_id, job_dir, '', callback, 
+                             token_manager=token_manager)
+        job = self._mock_side_effects_handlers(job)
+        job._run_impl()
+        self.assertEqual(token_manager.refresh_count, 1)
+        self.assertEqual(job.commands_history_mocked[:2], 
+                         [Command.lock_job, Command.open_session])
+        self.assertEqual(job.commands_history_mocked[-1], Command.release_sm)
+        callback.called.assert_called_once_with(FeedbackCommand.release, None)
+        self._delete_job(job_id)
+        
+    def test_session_refresh_failed(self):
+        job_id, _, _ = self._create_job('one_file')
+        drive = GDriveMock(GAuthMock())
+        drive.auth.access_token_expired = True
+        drive.auth.Refresh.side_effect = RefreshError('no token')
+        job_dir = fs_join(self._get_data_dir(), job_id)
+        callback = CommandCallbackMock()
+        job = FilesUploadJob(drive, job_id, job_dir, '', callback, 
+                             token_manager=TokenManager(drive.auth))
+        job._run_impl()
+        drive.CreateFile.assert_not_called()
+        first_call, _ = callback.called.call_args_list[0]
+        self.assertEqual(first_call[0], FeedbackCommand.schedule_retry)
+        self._delete_job(job_id)
+        
     @data('empty', 'one_file', 'mixed')
     def test_success_flow(self, scenario):
         job_id, _, fs_list = self._create_job(scenario)
@@ -215,6 +275,27 @@ class TestFilesUploadJob(unittest.TestCase):
         drive.auth.Refresh.assert_not_called()
         self._delete_job(job_id)
         
+    @data('one_file', 'mixed')
+    def test_success_flow_parallel(self, scenario):
+        job_id, data_dir, fs_list = self._create_job(scenario)
+        job, drive, callback = self._create_default_upload_job(
+                                            job_id, upload_workers=3)
+        job = self._mock_side_effects_handlers(job)
+        job._run_impl()
+        history = job.commands_history_mocked
+        files_num = len([f for f, t in fs_list if t == 'file'])
+        self.assertEqual(history.count(Command.upload_file), files_num)
+        self.assertEqual(history.count(Command.release_file), files_num)
+        self.assertEqual(history[-5:], [Command.close_session, 
+                                        Command.remove_data, 
+                                        Command.unlock_job, 
+                                        Command.remove_job, 
+                                        Command.release_sm])
+        self.assertEqual(job.progress, (1.0, 1.0))
+        self.assertFalse(os.path.exists(data_dir))
+        callback.called.assert_called_once_with(FeedbackCommand.release, None)
+        self._delete_job(job_id)
+        
     def test_success_flow_detailed(self):
         job_id, _, fs_list = self._create_job('one_file')
         job, drive, callback = self._create_default_upload_job(job_id)
@@ -448,6 +529,392 @@ class TestFilesUploadJob(unittest.TestCase):
         drive.auth.Refresh.assert_not_called()
         self._delete_job(job_id)
         
+    def _fail_uploads_of(self, drive, title, status, times=None):
+        create_file_saved_se = drive.CreateFile.side_effect
+        failures = []
+        
+        def create_file_se(*args, **kwargs):
+            mock_file = create_file_saved_se(*args, **kwargs)
+            upload_saved_se = mock_file.Upload.side_effect
+            
+            def upload(*args, **kwargs):
+                if mock_file['title'] == title and (
+                        times is None or len(failures) < times):
+                    failures.append(title)
+                    resp = httplib2.Response({'status': status})
+                    raise ApiRequestError(HttpError(resp, b'{}'))
+                upload_saved_se(*args, **kwargs)
+                
+            mock_file.Upload.side_effect = upload
+            return mock_file
+        
+        drive.CreateFile.side_effect = create_file_se
+        return failures
+        
+    def test_upload_permanent_error_quarantined(self):
+        job_id, _, fs_list = self._create_job('mixed')
+        job, drive, callback = self._create_default_upload_job(job_id)
+        job = self._mock_side_effects_handlers(job)
+        failures = self._fail_uploads_of(drive, 'img_02.jpg', 400)
+        job._run_impl()
+        history = job.commands_history_mocked
+        self.assertEqual(failures, ['img_02.jpg'])
+        self.assertEqual(history.count(Command.release_file), 7)
+        self.assertEqual(history[-4:], [Command.close_session, 
+                                        Command.unlock_job,  
+                                        Command.schedule_retry,
+                                        Command.release_sm])
+        remaining = [f for f, t in fs_list 
+                     if t == 'file' and os.path.exists(f)]
+        self.assertEqual([os.path.basename(f) for f in remaining], 
+                         ['img_02.jpg'])
+        first_call, _ = callback.called.call_args_list[0]
+        _, (_, state) = first_call
+        self.assertEqual(len(state['table']['paths']), 8)
+        self._delete_job(job_id)
+        
+    def test_upload_vanished_file_dropped(self):
+        job_id, data_dir, fs_list = self._create_job('mixed')
+        job, drive, callback = self._create_default_upload_job(job_id)
+        job = self._mock_side_effects_handlers(job)
+        vanished = [f for f, t in fs_list if t == 'file' and 
+                    os.path.basename(f) == 'img_02.jpg'][0]
+        upload_saved = job._upload_file_impl
+        
+        def upload(path, *args):
+            if path == vanished:
+                raise FileNotFoundError(2, 'No such file', path)
+            upload_saved(path, *args)
+            
+        job._upload_file_impl = upload
+        job._run_impl()
+        history = job.commands_history_mocked
+        self.assertEqual(history.count(Command.release_file), 7)
+        self.assertNotIn(Command.schedule_retry, history)
+        self.assertFalse(os.path.exists(data_dir))
+        callback.called.assert_called_once_with(FeedbackCommand.release, None)
+        self._delete_job(job_id)
+        
+    def test_upload_rate_limited(self):
+        job_id, _, fs_list = self._create_job('one_file')
+        job, drive, callback = self._create_default_upload_job(job_id)
+        job._rate_backoff = BackoffPolicy(0.01, 2.0, 0.05)
+        job = self._mock_side_effects_handlers(job)
+        failures = self._fail_uploads_of(drive, 'cool_file.txt', 429, 4)
+        job._run_impl()
+        history = job.commands_history_mocked
+        self.assertEqual(len(failures), 4)
+        self.assertEqual(history.count(Command.upload_file), 5)
+        self.assertEqual(history[-1], Command.release_sm)
+        self.assertIn(Command.remove_job, history)
+        callback.called.assert_called_once_with(FeedbackCommand.release, None)
+        self._delete_job(job_id)
+        
+    def test_upload_governed(self):
+        job_id, _, _ = self._create_job('one_file')
+        drive = GDriveMock(GAuthMock())
+        governor = RequestGovernor(rate=100.0, cooldown=0.0)
+        job = FilesUploadJob(drive, job_id, 
+                             fs_join(self._get_data_dir(), job_id), '', 
+                             CommandCallbackMock(), governor=governor)
+        job._rate_backoff = BackoffPolicy(0.01, 2.0, 0.05)
+        self._fail_uploads_of(drive, 'cool_file.txt', 429, 1)
+        job._run_impl()
+        self.assertEqual(governor.stats, (2, 1))
+        self.assertLess(governor.rate, 100.0)
+        self._delete_job(job_id)
+        
+    def test_upload_reclaimed(self):
+        job_id, data_dir, _ = self._create_job('mixed')
+        drive = GDriveMock(GAuthMock())
+        job_dir = fs_join(self._get_data_dir(), job_id)
+        callback = CommandCallbackMock()
+        reclaimer = Reclaimer(batch_size=3)
+        reclaimer.start()
+        job = FilesUploadJob(drive, job_id, job_dir, '', callback,
+                             upload_workers=2, reclaimer=reclaimer)
+        job._run_impl()
+        self.assertFalse(os.path.exists(job_dir))
+        self.assertTrue(reclaimer.flush(timeout=5))
+        reclaimer.stop()
+        self.assertGreaterEqual(reclaimer.removed, 8)
+        markers = [n for n in os.listdir(self._get_data_dir())
+                   if n.startswith(RECLAIM_PREFIX)]
+        self.assertEqual(markers, [])
+        callback.called.assert_called_once_with(FeedbackCommand.release, None)
+        
+    def _create_batch_upload_job(self, job_id):
+        auth = GAuthMock()
+        auth.service = GServiceMock()
+        auth.Get_Http_Object = MagicMock()
+        drive = GDriveMock(auth)
+        job_dir = fs_join(self._get_data_dir(), job_id)
+        callback = CommandCallbackMock()
+        job = FilesUploadJob(drive, job_id, job_dir, '', callback,
+                             upload_workers=2, batch_calls=10)
+        return job, drive, callback
+        
+    def test_upload_empty_files_batched(self):
+        job_id, data_dir, fs_list = self._create_job('empty_files')
+        job, drive, callback = self._create_batch_upload_job(job_id)
+        job._run_impl()
+        service = drive.auth.service
+        titles = sorted([b['title'] for batch in service.batches 
+                         for b in batch])
+        self.assertEqual(titles, ['empty{}.txt'.format(i) 
+                                  for i in range(5)])
+        self.assertLessEqual(len(service.batches), 3)
+        self.assertEqual(service.batches[0][0]['mimeType'], 'text/plain')
+        created = [c[0][0]['title'] for c in drive.CreateFile.call_args_list]
+        self.assertEqual(sorted(created), ['notes', 'text.txt'])
+        self.assertFalse(os.path.exists(data_dir))
+        callback.called.assert_called_once_with(FeedbackCommand.release, None)
+        self._delete_job(job_id)
+        
+    def test_upload_empty_file_error(self):
+        job_id, _, fs_list = self._create_job('empty_files')
+        job, drive, callback = self._create_batch_upload_job(job_id)
+        drive.auth.service.fail_titles = {'empty2.txt': 400}
+        job = self._mock_side_effects_handlers(job)
+        job._run_impl()
+        history = job.commands_history_mocked
+        self.assertEqual(history.count(Command.release_file), 5)
+        self.assertEqual(history[-2:], [Command.schedule_retry,
+                                        Command.release_sm])
+        remaining = [f for f, t in fs_list 
+                     if t == 'file' and os.path.exists(f)]
+        self.assertEqual([os.path.basename(f) for f in remaining], 
+                         ['empty2.txt'])
+        self._delete_job(job_id)
+        
+    def test_success_flow_listing_batches(self):
+        job_id, data_dir, fs_list = self._create_job('mixed')
+        job, drive, callback = self._create_default_upload_job(
+                                            job_id, upload_workers=2)
+        job._listing_batch = 3
+        job = self._mock_side_effects_handlers(job)
+        job._run_impl()
+        history = job.commands_history_mocked
+        self.assertEqual(history.count(Command.upload_file), 8)
+        self.assertEqual(history.count(Command.release_file), 8)
+        self.assertEqual(job.total[0], 8)
+        self.assertEqual(job.progress, (1.0, 1.0))
+        self.assertFalse(os.path.exists(data_dir))
+        callback.called.assert_called_once_with(FeedbackCommand.release, None)
+        self._delete_job(job_id)
+        
+    def test_prefetch_network_error_falls_back(self):
+        job_id, data_dir, _ = self._create_job('mixed')
+        job, drive, callback = self._create_default_upload_job(job_id)
+        broken = ListFileResult()
+        broken.GetList.side_effect = ConnectionError('connection reset')
+        drive.ListFile.side_effect = ([broken] + 
+                                      [ListFileResult() for _ in range(50)])
+        job._run_impl()
+        self.assertGreater(drive.ListFile.call_count, 1)
+        self.assertFalse(os.path.exists(data_dir))
+        callback.called.assert_called_once_with(FeedbackCommand.release, None)
+        self._delete_job(job_id)
+        
+    def test_released_stops_listing(self):
+        job_id, data_dir, _ = self._create_job('mixed')
+        job, drive, callback = self._create_default_upload_job(job_id)
+        job._run_impl()
+        callback.called.assert_called_once_with(FeedbackCommand.release, None)
+        self.assertTrue(job._canceled)
+        list_calls = drive.ListFile.call_count
+        total = job.total
+        self.assertEqual(job._on_listed(None, [('late.txt', 10)]), [])
+        self.assertEqual(drive.ListFile.call_count, list_calls)
+        self.assertEqual(job.total, total)
+        self._delete_job(job_id)
+        
+    def test_progress_deltas(self):
+        job_id, data_dir, _ = self._create_job('mixed')
+        drive = GDriveMock(GAuthMock())
+        job_dir = fs_join(self._get_data_dir(), job_id)
+        callback = CommandCallbackMock()
+        deltas = []
+        job = FilesUploadJob(drive, job_id, job_dir, '', callback,
+                             upload_workers=2,
+                             progress_callback=deltas.append)
+        job._run_impl()
+        self.assertTrue(len(deltas) > 0)
+        totals = tuple([sum(vals) for vals in zip(*deltas)])
+        files_done, size_done, files_total, size_total = totals
+        self.assertEqual(files_done, 8)
+        self.assertEqual(files_total, 8)
+        self.assertEqual(size_done, size_total)
+        callback.called.assert_called_once_with(FeedbackCommand.release, None)
+        self._delete_job(job_id)
+        
+    def test_progress_partial_upload(self):
+        job_id, data_dir, _ = self._create_job('one_file')
+        drive = GDriveMock(GAuthMock())
+        job_dir = fs_join(self._get_data_dir(), job_id)
+        callback = CommandCallbackMock()
+        deltas = []
+        job = FilesUploadJob(drive, job_id, job_dir, '', callback,
+                             progress_callback=deltas.append)
+        
+        def upload_in_chunks(path, size, resume, drive):
+            for offset in [64, 128, 192]:
+                job._async_events.put((AsyncEvent.upload_progress, path,
+                                       ('uri', offset)))
+        
+        job._upload_file_impl = upload_in_chunks
+        job._progress_interval = 0
+        job._run_impl()
+        self.assertEqual(deltas[0], (0, 0, 1, 256))
+        self.assertEqual(deltas[1:4], [(0, 64, 0, 0)] * 3)
+        self.assertEqual(deltas[4], (1, 64, 0, 0))
+        callback.called.assert_called_once_with(FeedbackCommand.release, None)
+        self._delete_job(job_id)
+        
+    def test_progress_retry_restored(self):
+        job_id, _, _ = self._create_job('mixed')
+        job, drive, callback = self._create_default_upload_job(job_id)
+        self._fail_uploads_of(drive, 'img_02.jpg', 400)
+        job._run_impl()
+        first_call, _ = callback.called.call_args_list[0]
+        _, (_, state) = first_call
+        job, drive, callback = self._create_default_upload_job(job_id)
+        deltas = []
+        job._prog_callback = deltas.append
+        job._retry_state = state
+        job._run_impl()
+        callback.called.assert_called_once_with(FeedbackCommand.release, None)
+        totals = tuple([sum(vals) for vals in zip(*deltas)])
+        self.assertEqual(totals[0], 1)
+        self.assertEqual(totals[2:], (0, 0))
+        self._delete_job(job_id)
+        
+    def test_progress_merged(self):
+        job_id, data_dir, _ = self._create_job('mixed')
+        drive = GDriveMock(GAuthMock())
+        job_dir = fs_join(self._get_data_dir(), job_id)
+        callback = CommandCallbackMock()
+        deltas = []
+        job = FilesUploadJob(drive, job_id, job_dir, '', callback,
+                             progress_callback=deltas.append)
+        job._progress_interval = 60.0
+        job._run_impl()
+        self.assertEqual(len(deltas), 2)
+        totals = tuple([sum(vals) for vals in zip(*deltas)])
+        self.assertEqual(totals[0], 8)
+        self.assertEqual(totals[2], 8)
+        self._delete_job(job_id)
+        
+    def test_journal_skips_uploaded(self):
+        job_id, data_dir, fs_list = self._create_job('mixed')
+        files = sorted([f for f, t in fs_list if t == 'file'])
+        journal_path = fs_join(self._get_data_dir(), 'journal')
+        journal = JobJournal(journal_path)
+        journal.load()
+        journal.file_uploaded(job_id, files[0])
+        journal.file_uploaded(job_id, files[1])
+        journal.close()
+        journal = JobJournal(journal_path)
+        journal.load()
+        drive = GDriveMock(GAuthMock())
+        job_dir = fs_join(self._get_data_dir(), job_id)
+        callback = CommandCallbackMock()
+        job = FilesUploadJob(drive, job_id, job_dir, '', callback,
+                             journal=journal)
+        job = self._mock_side_effects_handlers(job)
+        job._run_impl()
+        history = job.commands_history_mocked
+        self.assertEqual(history.count(Command.upload_file), len(files) - 2)
+        self.assertEqual(journal.checkpoint(job_id), None)
+        journal.close()
+        self.assertEqual(JobJournal(journal_path).load(), {})
+        callback.called.assert_called_once_with(FeedbackCommand.release, None)
+        self._delete_job(job_id)
+        
+    @data(True, False)
+    def test_dedup_one_file(self, same_content):
+        job_id, data_dir, fs_list = self._create_job('one_file')
+        file_path, _ = fs_list[0]
+        md5 = file_md5(file_path) if same_content else '0' * 32
+        drive = GDriveMock(GAuthMock())
+        remote = GDriveFileMock({'id': 'remote1', 'title': 'cool_file.txt',
+                                 'fileSize': '256', 'md5Checksum': md5})
+        drive.ListFile.return_value = ListFileResult([remote])
+        job_dir = fs_join(self._get_data_dir(), job_id)
+        callback = CommandCallbackMock()
+        job = FilesUploadJob(drive, job_id, job_dir, '', callback, 
+                             dedup=True)
+        job._run_impl()
+        self.assertEqual(job.progress, (1.0, 1.0))
+        if same_content:
+            drive.CreateFile.assert_not_called()
+        else:
+            drive.CreateFile.assert_called_once()
+        self.assertFalse(os.path.exists(data_dir))
+        callback.called.assert_called_once_with(FeedbackCommand.release, None)
+        self._delete_job(job_id)
+        
+    def test_dedup_hash_index(self):
+        job_id, _, fs_list = self._create_job('one_file')
+        file_path, _ = fs_list[0]
+        index = HashIndex()
+        index.put(os.stat(file_path), 'f' * 32)
+        drive = GDriveMock(GAuthMock())
+        remote = GDriveFileMock({'id': 'remote1', 'title': 'cool_file.txt',
+                                 'fileSize': '256', 'md5Checksum': 'f' * 32})
+        drive.ListFile.return_value = ListFileResult([remote])
+        job_dir = fs_join(self._get_data_dir(), job_id)
+        callback = CommandCallbackMock()
+        job = FilesUploadJob(drive, job_id, job_dir, '', callback, 
+                             dedup=True, hash_index=index)
+        job._run_impl()
+        drive.CreateFile.assert_not_called()
+        self.assertEqual(index.stats, (1, 0))
+        callback.called.assert_called_once_with(FeedbackCommand.release, None)
+        self._delete_job(job_id)
+        
+    def test_dedup_folder_listed_once(self):
+        job_id, _, _ = self._create_job('mixed')
+        drive = GDriveMock(GAuthMock())
+        listed = []
+        
+        def list_file(param):
+            if 'mimeType!=' in param['q']:
+                listed.append(param['q'])
+            return ListFileResult()
+            
+        drive.ListFile.side_effect = list_file
+        job_dir = fs_join(self._get_data_dir(), job_id)
+        callback = CommandCallbackMock()
+        job = FilesUploadJob(drive, job_id, job_dir, '/dst', callback, 
+                             upload_workers=3, dedup=True)
+        job._run_impl()
+        self.assertEqual(len(listed), len(set(listed)))
+        uploads = [args[0] for args, _ in drive.CreateFile.call_args_list
+                   if 'mimeType' not in args[0]]
+        self.assertEqual(len(uploads), 8)
+        callback.called.assert_called_once_with(FeedbackCommand.release, None)
+        self._delete_job(job_id)
+        
+    def test_shared_dirs_cache(self):
+        job_id, _, _ = self._create_job('mixed')
+        job, drive, _ = self._create_default_upload_job(job_id, '/dst')
+        job._run_impl()
+        lookups = drive.ListFile.call_count
+        created = drive.CreateFile.call_count
+        self.assertTrue(lookups > 0)
+        job_id2, _, _ = self._create_job('mixed')
+        drive2 = GDriveMock(GAuthMock())
+        job_dir2 = fs_join(self._get_data_dir(), job_id2)
+        job2 = FilesUploadJob(drive2, job_id2, job_dir2, '/dst', 
+                              CommandCallbackMock(),
+                              gdirs_cache=job._relative_gdirs)
+        job2._run_impl()
+        drive2.ListFile.assert_not_called()
+        self.assertEqual(drive2.CreateFile.call_count, 8)
+        self._delete_job(job_id)
+        self._delete_job(job_id2)
+        
     def test_spaces_detection(self):
         job_id, _, _ = self._create_job('empty')
         job, _, _ = self._create_default_upload_job(job_id)
@@ -1,5 +1,6 @@
 import unittest
 from files_upload_sm import FilesUploadSM, Command
+from upload_errors import ErrorClass
 import logging as log
 
 
@@ -635,3 +636,198 @@ class TestFilesUploadSM(unittest.TestCase):
         file2 = list(set(['file1', 'file2']) - set([file1]))[0]
         with self.assertRaises(ValueError):
             obj.file_upload_failed(file2)
+            
+    def test_fail_parallel_drain(self):
+        obj = FilesUploadSM(2)
+        result = obj.start([('file1', 750000), ('file2', 400000)])
+        self.assertEqual(result, [(Command.lock_job, None)])
+        result = obj.data_locked('<Lock:15>')
+        self.assertEqual(result, [(Command.open_session, None)])
+        result = obj.session_opened('<Session:6>')
+        self.assertEqual(result, [(Command.upload_file, 
+                                   ('<Session:6>', 'file1')),
+                                  (Command.upload_file, 
+                                   ('<Session:6>', 'file2'))])
+        for _ in range(2):
+            result = obj.file_upload_failed('file1')
+            self.assertEqual(result, [(Command.upload_file, 
+                                       ('<Session:6>', 'file1'))])
+        result = obj.file_upload_failed('file1')
+        self.assertEqual(result, [])
+        result = obj.file_uploaded('file2')
+        self.assertEqual(result, [(Command.release_file, 'file2'),
+                                  (Command.close_session, '<Session:6>')])
+        prog_files, _ = obj.progress
+        self.assertEqual(prog_files, 0.5)
+        result = obj.session_closed()
+        self.assertEqual(result, [(Command.unlock_job, '<Lock:15>')])
+            
+    def test_retry_resume_point(self):
+        obj = FilesUploadSM()
+        result = obj.start([('file1', 750000)])
+        result = obj.data_locked('<Lock:16>')
+        result = obj.session_opened('<Session:7>')
+        self.assertEqual(result, [(Command.upload_file, 
+                                   ('<Session:7>', 'file1'))])
+        self.assertEqual(obj.resume_point('file1'), None)
+        result = obj.file_upload_progress('file1', ('<uri:1>', 262144))
+        self.assertEqual(result, [])
+        self.assertEqual(obj.resume_point('file1'), ('<uri:1>', 262144))
+        for _ in range(3):
+            result = obj.file_upload_failed('file1')
+        self.assertEqual(result, [(Command.close_session, '<Session:7>')])
+        result = obj.session_closed()
+        result = obj.data_unlocked()
+        command, data = result.pop(0)
+        self.assertEqual(command, Command.schedule_retry)
+        _, state = data
+        
+        obj2 = FilesUploadSM()
+        obj2.retry(state)
+        self.assertEqual(obj2.resume_point('file1'), ('<uri:1>', 262144))
+        obj2.data_locked('<Lock:17>')
+        obj2.session_opened('<Session:8>')
+        obj2.file_uploaded('file1')
+        self.assertEqual(obj2.resume_point('file1'), None)
+            
+    def test_chunk_progress(self):
+        obj = FilesUploadSM()
+        obj.start([('file1', 1000000), ('file2', 1000000)])
+        obj.data_locked('<Lock:19>')
+        obj.session_opened('<Session:10>')
+        obj.file_upload_progress('file1', ('<uri:2>', 262144))
+        self.assertEqual(obj.counters, (0, 262144, 2, 2000000))
+        obj.file_upload_progress('file1', ('<uri:2>', 524288))
+        self.assertEqual(obj.counters, (0, 524288, 2, 2000000))
+        _, prog_size = obj.progress
+        self.assertAlmostEqual(prog_size, 0.262144)
+        obj.file_uploaded('file1')
+        self.assertEqual(obj.counters, (1, 1000000, 2, 2000000))
+        obj.file_upload_progress('file1', ('<uri:2>', 524288))
+        self.assertEqual(obj.counters, (1, 1000000, 2, 2000000))
+            
+    def test_retry_skip_uploaded(self):
+        obj = FilesUploadSM()
+        obj.start([('file1', 100), ('file2', 200)])
+        obj.data_locked('<Lock:20>')
+        result = obj.session_opened('<Session:11>')
+        obj.file_upload_progress('file1', ('<uri:3>', 50))
+        while result[0][0] == Command.upload_file:
+            _, (_, file_path) = result[0]
+            result = obj.file_upload_failed(file_path)
+        obj.session_closed()
+        _, (_, state) = obj.data_unlocked()[0]
+        
+        obj2 = FilesUploadSM()
+        obj2.retry(state)
+        obj2.skip_uploaded(['file1', 'file3'])
+        self.assertEqual(obj2.counters, (1, 100, 2, 300))
+        self.assertEqual(obj2.resume_point('file1'), None)
+        obj2.data_locked('<Lock:21>')
+        result = obj2.session_opened('<Session:12>')
+        self.assertEqual(result, [(Command.upload_file, 
+                                   ('<Session:12>', 'file2'))])
+            
+    def test_incremental_listing(self):
+        obj = FilesUploadSM()
+        result = obj.start([], listed_all=False)
+        self.assertEqual(result, [(Command.lock_job, None)])
+        result = obj.files_listed([('file1', 100000)])
+        self.assertEqual(result, [])
+        result = obj.data_locked('<Lock:18>')
+        result = obj.session_opened('<Session:9>')
+        self.assertEqual(result, [(Command.upload_file, 
+                                   ('<Session:9>', 'file1'))])
+        result = obj.file_uploaded('file1')
+        self.assertEqual(result, [(Command.release_file, 'file1')])
+        result = obj.files_listed([('file1', 100000), ('file2', 300000)])
+        self.assertEqual(result, [(Command.upload_file, 
+                                   ('<Session:9>', 'file2'))])
+        self.assertEqual(obj.progress, (0.5, 0.25))
+        result = obj.listing_done()
+        self.assertEqual(result, [])
+        result = obj.file_uploaded('file2')
+        self.assertEqual(result, [(Command.release_file, 'file2'),
+                                  (Command.close_session, '<Session:9>')])
+        
+    def test_incremental_listing_retry(self):
+        obj = FilesUploadSM()
+        obj.start([], listed_all=False)
+        obj.files_listed([('file1', 100000)])
+        obj.data_locked('<Lock:19>')
+        obj.session_open_failed()
+        result = obj.data_unlocked()
+        command, data = result.pop(0)
+        _, state = data
+        obj2 = FilesUploadSM()
+        obj2.retry(state)
+        self.assertFalse(obj2.listed_all)
+        self.assertEqual(obj2.remaining_files(), ['file1'])
+        
+    def test_quarantined_retry(self):
+        obj = FilesUploadSM()
+        obj.start([('file1', 100), ('file2', 300)])
+        obj.data_locked('<Lock:20>')
+        result = obj.session_opened('<Session:10>')
+        self.assertEqual(result, [(Command.upload_file, 
+                                   ('<Session:10>', 'file1'))])
+        result = obj.file_upload_failed('file1', ErrorClass.permanent)
+        self.assertEqual(result, [(Command.upload_file, 
+                                   ('<Session:10>', 'file2'))])
+        self.assertEqual(obj.quarantined_files(), ['file1'])
+        result = obj.file_uploaded('file2')
+        self.assertEqual(result, [(Command.release_file, 'file2'),
+                                  (Command.close_session, '<Session:10>')])
+        result = obj.session_closed()
+        self.assertEqual(result, [(Command.unlock_job, '<Lock:20>')])
+        result = obj.data_unlocked()
+        command, data = result.pop(0)
+        self.assertEqual(command, Command.schedule_retry)
+        _, state = data
+        obj2 = FilesUploadSM()
+        obj2.retry(state)
+        self.assertEqual(obj2.remaining_files(), ['file1'])
+        self.assertEqual(obj2.quarantined_files(), [])
+        
+    def test_vanished_forgotten(self):
+        obj = FilesUploadSM()
+        obj.start([('file1', 100), ('file2', 300)])
+        obj.data_locked('<Lock:20>')
+        obj.session_opened('<Session:10>')
+        result = obj.file_upload_failed('file1', ErrorClass.vanished)
+        self.assertEqual(result, [(Command.upload_file, 
+                                   ('<Session:10>', 'file2'))])
+        result = obj.file_uploaded('file2')
+        self.assertEqual(result, [(Command.release_file, 'file2'),
+                                  (Command.close_session, '<Session:10>')])
+        self.assertEqual(obj.remaining_files(), [])
+        self.assertEqual(obj.session_closed(), [(Command.remove_data, None)])
+        
+    def _quarantined_run(self, state):
+        obj = FilesUploadSM()
+        if state is None:
+            obj.start([('file1', 100)])
+        else:
+            obj.retry(state)
+        obj.data_locked('<Lock:20>')
+        obj.session_opened('<Session:10>')
+        result = obj.file_upload_failed('file1', ErrorClass.permanent)
+        self.assertEqual(result, [(Command.close_session, '<Session:10>')])
+        obj.session_closed()
+        command, (_, state) = obj.data_unlocked()[0]
+        self.assertEqual(command, Command.schedule_retry)
+        return state
+        
+    def test_quarantine_given_up(self):
+        state = None
+        for _ in range(3):
+            state = self._quarantined_run(state)
+        obj = FilesUploadSM()
+        obj.retry(state)
+        obj.data_locked('<Lock:20>')
+        obj.session_opened('<Session:10>')
+        self.assertTrue(obj.quarantine_given_up('file1'))
+        result = obj.file_upload_failed('file1', ErrorClass.permanent)
+        self.assertEqual(result, [(Command.close_session, '<Session:10>')])
+        self.assertEqual(obj.session_closed(), [(Command.remove_data, None)])
+        self.assertEqual(obj.remaining_files(), [])
@@ -1,5 +1,6 @@
 import unittest
 from files_upload_sm import FilesUploadSubState, Command
+from upload_errors import ErrorClass
 import logging as log
 
 
@@ -128,3 +129,125 @@ class TestFilesUploadSubState(unittest.TestCase):
                          set(['file1', 'file2', 'file3']))
         
                                   
+    def test_start_arr_parallel(self):
+        obj = FilesUploadSubState(2)
+        arr = [('file1', 600000), ('file2', 750000), ('file3', 1000000)]
+        result = obj.start(arr)
+        self.assertEqual(result, [(Command.upload_file, 'file1'),
+                                  (Command.upload_file, 'file2')])
+        self.assertEqual(obj.in_flight, 2)
+        
+    def test_fine_arr_parallel(self):
+        obj = FilesUploadSubState(2)
+        arr = [('file1', 600000), ('file2', 750000), ('file3', 1000000)]
+        result = obj.start(arr)
+        self.assertEqual(len(result), 2)
+        result = obj.upload_succeed('file2')
+        self.assertEqual(result, [(Command.release_file, 'file2'),
+                                  (Command.upload_file, 'file3')])
+        result = obj.upload_succeed('file3')
+        self.assertEqual(result, [(Command.release_file, 'file3')])
+        result = obj.upload_succeed('file1')
+        self.assertEqual(result, [(Command.release_file, 'file1'), 
+                                  ('_empty', None)]) 
+        
+    def test_fail_n_parallel_drain(self):
+        obj = FilesUploadSubState(2)
+        arr = [('file1', 600000), ('file2', 750000), ('file3', 1000000)]
+        result = obj.start(arr)
+        self.assertEqual(len(result), 2)
+        for _ in range(2):
+            result = obj.upload_failed('file1')
+            self.assertEqual(len(result), 1)
+            command, file_name = result.pop()
+            self.assertEqual(command, Command.upload_file)
+            if file_name == 'file3':
+                result = obj.upload_succeed('file3')
+                self.assertEqual(result, [(Command.release_file, 'file3'),
+                                          (Command.upload_file, 'file1')])
+        result = obj.upload_failed('file1')
+        self.assertEqual(result, [])
+        self.assertEqual(obj.state, 'draining')
+        with self.assertRaises(ValueError):
+            obj.upload_succeed('file1')
+        result = obj.upload_succeed('file2')
+        self.assertEqual(result, [(Command.release_file, 'file2'),
+                                  ('_final_error', 'file1')])
+        self.assertEqual(obj.state, 'done')
+        
+    def test_feed(self):
+        obj = FilesUploadSubState(2)
+        result = obj.start([], feed_open=True)
+        self.assertEqual(result, [])
+        self.assertEqual(obj.state, 'uploading_file')
+        result = obj.add_files([('file1', 600000)])
+        self.assertEqual(result, [(Command.upload_file, 'file1')])
+        result = obj.upload_succeed('file1')
+        self.assertEqual(result, [(Command.release_file, 'file1')])
+        result = obj.add_files([('file2', 600000), ('file3', 600000),
+                                ('file4', 600000)])
+        self.assertEqual(result, [(Command.upload_file, 'file2'),
+                                  (Command.upload_file, 'file3')])
+        result = obj.close_feed()
+        self.assertEqual(result, [])
+        result = obj.upload_succeed('file2')
+        self.assertEqual(result, [(Command.release_file, 'file2'),
+                                  (Command.upload_file, 'file4')])
+        result = obj.upload_succeed('file3')
+        self.assertEqual(result, [(Command.release_file, 'file3')])
+        result = obj.upload_succeed('file4')
+        self.assertEqual(result, [(Command.release_file, 'file4'),
+                                  ('_empty', None)])
+        
+    def test_feed_close_empty(self):
+        obj = FilesUploadSubState()
+        result = obj.start([('file1', 600000)], feed_open=True)
+        self.assertEqual(result, [(Command.upload_file, 'file1')])
+        result = obj.upload_succeed('file1')
+        self.assertEqual(result, [(Command.release_file, 'file1')])
+        result = obj.close_feed()
+        self.assertEqual(result, [('_empty', None)])
+        self.assertEqual(obj.state, 'done')
+        
+    def test_quarantine_continues(self):
+        obj = FilesUploadSubState()
+        result = obj.start([('file1', 10), ('file2', 20)])
+        self.assertEqual(result, [(Command.upload_file, 'file1')])
+        result = obj.upload_failed('file1', ErrorClass.permanent)
+        self.assertEqual(result, [(Command.upload_file, 'file2')])
+        result = obj.upload_succeed('file2')
+        self.assertEqual(result, [(Command.release_file, 'file2'), 
+                                  ('_empty', None)])
+        self.assertEqual(obj.quarantined_files(), ['file1'])
+        
+    def test_quarantine_last(self):
+        obj = FilesUploadSubState()
+        obj.start([('file1', 10)])
+        result = obj.upload_failed('file1', ErrorClass.local_io)
+        self.assertEqual(result, [('_empty', None)])
+        self.assertEqual(obj.state, 'done')
+        
+    def test_vanished_dropped(self):
+        obj = FilesUploadSubState()
+        obj.start([('file1', 10), ('file2', 20)])
+        result = obj.upload_failed('file1', ErrorClass.vanished)
+        self.assertEqual(result, [('_dropped', 'file1'),
+                                  (Command.upload_file, 'file2')])
+        result = obj.upload_failed('file2', ErrorClass.vanished)
+        self.assertEqual(result, [('_dropped', 'file2'), ('_empty', None)])
+        self.assertEqual(obj.quarantined_files(), [])
+        
+    def test_rate_limit_keeps_retries(self):
+        obj = FilesUploadSubState()
+        obj.start([('file1', 10)])
+        for _ in range(5):
+            result = obj.upload_failed('file1', ErrorClass.rate_limit)
+            self.assertEqual(result, [(Command.upload_file, 'file1')])
+        result = obj.upload_failed('file1')
+        self.assertEqual(result, [(Command.upload_file, 'file1')])
+        
+    def test_auth_aborts(self):
+        obj = FilesUploadSubState()
+        obj.start([('file1', 10)])
+        result = obj.upload_failed('file1', ErrorClass.auth)
+        self.assertEqual(result, [('_final_error', 'file1')])
@@ -0,0 +1,82 @@
+import unittest
+from gdrive_dir_cache import GDriveDirCache
+import logging as log
+import os
+import shutil
+import time
+
+
+class TestGDriveDirCache(unittest.TestCase):
+    _data_dir = 'tmp_test_cache'
+
+    def setUp(self):
+        log.info('\n\nTest TestGDriveDirCache.%s started', self._testMethodName)
+        if os.path.exists(self._data_dir):
+            shutil.rmtree(self._data_dir)
+        os.makedirs(self._data_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self._data_dir, ignore_errors=True)
+
+    def test_get_put(self):
+        obj = GDriveDirCache()
+        self.assertEqual(obj.get('/GDriveDormouse/photos'), None)
+        obj.put('/GDriveDormouse/photos', 'dir1')
+        self.assertEqual(obj.get('GDriveDormouse/photos/'), 'dir1')
+        self.assertEqual(len(obj), 1)
+
+    def test_lru(self):
+        obj = GDriveDirCache(max_entries=2)
+        obj.put('a', 'dir1')
+        obj.put('b', 'dir2')
+        self.assertEqual(obj.get('a'), 'dir1')
+        obj.put('c', 'dir3')
+        self.assertEqual(obj.get('b'), None)
+        self.assertEqual(obj.get('a'), 'dir1')
+        self.assertEqual(obj.get('c'), 'dir3')
+
+    def test_ttl(self):
+        obj = GDriveDirCache(ttl_seconds=0)
+        obj.put('a', 'dir1')
+        time.sleep(0.01)
+        self.assertEqual(obj.get('a'), None)
+
+    def test_invalidate(self):
+        obj = GDriveDirCache()
+        obj.put('/root/photos', 'dir1')
+        obj.put('/root/photos/summer', 'dir2')
+        obj.put('/root/photos_old', 'dir3')
+        obj.put('/root', 'dir4')
+        obj.invalidate('/root/photos')
+        self.assertEqual(obj.get('/root/photos'), None)
+        self.assertEqual(obj.get('/root/photos/summer'), None)
+        self.assertEqual(obj.get('/root/photos_old'), 'dir3')
+        self.assertEqual(obj.get('/root'), 'dir4')
+
+    def test_save_load(self):
+        path = os.path.join(self._data_dir, 'dirs.json')
+        obj = GDriveDirCache(path)
+        obj.put('/root/photos', 'dir1')
+        obj.save()
+        obj2 = GDriveDirCache(path)
+        obj2.load()
+        self.assertEqual(obj2.get('/root/photos'), 'dir1')
+
+    def test_save_throttled(self):
+        path = os.path.join(self._data_dir, 'dirs.json')
+        obj = GDriveDirCache(path, save_interval=60)
+        obj.put('/root/photos', 'dir1')
+        obj.save()
+        os.remove(path)
+        obj.save()
+        self.assertFalse(os.path.exists(path))
+        obj.put('/root/docs', 'dir2')
+        obj.save()
+        self.assertFalse(os.path.exists(path))
+        obj.save(force=True)
+        obj2 = GDriveDirCache(path)
+        obj2.load()
+        self.assertEqual(obj2.get('/root/docs'), 'dir2')
+        os.remove(path)
+        obj.save(force=True)
+        self.assertFalse(os.path.exists(path))
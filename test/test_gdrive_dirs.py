@@ -0,0 +1,58 @@
+import unittest
+from gdrive_dirs import GDriveDirsResolver, FOLDER_MIME_TYPE
+from GDriveFileMock import GDriveFileMock, ListFileResult
+from GDriveMock import GDriveMock
+import logging as log
+
+
+class TestGDriveDirsResolver(unittest.TestCase):
+
+    def setUp(self):
+        log.info('\n\nTest TestGDriveDirsResolver.%s started', self._testMethodName)
+
+    def test_empty(self):
+        drive = GDriveMock()
+        obj = GDriveDirsResolver(drive)
+        self.assertEqual(obj.resolve([]), {(): 'root'})
+        drive.ListFile.assert_not_called()
+        drive.CreateFile.assert_not_called()
+
+    def test_create_tree(self):
+        drive = GDriveMock()
+        obj = GDriveDirsResolver(drive)
+        dirs = [('photos', 'summer', 'day%d' % i) for i in range(30)]
+        dirs += [('docs',), ('photos', 'winter')]
+        result = obj.resolve(dirs)
+        drive.ListFile.assert_called_once()
+        self.assertEqual(drive.CreateFile.call_count, 34)
+        self.assertEqual(len(result), 35)
+        metadata = drive.CreateFile.call_args_list[-1][0][0]
+        self.assertEqual(metadata['mimeType'], FOLDER_MIME_TYPE)
+        self.assertEqual(metadata['parents'][0]['id'], 
+                         result[('photos', 'summer')])
+
+    def test_existing_levels(self):
+        drive = GDriveMock()
+        levels = [ListFileResult([GDriveFileMock({'id': 'dir1',
+                                                  'title': 'photos'})]),
+                  ListFileResult([GDriveFileMock({'id': 'dir2',
+                                                  'title': 'summer'})]),
+                  ListFileResult([])]
+        drive.ListFile.return_value = None
+        drive.ListFile.side_effect = levels
+        obj = GDriveDirsResolver(drive)
+        result = obj.resolve([('photos', 'summer', 'beach')])
+        self.assertEqual(drive.ListFile.call_count, 3)
+        self.assertEqual(drive.CreateFile.call_count, 1)
+        self.assertEqual(result[('photos',)], 'dir1')
+        self.assertEqual(result[('photos', 'summer')], 'dir2')
+        query = drive.ListFile.call_args_list[1][0][0]['q']
+        self.assertTrue("'dir1' in parents" in query)
+        self.assertTrue("title='summer'" in query)
+
+    def test_query_split(self):
+        drive = GDriveMock()
+        obj = GDriveDirsResolver(drive, max_query_terms=5)
+        result = obj.resolve([('dir%d' % i,) for i in range(10)])
+        self.assertEqual(drive.ListFile.call_count, 3)
+        self.assertEqual(len(result), 11)
@@ -0,0 +1,75 @@
+import unittest
+from hash_index import HashIndex
+from unittest.mock import MagicMock
+import logging as log
+import tempfile
+import shutil
+import os
+
+
+class TestHashIndex(unittest.TestCase):
+
+    def setUp(self):
+        log.info('\n\nTest TestHashIndex.%s started', self._testMethodName)
+        self._dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._dir, ignore_errors=True)
+
+    def _create_file(self, name, data):
+        path = os.path.join(self._dir, name)
+        with open(path, 'w') as f:
+            f.write(data)
+        return path
+
+    def test_digest_cached(self):
+        path = self._create_file('file1', 'abc')
+        hash_function = MagicMock(return_value='digest1')
+        obj = HashIndex()
+        self.assertEqual(obj.digest(path, hash_function), 'digest1')
+        self.assertEqual(obj.digest(path, hash_function), 'digest1')
+        hash_function.assert_called_once_with(path)
+        self.assertEqual(obj.stats, (1, 1))
+
+    def test_changed_file(self):
+        path = self._create_file('file1', 'abc')
+        obj = HashIndex()
+        obj.digest(path, lambda p: 'digest1')
+        st = os.stat(path)
+        os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1000))
+        self.assertEqual(obj.digest(path, lambda p: 'digest2'), 'digest2')
+        self.assertEqual(len(obj), 1)
+
+    def test_persistent(self):
+        db_path = os.path.join(self._dir, 'index.db')
+        path = self._create_file('file1', 'abc')
+        obj = HashIndex(db_path)
+        obj.digest(path, lambda p: 'digest1')
+        obj.close()
+        obj2 = HashIndex(db_path)
+        hash_function = MagicMock(return_value='digest2')
+        self.assertEqual(obj2.digest(path, hash_function), 'digest1')
+        hash_function.assert_not_called()
+        obj2.close()
+
+    def test_lru_eviction(self):
+        paths = [self._create_file('file{}'.format(i), str(i)) 
+                 for i in range(12)]
+        obj = HashIndex(max_entries=10)
+        for path in paths[:10]:
+            obj.digest(path, lambda p: 'd' + p)
+        obj.get(os.stat(paths[0]))
+        for path in paths[10:]:
+            obj.digest(path, lambda p: 'd' + p)
+        self.assertTrue(len(obj) <= 10)
+        self.assertEqual(obj.get(os.stat(paths[0])), 'd' + paths[0])
+        self.assertEqual(obj.get(os.stat(paths[1])), None)
+        self.assertEqual(obj.get(os.stat(paths[11])), 'd' + paths[11])
+
+    def test_broken_file(self):
+        db_path = os.path.join(self._dir, 'index.db')
+        with open(db_path, 'w') as f:
+            f.write('not a database' * 100)
+        obj = HashIndex(db_path)
+        self.assertEqual(len(obj), 0)
+        obj.close()
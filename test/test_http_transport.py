@@ -0,0 +1,111 @@
+import unittest
+from http_transport import SharedHttp, install_shared_http
+from threading import Thread, Lock
+from unittest.mock import MagicMock
+import logging as log
+import time
+
+
+class HttpMock:
+
+    def __init__(self, tracker):
+        self.tracker = tracker
+        self.closed = False
+        self.requests = 0
+        self.redirect_codes = frozenset((301, 302, 308))
+
+    def request(self, uri, method='GET', body=None, headers=None,
+                redirections=5, connection_type=None):
+        self.tracker.enter(uri)
+        try:
+            time.sleep(0.01)
+            self.requests += 1
+            if 'fail' in uri:
+                raise ConnectionResetError('reset')
+            return {'status': '200'}, b''
+        finally:
+            self.tracker.leave(uri)
+
+    def close(self):
+        self.closed = True
+
+
+class ConcurrencyTracker:
+
+    def __init__(self):
+        self.lock = Lock()
+        self.current = {}
+        self.peak = {}
+
+    def enter(self, uri):
+        host = uri.split('/')[2]
+        with self.lock:
+            self.current[host] = self.current.get(host, 0) + 1
+            self.peak[host] = max(self.peak.get(host, 0), 
+                                  self.current[host])
+
+    def leave(self, uri):
+        host = uri.split('/')[2]
+        with self.lock:
+            self.current[host] -= 1
+
+
+class TestSharedHttp(unittest.TestCase):
+
+    def setUp(self):
+        log.info('\n\nTest TestSharedHttp.%s started', self._testMethodName)
+        self._tracker = ConcurrencyTracker()
+        self._created = []
+
+    def _factory(self):
+        http = HttpMock(self._tracker)
+        self._created.append(http)
+        return http
+
+    def _run_parallel(self, obj, uris):
+        threads = [Thread(target=obj.request, args=(uri,)) for uri in uris]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+    def test_reuse(self):
+        obj = SharedHttp(self._factory)
+        for _ in range(5):
+            obj.request('https://www.googleapis.com/drive/v2/files')
+        self.assertEqual(len(self._created), 1)
+        self.assertEqual(obj.stats, (1, 4))
+        self.assertFalse(308 in self._created[0].redirect_codes)
+
+    def test_per_host_limit(self):
+        obj = SharedHttp(self._factory, max_per_host=3)
+        uris = ['https://a.com/x'] * 12 + ['https://b.com/x'] * 12
+        self._run_parallel(obj, uris)
+        self.assertEqual(self._tracker.peak['a.com'], 3)
+        self.assertEqual(self._tracker.peak['b.com'], 3)
+        self.assertTrue(len(self._created) <= 6)
+
+    def test_failed_connection_dropped(self):
+        obj = SharedHttp(self._factory)
+        with self.assertRaises(ConnectionResetError):
+            obj.request('https://a.com/fail')
+        self.assertTrue(self._created[0].closed)
+        obj.request('https://a.com/x')
+        self.assertEqual(len(self._created), 2)
+
+    def test_max_idle(self):
+        obj = SharedHttp(self._factory, max_per_host=4, max_idle=2)
+        self._run_parallel(obj, ['https://a.com/x'] * 8)
+        idle = [h for h in self._created if not h.closed]
+        self.assertEqual(len(idle), 2)
+        obj.close()
+        self.assertTrue(all([h.closed for h in self._created]))
+
+    def test_install(self):
+        auth = MagicMock()
+        auth.Get_Http_Object.side_effect = self._factory
+        shared = install_shared_http(auth)
+        self.assertTrue(auth.Get_Http_Object() is shared)
+        self.assertTrue(auth.Get_Http_Object() is shared)
+        shared.request('https://a.com/x')
+        self.assertEqual(len(self._created), 1)
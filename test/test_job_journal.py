@@ -0,0 +1,94 @@
+import unittest
+from job_journal import JobJournal
+from files_upload_sm import FilesUploadSM
+import logging as log
+import tempfile
+import shutil
+import os
+
+
+class TestJobJournal(unittest.TestCase):
+
+    def setUp(self):
+        log.info('\n\nTest TestJobJournal.%s started', self._testMethodName)
+        self._dir = tempfile.mkdtemp()
+        self._path = os.path.join(self._dir, 'journal')
+
+    def tearDown(self):
+        shutil.rmtree(self._dir, ignore_errors=True)
+
+    def _retry_state(self):
+        obj = FilesUploadSM()
+        obj.start([('file1', 100), ('file2', 200)])
+        obj.data_locked('<Lock:1>')
+        obj.session_opened('<Session:1>')
+        obj.file_upload_progress('file2', ('<uri:1>', 50))
+        obj.file_uploaded('file1')
+        for _ in range(3):
+            obj.file_upload_failed('file2')
+        obj.session_closed()
+        result = obj.data_unlocked()
+        _, (_, state) = result[0]
+        return state
+
+    def test_no_path(self):
+        obj = JobJournal()
+        obj.file_uploaded('job1', 'file1')
+        self.assertEqual(obj.load(), {})
+        self.assertEqual(obj.checkpoint('job1'), None)
+
+    def test_replay(self):
+        state = self._retry_state()
+        obj = JobJournal(self._path)
+        obj.load()
+        obj.file_uploaded('job1', 'file1')
+        obj.job_state('job2', state)
+        obj.file_uploaded('job2', 'file3')
+        obj.file_uploaded('job3', 'file1')
+        obj.job_done('job3')
+        obj.close()
+        
+        obj2 = JobJournal(self._path)
+        checkpoints = obj2.load()
+        self.assertEqual(set(checkpoints.keys()), set(['job1', 'job2']))
+        self.assertEqual(checkpoints['job1'].state, None)
+        self.assertEqual(checkpoints['job1'].uploaded, set(['file1']))
+        self.assertEqual(checkpoints['job2'].state, state)
+        self.assertEqual(checkpoints['job2'].uploaded, set(['file3']))
+        
+        sm = FilesUploadSM()
+        sm.retry(checkpoints['job2'].state)
+        self.assertEqual(sm.remaining_files(), ['file2'])
+        self.assertEqual(sm.resume_point('file2'), ('<uri:1>', 50))
+
+    def test_state_drops_uploaded(self):
+        obj = JobJournal(self._path)
+        obj.file_uploaded('job1', 'file1')
+        obj.job_state('job1', {'table': None})
+        obj.close()
+        checkpoint = JobJournal(self._path).load()['job1']
+        self.assertEqual(checkpoint.uploaded, set())
+
+    def test_broken_record(self):
+        obj = JobJournal(self._path)
+        obj.file_uploaded('job1', 'file1')
+        obj.close()
+        with open(self._path, 'a') as f:
+            f.write('{"op": "uploaded", "job": "jo')
+        checkpoints = JobJournal(self._path).load()
+        self.assertEqual(checkpoints['job1'].uploaded, set(['file1']))
+
+    def test_compaction(self):
+        obj = JobJournal(self._path, compact_min_records=10)
+        obj.load()
+        for i in range(100):
+            job_name = 'job{}'.format(i)
+            obj.file_uploaded(job_name, 'file1')
+            obj.job_done(job_name)
+        obj.file_uploaded('job_last', 'file1')
+        obj.close()
+        with open(self._path, 'r') as f:
+            lines = f.readlines()
+        self.assertTrue(len(lines) <= 13)
+        checkpoints = JobJournal(self._path).load()
+        self.assertEqual(set(checkpoints.keys()), set(['job_last']))
@@ -0,0 +1,97 @@
+import unittest
+from ddt import ddt, data
+from jobs_watcher import JobsWatcher
+from threading import Event
+import logging as log
+import tempfile
+import shutil
+import time
+import os
+
+
+@ddt
+class TestJobsWatcher(unittest.TestCase):
+
+    def setUp(self):
+        log.info('\n\nTest TestJobsWatcher.%s started', self._testMethodName)
+        self._dir = tempfile.mkdtemp()
+        self._jobs = []
+        self._job_added = Event()
+
+    def tearDown(self):
+        shutil.rmtree(self._dir, ignore_errors=True)
+
+    def _on_job(self, name):
+        self._jobs.append(name)
+        self._job_added.set()
+
+    def _create_job(self, name, lock=True):
+        job_path = os.path.join(self._dir, name)
+        os.makedirs(os.path.join(job_path, 'data'))
+        with open(os.path.join(job_path, 'data', 'file1'), 'w') as f:
+            f.write('file1')
+        if lock:
+            open(os.path.join(job_path, '.lock'), 'w').close()
+        return job_path
+
+    def _create_watcher(self, use_inotify):
+        obj = JobsWatcher(self._dir, self._on_job, wait_time=0.3,
+                          poll_interval=0.05, use_inotify=use_inotify)
+        obj.start()
+        return obj
+
+    @data(True, False)
+    def test_new_job(self, use_inotify):
+        self._create_job('job0')
+        obj = self._create_watcher(use_inotify)
+        started = time.monotonic()
+        self._create_job('job1')
+        self.assertTrue(self._job_added.wait(timeout=5.0))
+        self.assertTrue(time.monotonic() - started >= 0.3)
+        time.sleep(0.5)
+        obj.stop()
+        self.assertEqual(self._jobs, ['job1'])
+
+    @data(True, False)
+    def test_incomplete_job(self, use_inotify):
+        obj = self._create_watcher(use_inotify)
+        job_path = self._create_job('job1', lock=False)
+        time.sleep(0.6)
+        self.assertEqual(self._jobs, [])
+        open(os.path.join(job_path, '.lock'), 'w').close()
+        self.assertTrue(self._job_added.wait(timeout=5.0))
+        obj.stop()
+        self.assertEqual(self._jobs, ['job1'])
+
+    @data(True, False)
+    def test_job_recreated(self, use_inotify):
+        obj = self._create_watcher(use_inotify)
+        job_path = self._create_job('job1')
+        self.assertTrue(self._job_added.wait(timeout=5.0))
+        self._job_added.clear()
+        shutil.rmtree(job_path)
+        time.sleep(0.2)
+        self._create_job('job1')
+        self.assertTrue(self._job_added.wait(timeout=5.0))
+        obj.stop()
+        self.assertEqual(self._jobs, ['job1', 'job1'])
+
+    def test_quiet_period(self):
+        obj = JobsWatcher(self._dir, self._on_job, wait_time=5)
+        self._create_job('job1')
+        obj._process((set(['job1']), set()), 100.0)
+        obj._process((set(['job1']), set()), 103.0)
+        obj._process((set(), set()), 107.0)
+        self.assertEqual(self._jobs, [])
+        obj._process((set(), set()), 108.0)
+        self.assertEqual(self._jobs, ['job1'])
+        obj._process((set(['job1']), set()), 120.0)
+        obj._process((set(), set()), 130.0)
+        self.assertEqual(self._jobs, ['job1'])
+
+    def test_hidden_dirs_ignored(self):
+        obj = self._create_watcher(False)
+        self._create_job('.reclaim-job1')
+        time.sleep(0.6)
+        obj.stop()
+        self.assertEqual(self._jobs, [])
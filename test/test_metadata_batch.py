@@ -0,0 +1,85 @@
+import unittest
+from metadata_batch import MetadataBatch, MAX_BATCH_CALLS
+from gdrive_dirs import GDriveDirsResolver, FOLDER_MIME_TYPE
+from request_governor import RequestGovernor
+from GDriveMock import GDriveMock
+from GAuthMock import GAuthMock
+from GServiceMock import GServiceMock
+from pydrive.files import ApiRequestError
+from googleapiclient.errors import HttpError
+from unittest.mock import MagicMock
+import httplib2
+import logging as log
+
+
+class TestMetadataBatch(unittest.TestCase):
+
+    def setUp(self):
+        log.info('\n\nTest TestMetadataBatch.%s started', self._testMethodName)
+        self._service = GServiceMock()
+        auth = GAuthMock()
+        auth.service = self._service
+        auth.Get_Http_Object = MagicMock()
+        self._drive = GDriveMock(auth)
+
+    def test_split_batches(self):
+        obj = MetadataBatch(self._drive, max_calls=4)
+        results = obj.execute([obj.insert({'title': 'f%d' % i})
+                               for i in range(10)])
+        self.assertEqual([len(b) for b in self._service.batches], [4, 4, 2])
+        self.assertEqual([r['title'] for r in results],
+                         ['f%d' % i for i in range(10)])
+
+    def test_max_calls(self):
+        self.assertEqual(MetadataBatch(self._drive, 1000).max_calls,
+                         MAX_BATCH_CALLS)
+        self.assertEqual(MetadataBatch(self._drive, 0).max_calls, 1)
+
+    def test_call_errors(self):
+        self._service.fail_titles = {'f1': 500, 'f2': 429}
+        governor = RequestGovernor(rate=100.0, cooldown=0.0)
+        obj = MetadataBatch(self._drive, governor=governor)
+        results = obj.execute([obj.insert({'title': 'f%d' % i})
+                               for i in range(3)])
+        self.assertEqual(results[0]['title'], 'f0')
+        self.assertIsInstance(results[1], HttpError)
+        self.assertIsInstance(results[2], HttpError)
+        self.assertLess(governor.rate, 100.0)
+
+    def test_batch_error(self):
+        obj = MetadataBatch(self._drive)
+        batch = MagicMock()
+        batch.execute.side_effect = HttpError(
+            httplib2.Response({'status': 503}), b'{}')
+        self._service.new_batch_http_request = MagicMock(return_value=batch)
+        with self.assertRaises(ApiRequestError):
+            obj.execute([obj.insert({'title': 'f'})])
+
+    def test_resolver_batches_levels(self):
+        obj = GDriveDirsResolver(self._drive,
+                                 batch=MetadataBatch(self._drive))
+        dirs = [('photos', 'summer', 'day%d' % i) for i in range(30)]
+        dirs += [('docs',), ('photos', 'winter')]
+        result = obj.resolve(dirs)
+        self.assertEqual(len(result), 35)
+        self.assertEqual([len(b) for b in self._service.batches],
+                         [2, 2, 30])
+        self._drive.CreateFile.assert_not_called()
+        body = self._service.batches[-1][0]
+        self.assertEqual(body['mimeType'], FOLDER_MIME_TYPE)
+        self.assertEqual(body['parents'][0]['id'],
+                         result[('photos', 'summer')])
+
+    def test_resolver_single_dir_not_batched(self):
+        obj = GDriveDirsResolver(self._drive,
+                                 batch=MetadataBatch(self._drive))
+        obj.resolve([('photos', 'summer')])
+        self.assertEqual(self._service.batches, [])
+        self.assertEqual(self._drive.CreateFile.call_count, 2)
+
+    def test_resolver_batch_error(self):
+        self._service.fail_titles = {'day1': 403}
+        obj = GDriveDirsResolver(self._drive,
+                                 batch=MetadataBatch(self._drive))
+        with self.assertRaises(ApiRequestError):
+            obj.resolve([('day%d' % i,) for i in range(3)])
@@ -0,0 +1,90 @@
+import unittest
+from ddt import ddt, data
+from parallel_scanner import ParallelScanner
+import logging as log
+import tempfile
+import shutil
+import os
+
+
+@ddt
+class TestParallelScanner(unittest.TestCase):
+
+    def setUp(self):
+        log.info('\n\nTest TestParallelScanner.%s started', 
+                 self._testMethodName)
+        self._dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._dir, ignore_errors=True)
+
+    def _create_tree(self, depth, width, files):
+        expected = []
+        
+        def create(path, level):
+            for i in range(files):
+                file_path = os.path.join(path, 'file{}'.format(i))
+                with open(file_path, 'w') as f:
+                    f.write('x' * (level + i))
+                expected.append((file_path, level + i))
+            if level == depth:
+                return
+            for i in range(width):
+                dir_path = os.path.join(path, 'dir{}'.format(i))
+                os.makedirs(dir_path)
+                create(dir_path, level + 1)
+                
+        create(self._dir, 0)
+        return expected
+
+    def _serial_walk(self, path):
+        result = []
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            result.extend([(os.path.join(root, f), 
+                            os.path.getsize(os.path.join(root, f)))
+                           for f in sorted(files)])
+        return result
+
+    @data(1, 3, 8)
+    def test_order(self, workers):
+        expected = self._create_tree(depth=3, width=3, files=2)
+        obj = ParallelScanner(workers=workers, max_pending=4)
+        result = list(obj.scan(self._dir))
+        obj.shutdown()
+        self.assertEqual(sorted(result), sorted(expected))
+        self.assertEqual(result, self._serial_walk(self._dir))
+
+    def test_filter_and_symlinks(self):
+        self._create_tree(depth=1, width=2, files=2)
+        os.symlink(os.path.join(self._dir, 'file0'), 
+                   os.path.join(self._dir, 'link0'))
+        os.symlink(os.path.join(self._dir, 'dir0'), 
+                   os.path.join(self._dir, 'link_dir0'))
+        obj = ParallelScanner()
+        result = list(obj.scan(self._dir, lambda e: e.name != 'file1'))
+        obj.shutdown()
+        names = [os.path.relpath(p, self._dir) for p, _ in result]
+        self.assertEqual(names, ['file0', 'dir0/file0', 'dir1/file0'])
+
+    def test_canceled(self):
+        self._create_tree(depth=2, width=3, files=1)
+        obj = ParallelScanner()
+        result = list(obj.scan(self._dir, canceled=lambda: True))
+        obj.shutdown()
+        self.assertEqual(result, [])
+
+    def test_missing_dir(self):
+        obj = ParallelScanner()
+        with self.assertRaises(OSError):
+            list(obj.scan(os.path.join(self._dir, 'missing')))
+        obj.shutdown()
+
+    def test_list_dirs(self):
+        self._create_tree(depth=1, width=5, files=1)
+        os.symlink(os.path.join(self._dir, 'dir0'), 
+                   os.path.join(self._dir, 'dir5'))
+        obj = ParallelScanner(workers=2)
+        self.assertEqual(obj.list_dirs(self._dir), 
+                         ['dir0', 'dir1', 'dir2', 'dir3', 'dir4', 'dir5'])
+        obj.shutdown()
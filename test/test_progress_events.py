@@ -0,0 +1,64 @@
+import unittest
+from progress_events import ProgressStream
+from threading import Event
+import logging as log
+import time
+
+
+class TestProgressStream(unittest.TestCase):
+
+    def setUp(self):
+        log.info('\n\nTest TestProgressStream.%s started', 
+                 self._testMethodName)
+
+    def test_snapshot(self):
+        obj = ProgressStream()
+        obj.update((1, 100, 4, 400), 100)
+        files_done, size_done, files_total, size_total, _ = obj.snapshot()
+        self.assertEqual((files_done, size_done, files_total, size_total),
+                         (1, 100, 4, 400))
+        
+    def test_throughput(self):
+        obj = ProgressStream(avg_seconds=0.01)
+        obj.snapshot()
+        time.sleep(0.05)
+        obj.update((0, 0, 1, 10000), 5000)
+        *_, rate = obj.snapshot()
+        self.assertTrue(rate > 0.0)
+        obj.update((0, 0, 1, 10000), 0)
+        time.sleep(0.2)
+        *_, rate = obj.snapshot()
+        self.assertTrue(rate < 1.0)
+        
+    def test_delivery_throttled(self):
+        obj = ProgressStream(max_rate_hz=10.0)
+        received = []
+        done = Event()
+        
+        def subscriber(snapshot):
+            received.append(snapshot)
+            if snapshot[0] == 50:
+                done.set()
+                
+        obj.subscribe(subscriber)
+        obj.start()
+        started = time.monotonic()
+        for i in range(1, 51):
+            obj.update((i, i, 50, 50), i)
+            time.sleep(0.005)
+        self.assertTrue(done.wait(timeout=2.0))
+        elapsed = time.monotonic() - started
+        obj.stop()
+        self.assertTrue(len(received) <= elapsed * 10.0 + 2)
+        self.assertEqual(received[-1][:4], (50, 50, 50, 50))
+        
+    def test_unsubscribe(self):
+        obj = ProgressStream(max_rate_hz=0)
+        received = []
+        obj.subscribe(received.append)
+        obj.unsubscribe(received.append)
+        obj.start()
+        obj.update((1, 1, 1, 1), 1)
+        time.sleep(0.1)
+        obj.stop()
+        self.assertEqual(received, [])
@@ -0,0 +1,89 @@
+import unittest
+from reclaimer import Reclaimer, RECLAIM_PREFIX
+import logging as log
+import os
+from os.path import join as fs_join
+import shutil
+import tempfile
+
+
+class TestReclaimer(unittest.TestCase):
+
+    def setUp(self):
+        log.info('\n\nTest TestReclaimer.%s started', self._testMethodName)
+        self._root = tempfile.mkdtemp(prefix='test_reclaimer_')
+        self._reclaimer = Reclaimer(batch_size=4)
+        self._reclaimer.start()
+
+    def tearDown(self):
+        self._reclaimer.stop()
+        shutil.rmtree(self._root, ignore_errors=True)
+
+    def _touch(self, path):
+        with open(path, 'a'):
+            pass
+
+    def _create_tree(self, path, files=3):
+        os.makedirs(fs_join(path, 'sub'))
+        for i in range(files):
+            self._touch(fs_join(path, 'file{}'.format(i)))
+            self._touch(fs_join(path, 'sub', 'file{}'.format(i)))
+
+    def test_remove_files(self):
+        paths = []
+        for d in ['a', 'b']:
+            os.mkdir(fs_join(self._root, d))
+            for i in range(5):
+                paths.append(fs_join(self._root, d, 'f{}'.format(i)))
+                self._touch(paths[-1])
+        for path in paths:
+            self._reclaimer.remove_file(path)
+        self.assertTrue(self._reclaimer.flush(timeout=5))
+        self.assertEqual([p for p in paths if os.path.exists(p)], [])
+        self.assertEqual(self._reclaimer.removed, 10)
+        self.assertEqual(len(self._reclaimer), 0)
+
+    def test_remove_missing_file(self):
+        self._reclaimer.remove_file(fs_join(self._root, 'missing'))
+        self._reclaimer.remove_file(fs_join(self._root, 'no_dir', 'missing'))
+        self.assertTrue(self._reclaimer.flush(timeout=5))
+        self.assertEqual(self._reclaimer.removed, 0)
+
+    def test_remove_tree(self):
+        tree = fs_join(self._root, 'job')
+        self._create_tree(tree)
+        self._reclaimer.remove_tree(tree)
+        self.assertFalse(os.path.exists(tree))
+        self.assertTrue(self._reclaimer.flush(timeout=5))
+        self.assertEqual(os.listdir(self._root), [])
+
+    def test_remove_tree_after_files(self):
+        tree = fs_join(self._root, 'job')
+        self._create_tree(tree, files=10)
+        for i in range(10):
+            self._reclaimer.remove_file(fs_join(tree, 'file{}'.format(i)))
+        self._reclaimer.remove_tree(tree)
+        self.assertTrue(self._reclaimer.flush(timeout=5))
+        self.assertEqual(os.listdir(self._root), [])
+
+    def test_remove_missing_tree(self):
+        with self.assertRaises(OSError):
+            self._reclaimer.remove_tree(fs_join(self._root, 'missing'))
+
+    def test_sweep(self):
+        job = fs_join(self._root, 'job')
+        os.mkdir(job)
+        self._create_tree(fs_join(self._root, RECLAIM_PREFIX + 'old-0'))
+        self._create_tree(fs_join(job, RECLAIM_PREFIX + 'data-1'))
+        self._touch(fs_join(job, '.lock'))
+        self.assertEqual(self._reclaimer.sweep(self._root), 2)
+        self.assertTrue(self._reclaimer.flush(timeout=5))
+        self.assertEqual(os.listdir(self._root), ['job'])
+        self.assertEqual(os.listdir(job), ['.lock'])
+
+    def test_stop_drains(self):
+        tree = fs_join(self._root, 'job')
+        self._create_tree(tree)
+        self._reclaimer.remove_tree(tree)
+        self._reclaimer.stop()
+        self.assertEqual(os.listdir(self._root), [])
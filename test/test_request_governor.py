@@ -0,0 +1,108 @@
+import unittest
+from request_governor import RequestGovernor, governed
+from pydrive.files import ApiRequestError
+from googleapiclient.errors import HttpError
+from unittest.mock import MagicMock
+import httplib2
+import logging as log
+import time
+
+
+def _api_error(status):
+    return ApiRequestError(HttpError(httplib2.Response({'status': status}),
+                                     b'{}'))
+
+
+class TestRequestGovernor(unittest.TestCase):
+
+    def setUp(self):
+        log.info('\n\nTest TestRequestGovernor.%s started',
+                 self._testMethodName)
+
+    def test_rate_limits_requests(self):
+        obj = RequestGovernor(rate=50.0, max_rate=50.0, burst=1)
+        start = time.monotonic()
+        for _ in range(11):
+            obj.acquire()
+        elapsed = time.monotonic() - start
+        self.assertGreaterEqual(elapsed, 0.18)
+        self.assertEqual(obj.stats, (11, 0))
+
+    def test_pass_through_until_limited(self):
+        obj = RequestGovernor(decrease=0.5, cooldown=0.0)
+        self.assertIsNone(obj.rate)
+        start = time.monotonic()
+        for _ in range(200):
+            obj.acquire()
+            obj.on_success()
+        self.assertLess(time.monotonic() - start, 0.5)
+        self.assertIsNone(obj.rate)
+        obj.on_rate_limited()
+        self.assertIsNotNone(obj.rate)
+        self.assertGreater(obj.rate, 100.0)
+        self.assertEqual(obj.stats, (200, 1))
+
+    def test_measured_rate_decreased(self):
+        obj = RequestGovernor(decrease=0.5)
+        for _ in range(39):
+            obj.acquire()
+        obj._window_start -= 2.0
+        obj.acquire()
+        obj.on_rate_limited()
+        self.assertGreater(obj.rate, 9.5)
+        self.assertLess(obj.rate, 10.5)
+
+    def test_max_rate_without_rate(self):
+        obj = RequestGovernor(max_rate=20.0)
+        self.assertEqual(obj.rate, 20.0)
+
+    def test_additive_increase(self):
+        obj = RequestGovernor(rate=10.0, increase=1.0)
+        for _ in range(10):
+            obj.on_success()
+        self.assertGreater(obj.rate, 10.9)
+        self.assertLess(obj.rate, 11.0)
+
+    def test_max_rate(self):
+        obj = RequestGovernor(rate=10.0, max_rate=12.0, increase=100.0)
+        obj.on_success()
+        obj.on_success()
+        self.assertEqual(obj.rate, 12.0)
+
+    def test_multiplicative_decrease_once(self):
+        obj = RequestGovernor(rate=10.0, decrease=0.5, cooldown=60.0)
+        for _ in range(5):
+            obj.on_rate_limited()
+        self.assertEqual(obj.rate, 5.0)
+        self.assertEqual(obj.stats, (0, 5))
+
+    def test_decrease_after_cooldown(self):
+        obj = RequestGovernor(rate=10.0, decrease=0.5, cooldown=0.0)
+        obj.on_rate_limited()
+        obj.on_rate_limited()
+        self.assertEqual(obj.rate, 2.5)
+
+    def test_min_rate(self):
+        obj = RequestGovernor(rate=1.0, min_rate=0.8, cooldown=0.0)
+        obj.on_rate_limited()
+        self.assertEqual(obj.rate, 0.8)
+
+    def test_call_feedback(self):
+        obj = RequestGovernor(rate=10.0, decrease=0.5)
+        func = MagicMock(side_effect=_api_error(429))
+        with self.assertRaises(ApiRequestError):
+            obj.call(func, 'arg')
+        func.assert_called_once_with('arg')
+        self.assertEqual(obj.rate, 5.0)
+        func = MagicMock(side_effect=_api_error(500))
+        with self.assertRaises(ApiRequestError):
+            obj.call(func)
+        self.assertEqual(obj.rate, 5.0)
+        func = MagicMock(return_value=3)
+        self.assertEqual(obj.call(func), 3)
+        self.assertEqual(obj.rate, 5.2)
+
+    def test_governed_without_governor(self):
+        func = MagicMock(return_value=3)
+        self.assertEqual(governed(None, func, 1, key=2), 3)
+        func.assert_called_once_with(1, key=2)
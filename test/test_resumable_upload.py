@@ -0,0 +1,114 @@
+import unittest
+from resumable_upload import ResumableUpload, CHUNK_ALIGN
+from files_upload_job import FilesUploadJob, FeedbackCommand, file_md5
+from CommandCallbackMock import CommandCallbackMock
+import logging as log
+import os
+from os.path import join as fs_join
+import shutil
+import sys
+import tempfile
+
+sys.path.append(fs_join(os.path.dirname(os.path.abspath(__file__)),
+                        '..', 'bench'))
+
+from fake_drive_server import FakeDriveServer, connect_drive
+
+
+class Interrupted(Exception):
+    pass
+
+
+# Uploads to local fake Drive server through stock httplib2.Http,
+# which follows 308 as redirect unless upload disables it.
+class TestResumableUpload(unittest.TestCase):
+
+    def setUp(self):
+        log.info('\n\nTest TestResumableUpload.%s started', self._testMethodName)
+        self._root = tempfile.mkdtemp(prefix='test_resumable_')
+        self._server = FakeDriveServer()
+        self._server.start()
+        self._drive = connect_drive(self._server.url)
+
+    def tearDown(self):
+        self._server.stop()
+        shutil.rmtree(self._root, ignore_errors=True)
+
+    def _create_file(self, path, size):
+        with open(path, 'wb') as f:
+            f.write(os.urandom(size))
+        return path
+
+    def _upload(self, path, resume_point=None, callback=None):
+        return ResumableUpload(self._drive, path, {'title': 'big.bin'},
+                               chunk_size=CHUNK_ALIGN,
+                               resume_point=resume_point,
+                               progress_callback=callback).run()
+
+    def _interrupted_upload(self, path):
+        points = []
+
+        def interrupt(session_uri, offset):
+            points.append((session_uri, offset))
+            raise Interrupted()
+
+        with self.assertRaises(Interrupted):
+            self._upload(path, callback=interrupt)
+        return points[0]
+
+    def test_upload_in_chunks(self):
+        path = self._create_file(fs_join(self._root, 'big.bin'),
+                                 4 * CHUNK_ALIGN)
+        offsets = []
+        result = self._upload(path, callback=lambda _, o: offsets.append(o))
+        self.assertEqual(offsets, [CHUNK_ALIGN, 2 * CHUNK_ALIGN,
+                                   3 * CHUNK_ALIGN])
+        self.assertEqual(int(result['fileSize']), 4 * CHUNK_ALIGN)
+        self.assertEqual(result['md5Checksum'], file_md5(path))
+        self.assertEqual(self._server.drive.stats()['requests'],
+                         {'upload_start': 1, 'upload_chunk': 4})
+
+    def test_resume_from_offset(self):
+        path = self._create_file(fs_join(self._root, 'big.bin'),
+                                 4 * CHUNK_ALIGN)
+        resume_point = self._interrupted_upload(path)
+        self.assertEqual(resume_point[1], CHUNK_ALIGN)
+        self._server.drive.reset_stats()
+        offsets = []
+        result = self._upload(path, resume_point,
+                              lambda _, o: offsets.append(o))
+        self.assertEqual(offsets, [2 * CHUNK_ALIGN, 3 * CHUNK_ALIGN])
+        self.assertEqual(self._server.drive.stats()['bytes'],
+                         3 * CHUNK_ALIGN)
+        self.assertEqual(result['md5Checksum'], file_md5(path))
+
+    def test_expired_session_restarts(self):
+        path = self._create_file(fs_join(self._root, 'big.bin'),
+                                 2 * CHUNK_ALIGN)
+        session_uri, _ = self._interrupted_upload(path)
+        expired = session_uri.replace('upload_id=', 'upload_id=x')
+        self._server.drive.reset_stats()
+        result = self._upload(path, (expired, CHUNK_ALIGN))
+        self.assertEqual(self._server.drive.stats()['bytes'],
+                         2 * CHUNK_ALIGN)
+        self.assertEqual(result['md5Checksum'], file_md5(path))
+
+    def test_job_uploads_in_chunks(self):
+        job_dir = fs_join(self._root, 'job')
+        os.makedirs(fs_join(job_dir, 'data'))
+        open(fs_join(job_dir, '.lock'), 'w').close()
+        path = self._create_file(fs_join(job_dir, 'data', 'big.bin'),
+                                 3 * CHUNK_ALIGN)
+        md5 = file_md5(path)
+        callback = CommandCallbackMock()
+        deltas = []
+        job = FilesUploadJob(self._drive, 'job', job_dir, '', callback,
+                             chunk_size=CHUNK_ALIGN,
+                             progress_callback=deltas.append)
+        job._progress_interval = 0
+        job._run_impl()
+        callback.called.assert_called_once_with(FeedbackCommand.release, None)
+        self.assertFalse(os.path.exists(fs_join(job_dir, 'data')))
+        files = self._server.drive.list("title='big.bin'")
+        self.assertEqual([f['md5Checksum'] for f in files], [md5])
+        self.assertIn((0, CHUNK_ALIGN, 0, 0), deltas)
@@ -0,0 +1,103 @@
+import unittest
+from retry_scheduler import RetryScheduler, BackoffPolicy
+from threading import Event
+import logging as log
+import time
+
+
+class TestRetryScheduler(unittest.TestCase):
+
+    def setUp(self):
+        log.info('\n\nTest TestRetryScheduler.%s started', self._testMethodName)
+
+    def _start(self):
+        obj = RetryScheduler()
+        obj.start()
+        self.addCleanup(obj.stop)
+        return obj
+
+    def test_backoff_grows(self):
+        policy = BackoffPolicy(10, 2.0, 1000, jitter=0.0)
+        delays = [policy.delay(attempt) for attempt in range(5)]
+        self.assertEqual(delays, [10, 20, 40, 80, 160])
+
+    def test_backoff_capped(self):
+        policy = BackoffPolicy(10, 2.0, 100, jitter=0.0)
+        self.assertEqual(policy.delay(10), 100)
+        self.assertEqual(policy.delay(10000), 100)
+
+    def test_backoff_base_override(self):
+        policy = BackoffPolicy(10, 2.0, 1000, jitter=0.0)
+        self.assertEqual(policy.delay(1, 30), 60)
+
+    def test_backoff_equal_jitter(self):
+        policy = BackoffPolicy(10, 2.0, 1000, jitter=0.5)
+        delays = [policy.delay(2) for _ in range(200)]
+        for delay in delays:
+            self.assertGreaterEqual(delay, 20)
+            self.assertLessEqual(delay, 40)
+        self.assertGreater(len(set(delays)), 1)
+
+    def test_runs_in_order(self):
+        obj = self._start()
+        done = Event()
+        order = []
+        obj.schedule('b', 0.2, lambda: order.append('b') or done.set())
+        obj.schedule('a', 0.05, lambda: order.append('a'))
+        self.assertTrue(done.wait(timeout=5.0))
+        self.assertEqual(order, ['a', 'b'])
+        self.assertEqual(len(obj), 0)
+
+    def test_cancel(self):
+        obj = self._start()
+        done = Event()
+        called = []
+        obj.schedule('a', 0.05, lambda: called.append('a'))
+        obj.schedule('b', 0.1, done.set)
+        self.assertTrue(obj.cancel('a'))
+        self.assertFalse(obj.cancel('a'))
+        self.assertTrue(done.wait(timeout=5.0))
+        self.assertEqual(called, [])
+
+    def test_reschedule_replaces(self):
+        obj = self._start()
+        done = Event()
+        called = []
+        obj.schedule('a', 0.05, lambda: called.append(1))
+        obj.schedule('a', 0.1, lambda: called.append(2) or done.set())
+        self.assertEqual(len(obj), 1)
+        self.assertTrue(done.wait(timeout=5.0))
+        time.sleep(0.1)
+        self.assertEqual(called, [2])
+
+    def test_earlier_wakes_thread(self):
+        obj = self._start()
+        done = Event()
+        obj.schedule('late', 60, lambda: None)
+        time.sleep(0.05)
+        start = time.monotonic()
+        obj.schedule('soon', 0.05, done.set)
+        self.assertTrue(done.wait(timeout=5.0))
+        self.assertLess(time.monotonic() - start, 2.0)
+        self.assertIn('late', obj)
+        self.assertGreater(obj.due_in('late'), 50)
+
+    def test_callback_error(self):
+        obj = self._start()
+        done = Event()
+
+        def fail():
+            raise RuntimeError('fail')
+
+        obj.schedule('a', 0.0, fail)
+        obj.schedule('b', 0.05, done.set)
+        self.assertTrue(done.wait(timeout=5.0))
+
+    def test_not_started(self):
+        obj = RetryScheduler()
+        obj.schedule('a', 0.0, lambda: None)
+        self.assertEqual(len(obj), 1)
+        obj.clear()
+        self.assertEqual(len(obj), 0)
+        self.assertIsNone(obj.due_in('a'))
+        obj.stop()
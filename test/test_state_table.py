@@ -0,0 +1,108 @@
+import unittest
+from state_table import state_machine, transition, reset_state
+from state_table import InvalidTransitionError
+import logging as log
+
+
+class DoorWorkflow:
+
+    states = (
+        ('closed',  'Door closed'),
+        ('open',    'Door open'),
+        ('locked',  'Door locked'),
+    )
+
+    transitions = (
+        ('open',    'closed',               'open'),
+        ('close',   'open',                 'closed'),
+        ('lock',    'closed',               'locked'),
+        ('reset',   ('open', 'locked'),     'closed'),
+    )
+
+    initial_state = 'closed'
+
+
+@state_machine(DoorWorkflow)
+class Door:
+
+    def __init__(self):
+        reset_state(self)
+        self.seen_state = None
+
+    @property
+    def state(self):
+        return self._state
+
+    @transition('open')
+    def open(self, fail=False):
+        self.seen_state = self._state
+        if fail:
+            raise RuntimeError('stuck')
+        return ['opened']
+
+    @transition('close')
+    def close(self):
+        return []
+
+    @transition('lock')
+    def lock(self):
+        return []
+
+    @transition('reset')
+    def reset(self):
+        return []
+
+
+class TestStateTable(unittest.TestCase):
+
+    def setUp(self):
+        log.info('\n\nTest TestStateTable.%s started', self._testMethodName)
+
+    def test_transitions(self):
+        obj = Door()
+        self.assertEqual(obj.state, 'closed')
+        self.assertEqual(obj.open(), ['opened'])
+        self.assertEqual(obj.state, 'open')
+        obj.reset()
+        obj.lock()
+        self.assertEqual(obj.state, 'locked')
+        obj.reset()
+        self.assertEqual(obj.state, 'closed')
+
+    def test_state_changes_after_implementation(self):
+        obj = Door()
+        obj.open()
+        self.assertEqual(obj.seen_state, 'closed')
+
+    def test_invalid_transition(self):
+        obj = Door()
+        with self.assertRaises(InvalidTransitionError):
+            obj.close()
+        self.assertEqual(obj.state, 'closed')
+        obj.lock()
+        with self.assertRaises(InvalidTransitionError):
+            obj.open()
+
+    def test_failed_implementation_keeps_state(self):
+        obj = Door()
+        with self.assertRaises(RuntimeError):
+            obj.open(fail=True)
+        self.assertEqual(obj.state, 'closed')
+
+    def test_unknown_transition(self):
+        with self.assertRaises(ValueError):
+
+            @state_machine(DoorWorkflow)
+            class Broken:
+
+                @transition('kick')
+                def kick(self):
+                    return []
+
+    def test_unknown_state(self):
+
+        class BrokenWorkflow(DoorWorkflow):
+            transitions = (('open', 'closed', 'ajar'),)
+
+        with self.assertRaises(ValueError):
+            state_machine(BrokenWorkflow)(type('Broken', (), {}))
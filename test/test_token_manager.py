@@ -0,0 +1,96 @@
+import unittest
+from token_manager import TokenManager
+from GAuthMock import GAuthMock
+from pydrive.auth import RefreshError
+from unittest.mock import MagicMock
+from threading import Thread, Event
+from datetime import datetime, timedelta
+import logging as log
+import time
+
+
+class TestTokenManager(unittest.TestCase):
+
+    def setUp(self):
+        log.info('\n\nTest TestTokenManager.%s started', self._testMethodName)
+
+    def _slow_refresh(self, auth, release, error=None):
+        
+        def refresh():
+            release.wait(timeout=5.0)
+            if error is not None:
+                raise error
+            auth.access_token_expired = False
+            
+        auth.Refresh.side_effect = refresh
+
+    def _call_parallel(self, obj, n):
+        errors = []
+        
+        def call():
+            try:
+                obj.ensure_fresh()
+            except Exception as e:
+                errors.append(e)
+                
+        threads = [Thread(target=call) for _ in range(n)]
+        for t in threads:
+            t.start()
+        return threads, errors
+
+    def test_not_expired(self):
+        auth = GAuthMock()
+        obj = TokenManager(auth)
+        obj.ensure_fresh()
+        auth.Refresh.assert_not_called()
+
+    def test_single_flight(self):
+        auth = GAuthMock()
+        auth.access_token_expired = True
+        release = Event()
+        self._slow_refresh(auth, release)
+        obj = TokenManager(auth)
+        threads, errors = self._call_parallel(obj, 20)
+        time.sleep(0.1)
+        release.set()
+        for t in threads:
+            t.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(auth.Refresh.call_count, 1)
+        self.assertEqual(obj.refresh_count, 1)
+
+    def test_error_shared(self):
+        auth = GAuthMock()
+        auth.access_token_expired = True
+        release = Event()
+        self._slow_refresh(auth, release, RefreshError('no token'))
+        obj = TokenManager(auth)
+        threads, errors = self._call_parallel(obj, 5)
+        time.sleep(0.1)
+        release.set()
+        for t in threads:
+            t.join()
+        self.assertEqual(auth.Refresh.call_count, 1)
+        self.assertEqual(len(errors), 5)
+        self.assertTrue(all([isinstance(e, RefreshError) for e in errors]))
+
+    def test_refresh_ahead(self):
+        auth = GAuthMock()
+        auth.credentials = MagicMock()
+        auth.credentials.token_expiry = datetime.utcnow() + \
+                                        timedelta(seconds=60)
+        refreshed = Event()
+        
+        def refresh():
+            auth.credentials.token_expiry = datetime.utcnow() + \
+                                            timedelta(hours=1)
+            refreshed.set()
+            
+        auth.Refresh.side_effect = refresh
+        obj = TokenManager(auth, refresh_margin=120, check_interval=0.05)
+        obj.start()
+        self.assertTrue(refreshed.wait(timeout=2.0))
+        time.sleep(0.2)
+        obj.stop()
+        self.assertEqual(auth.Refresh.call_count, 1)
+        self.assertTrue(obj.expires_in() > 3000)
@@ -0,0 +1,68 @@
+import unittest
+from upload_errors import classify_error, ErrorClass
+from pydrive.files import ApiRequestError, FileNotUploadedError
+from pydrive.auth import RefreshError
+from googleapiclient.errors import HttpError
+from ddt import ddt, data, unpack
+import httplib2
+import socket
+import json
+import logging as log
+
+
+def _http_error(status, reason=None):
+    content = b'{}'
+    if reason is not None:
+        content = json.dumps({'error': {
+                    'errors': [{'reason': reason}],
+                    'message': reason}}).encode('utf-8')
+    return HttpError(httplib2.Response({'status': status}), content)
+
+
+@ddt
+class TestUploadErrors(unittest.TestCase):
+
+    def setUp(self):
+        log.info('\n\nTest TestUploadErrors.%s started', self._testMethodName)
+
+    @data((500, None, ErrorClass.transient),
+          (503, None, ErrorClass.transient),
+          (408, None, ErrorClass.transient),
+          (429, None, ErrorClass.rate_limit),
+          (403, 'userRateLimitExceeded', ErrorClass.rate_limit),
+          (403, 'rateLimitExceeded', ErrorClass.rate_limit),
+          (403, 'insufficientFilePermissions', ErrorClass.permanent),
+          (401, None, ErrorClass.auth),
+          (400, None, ErrorClass.permanent),
+          (404, None, ErrorClass.permanent))
+    @unpack
+    def test_api_errors(self, status, reason, expected):
+        error = ApiRequestError(_http_error(status, reason))
+        self.assertEqual(classify_error(error), expected)
+        self.assertEqual(classify_error(_http_error(status, reason)), 
+                         expected)
+
+    def test_api_error_without_response(self):
+        self.assertEqual(classify_error(ApiRequestError('testing')), 
+                         ErrorClass.transient)
+
+    def test_network_errors(self):
+        for error in [socket.timeout(), ConnectionResetError(),
+                      httplib2.ServerNotFoundError('host')]:
+            self.assertEqual(classify_error(error), ErrorClass.transient)
+
+    def test_local_errors(self):
+        for error in [PermissionError(13, 'denied', 'file1'),
+                      OSError(5, 'I/O error', 'file1')]:
+            self.assertEqual(classify_error(error), ErrorClass.local_io)
+        self.assertEqual(classify_error(FileNotFoundError(2, 'missing', 
+                                                          'file1')),
+                         ErrorClass.vanished)
+
+    def test_other_errors(self):
+        self.assertEqual(classify_error(RefreshError('no token')), 
+                         ErrorClass.auth)
+        self.assertEqual(classify_error(FileNotUploadedError()), 
+                         ErrorClass.permanent)
+        self.assertEqual(classify_error(ValueError()), 
+                         ErrorClass.transient)
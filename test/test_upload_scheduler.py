@@ -0,0 +1,85 @@
+import unittest
+from upload_scheduler import JobsQueue, UploadSlots
+from threading import Thread
+import logging as log
+import time
+
+
+class TestJobsQueue(unittest.TestCase):
+
+    def setUp(self):
+        log.info('\n\nTest TestJobsQueue.%s started', self._testMethodName)
+
+    def test_fifo(self):
+        obj = JobsQueue()
+        obj.push('job1')
+        obj.push('job2', {'files': {}})
+        obj.push('job3')
+        self.assertEqual(len(obj), 3)
+        self.assertTrue('job2' in obj)
+        self.assertEqual(obj.pop(), ('job1', None))
+        self.assertEqual(obj.pop(), ('job2', {'files': {}}))
+        self.assertEqual(obj.pop(), ('job3', None))
+        self.assertFalse('job2' in obj)
+        self.assertEqual(len(obj), 0)
+
+    def test_priority(self):
+        retries_last = lambda name, state: 0 if state is None else 1
+        obj = JobsQueue(retries_last)
+        obj.push('job1', {'files': {}})
+        obj.push('job2')
+        obj.push('job3')
+        self.assertEqual(obj.pop(), ('job2', None))
+        self.assertEqual(obj.pop(), ('job3', None))
+        self.assertEqual(obj.pop(), ('job1', {'files': {}}))
+
+
+class TestUploadSlots(unittest.TestCase):
+
+    def setUp(self):
+        log.info('\n\nTest TestUploadSlots.%s started', self._testMethodName)
+
+    def test_limit(self):
+        obj = UploadSlots(2)
+        self.assertTrue(obj.acquire('job1'))
+        self.assertTrue(obj.acquire('job2'))
+        acquired = []
+        thread = Thread(target=lambda: acquired.append(obj.acquire('job1')))
+        thread.start()
+        thread.join(timeout=0.2)
+        self.assertEqual(acquired, [])
+        obj.release('job2')
+        thread.join(timeout=5)
+        self.assertEqual(acquired, [True])
+
+    def test_round_robin(self):
+        obj = UploadSlots(1)
+        self.assertTrue(obj.acquire('job1'))
+        order = []
+
+        def worker(job_name):
+            obj.acquire(job_name)
+            order.append(job_name)
+
+        threads = [Thread(target=worker, args=(name,)) 
+                   for name in ['job1', 'job1', 'job1', 'job2']]
+        for thread in threads:
+            thread.start()
+            time.sleep(0.05)
+        for _ in range(4):
+            obj.release('job1')
+            time.sleep(0.05)
+        for thread in threads:
+            thread.join(timeout=5)
+        self.assertEqual(order[:2], ['job1', 'job2'])
+
+    def test_close(self):
+        obj = UploadSlots(1)
+        self.assertTrue(obj.acquire('job1'))
+        acquired = []
+        thread = Thread(target=lambda: acquired.append(obj.acquire('job2')))
+        thread.start()
+        obj.close()
+        thread.join(timeout=5)
+        self.assertEqual(acquired, [False])
+        self.assertFalse(obj.acquire('job3'))
@@ -0,0 +1,86 @@
+import unittest
+from uploads_supervisor import UploadsSupervisor, Events
+from retry_scheduler import BackoffPolicy, RetryClass
+from unittest.mock import Mock
+import logging as log
+
+
+class TestUploadsSupervisor(unittest.TestCase):
+
+    def setUp(self):
+        log.info('\n\nTest TestUploadsSupervisor.%s started', 
+                 self._testMethodName)
+        
+    def _create_supervisor(self, jobs):
+        obj = UploadsSupervisor(Mock(), '.', '')
+        for job_name in jobs:
+            obj._jobs[job_name] = Mock()
+            obj._jobs_counters[job_name] = [0, 0, 0, 0]
+        return obj
+        
+    def test_progress_empty(self):
+        obj = self._create_supervisor([])
+        self.assertEqual(obj._rep_progress_impl(), (0.0, 0.0))
+        
+    def test_progress_totals(self):
+        obj = self._create_supervisor(['job1', 'job2'])
+        obj._job_progress_impl(Events.job_progress, ('job1', (0, 0, 4, 100)))
+        obj._job_progress_impl(Events.job_progress, ('job2', (0, 0, 4, 300)))
+        self.assertEqual(obj._rep_progress_impl(), (0.0, 0.0))
+        obj._job_progress_impl(Events.job_progress, ('job1', (2, 50, 0, 0)))
+        obj._job_progress_impl(Events.job_progress, ('job2', (2, 150, 0, 0)))
+        self.assertEqual(obj._rep_progress_impl(), (0.5, 0.5))
+        obj._job_progress_impl(Events.job_progress, ('job1', (2, 50, 0, 0)))
+        self.assertEqual(obj._rep_progress_impl(), (0.75, 0.625))
+        
+    def test_progress_released_job(self):
+        obj = self._create_supervisor(['job1', 'job2'])
+        obj._job_progress_impl(Events.job_progress, ('job1', (4, 100, 4, 100)))
+        obj._job_progress_impl(Events.job_progress, ('job2', (1, 100, 4, 400)))
+        obj._release_job_impl(Events.release_job, ('job1', None))
+        self.assertEqual(obj._rep_progress_impl(), (0.25, 0.25))
+        obj._job_progress_impl(Events.job_progress, ('job1', (1, 1, 1, 1)))
+        self.assertEqual(obj._rep_progress_impl(), (0.25, 0.25))
+        
+    def test_background_cleanup_needs_journal(self):
+        obj = UploadsSupervisor(Mock(), '.', '', background_cleanup=True)
+        self.assertIsNone(obj._reclaimer)
+        obj = UploadsSupervisor(Mock(), '.', '', background_cleanup=True,
+                                journal_path='journal')
+        self.assertIsNotNone(obj._reclaimer)
+        
+    def _create_retry_supervisor(self):
+        policies = {RetryClass.retry: BackoffPolicy(10, 2.0, 1000, jitter=0.0),
+                    RetryClass.terminated: BackoffPolicy(60, 2.0, 1000, jitter=0.0)}
+        obj = UploadsSupervisor(Mock(), '.', '', retry_policies=policies)
+        self.addCleanup(obj._retry_scheduler.clear)
+        return obj
+        
+    def test_retry_backoff(self):
+        obj = self._create_retry_supervisor()
+        delays = []
+        for _ in range(3):
+            obj._schedule_retry_job_impl(Events.schedule_retry_job, 
+                                         ('job1', (30, 'state')))
+            obj._release_job_impl(Events.release_job, ('job1', None))
+            delays.append(round(obj._retry_scheduler.due_in('job1')))
+            obj._scheduled_jobs.pop('job1')
+        self.assertEqual(delays, [30, 60, 120])
+        self.assertEqual(obj._retry_attempts['job1'], 3)
+        
+    def test_retry_reset_on_release(self):
+        obj = self._create_retry_supervisor()
+        obj._schedule_retry_job_impl(Events.schedule_retry_job, 
+                                     ('job1', (30, 'state')))
+        obj._release_job_impl(Events.release_job, ('job1', None))
+        obj._scheduled_jobs.pop('job1')
+        obj._release_job_impl(Events.release_job, ('job1', None))
+        self.assertNotIn('job1', obj._retry_attempts)
+        
+    def test_retry_terminated(self):
+        obj = self._create_retry_supervisor()
+        obj._jobs['job1'] = Mock()
+        obj._job_terminated_impl(Events.job_terminated, ('job1', None))
+        self.assertEqual(round(obj._retry_scheduler.due_in('job1')), 60)
+        self.assertIsNone(obj._scheduled_jobs['job1'])
+        self.assertNotIn('job1', obj._jobs)